@@ -0,0 +1,388 @@
+import time
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from league import build_inputs, gameweek, project
+from team import build
+
+# event/{gw}/live stats added to the merged data's counts, as columns
+# of the merged data; an appearance is any minutes played
+LIVE_FIELDS = {'goals_scored': 'Goals',
+               'assists': 'Assists',
+               'goals_conceded': 'Goals Conceded',
+               'clean_sheets': 'Clean Sheets',
+               'yellow_cards': 'Yellow Cards',
+               'red_cards': 'Red Cards',
+               'own_goals': 'Own Goals'}
+
+STAGES = ['load', 'as_of', 'build', 'project', 'score']
+
+
+def _live(store, stat, gameweeks):
+    """one live stat, as FPL id x gameweeks (NaN where no entry)"""
+    if stat not in store.stats:
+        return np.full(store.values.shape[:2], np.nan)[:, gameweeks]
+    return store.values[:, gameweeks, store.stats.index(stat)]
+
+
+def as_of(data_dct, live, ids, gw):
+    """
+    The merged data as it stood before gameweek gw: the counts in
+    data_dct (as at the start of the season) plus each player's live
+    stats for every earlier gameweek.
+
+    live: GameweekStore of the season's event/{gw}/live data
+    ids: dict of player code: FPL id
+    """
+    earlier = list(range(1, gw))
+    rows = np.array([ids.get(row['code'], 0) for row in data_dct.values()])
+    rows = np.where(rows < live.values.shape[0], rows, 0)
+    known = rows > 0
+    added = {column: np.where(known, np.nansum(
+                 _live(live, stat, earlier)[rows], axis=1), 0)
+             for stat, column in LIVE_FIELDS.items()}
+    added['Appearances'] = np.where(known, (np.nan_to_num(
+        _live(live, 'minutes', earlier)[rows]) > 0).sum(axis=1), 0)
+
+    data = {}
+    for n, (key, row) in enumerate(data_dct.items()):
+        row = dict(row)
+        for column, values in added.items():
+            row[column] = row[column] + int(values[n])
+        data[key] = row
+    return data
+
+
+def deadline(fixtures, gw):
+    """the first kickoff of gameweek gw, as a Timestamp (None if unknown)"""
+    kickoffs = pd.to_datetime(
+        fixtures.loc[fixtures['event'] == gw, 'kickoff_time'], utc=True)
+    return None if kickoffs.isna().all() else kickoffs.min()
+
+
+def news_at(snapshots, at):
+    """
+    players' status and chance of playing in the last bootstrap-static
+    snapshot before time at, as code: (status, news, chance), or None
+    if no snapshot is that old
+    """
+    try:
+        elements = snapshots.table('bootstrap-static', 'elements', at)
+    except LookupError:
+        return None
+    news = {}
+    for row in elements.to_dict('records'):
+        chance = row.get('chance_of_playing_next_round')
+        news[row['code']] = (row.get('status') or 'a', row.get('news') or '',
+                             100 if pd.isna(chance) else chance)
+    return news
+
+
+def with_news(data_dct, news):
+    """
+    data_dct with each player's status and chance of playing as news
+    gives them, and available for players it doesn't list
+    """
+    data = {}
+    for key, row in data_dct.items():
+        status, text, chance = news.get(row['code'], ('a', '', 100))
+        row = dict(row, status=status, chance_of_playing_next_round=chance)
+        if 'news' in row:
+            row['news'] = text
+        data[key] = row
+    return data
+
+
+def _project_gameweek(task):
+    """
+    builds the model from one gameweek's data and projects that
+    gameweek; module level so worker processes can load it
+    """
+    gw, data_dct, overview, fixtures, factors, day = task
+    start = time.perf_counter()
+    fixtures = fixtures.assign(finished=fixtures['event'] < gw)
+    _, teams = build(data_dct, overview, fixtures)
+    today = np.datetime64(datetime.today().date(), 'D')
+    inputs = gameweek(build_inputs(teams, fixtures, *factors), gw)
+    if day is None:
+        # no news at the time, so everyone is taken as available
+        return_date = np.full_like(inputs.return_date, np.datetime64('NaT'))
+    else:
+        # Player.check_news dates news from today: date it from the
+        # gameweek's first matchday instead
+        ahead = inputs.return_date.astype('datetime64[D]') - today
+        return_date = (np.datetime64(day, 'D') + ahead).astype(
+            inputs.return_date.dtype)
+    inputs = inputs._replace(return_date=return_date)
+    built = time.perf_counter()
+
+    results = project(inputs)
+    playing = results['playing']
+    appearance = np.where(playing, results['probAppearance'], 0)
+    projected = pd.DataFrame({
+        'projected': np.where(playing, results['finalPoints'], 0).sum(axis=1),
+        # chance of at least one appearance, in a double gameweek
+        'appearance': 1 - np.prod(1 - appearance, axis=1)},
+        index=pd.Index(inputs.player_ids, name='code'))
+    done = time.perf_counter()
+    return gw, projected, {'build': built - start, 'project': done - built}
+
+
+class Backtest:
+    """
+    Replays past gameweeks: for each, the model is rebuilt from the
+    data as it stood before that gameweek (see as_of), projects the
+    gameweek's fixtures, and is scored against the points then scored
+    according to the event/{gw}/live data.
+
+    Players' status and chance of playing are taken from the last
+    bootstrap-static snapshot before each gameweek's first kickoff,
+    when snapshots holds one; otherwise everyone is taken as available.
+
+    Gameweeks are independent, so each is built and projected on a
+    process pool (processes None or 1 runs them in this process).
+
+    data_dct: merged stats rows as at the start of the season (as
+              allData.to_dict), each with the player's FPL code. These
+              must not yet count any gameweek replayed: the merged
+              data of the current season already does, and as_of
+              would count those gameweeks twice. Nothing here keeps
+              the start-of-season data, so it has to be saved (e.g.
+              allData before gameweek 1) by whoever runs the backtest.
+    overview, fixtures: as Player and Squad are built from
+    live: GameweekStore holding the gameweeks replayed
+    ids: dict of player code: FPL id
+    snapshots: SnapshotStore of bootstrap-static, or None
+
+    scores: one row per player with a live entry per gameweek:
+            gameweek, code, projected, appearance (its probability),
+            actual (total_points), appeared (played any minutes)
+    times: seconds spent in each stage (build and project summed over
+           workers), and 'wall' for the whole run
+    """
+
+    def __init__(self, data_dct, overview, fixtures, live, ids, gameweeks,
+                 processes=None, homeAdvantage=0.05, awayDisadvantage=0.05,
+                 snapshots=None):
+        start = time.perf_counter()
+        self.gameweeks = list(gameweeks)
+        self.times = dict.fromkeys(STAGES, 0.0)
+
+        stage = time.perf_counter()
+        actual = self._actual(live, ids)
+        self.times['load'] = time.perf_counter() - stage
+
+        stage = time.perf_counter()
+        factors = (homeAdvantage, awayDisadvantage)
+        tasks = []
+        self.news = {}  # gameweek: whether news at the time was used
+        for gw in self.gameweeks:
+            data, day = as_of(data_dct, live, ids, gw), None
+            kickoff = deadline(fixtures, gw)
+            news = None if snapshots is None or kickoff is None else \
+                news_at(snapshots, kickoff)
+            if news is not None:
+                data, day = with_news(data, news), kickoff.date()
+            self.news[gw] = news is not None
+            tasks.append((gw, data, overview, fixtures, factors, day))
+        self.times['as_of'] = time.perf_counter() - stage
+
+        if processes and processes > 1:
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                done = list(executor.map(_project_gameweek, tasks))
+        else:
+            done = [_project_gameweek(task) for task in tasks]
+
+        stage = time.perf_counter()
+        parts = []
+        for gw, projected, times in done:
+            for name, seconds in times.items():
+                self.times[name] += seconds
+            scored = projected.join(actual[gw], how='inner')
+            parts.append(scored.reset_index().assign(gameweek=gw))
+        self.scores = pd.concat(parts, ignore_index=True)[
+            ['gameweek', 'code', 'projected', 'appearance', 'actual',
+             'appeared']]
+        self.times['score'] = time.perf_counter() - stage
+        self.times['wall'] = time.perf_counter() - start
+
+    def _actual(self, live, ids):
+        """points and appearances per gameweek, indexed by code"""
+        codes = pd.Series(list(ids), index=list(ids.values()))
+        actual = {}
+        for gw in self.gameweeks:
+            points = _live(live, 'total_points', [gw])[:, 0]
+            minutes = _live(live, 'minutes', [gw])[:, 0]
+            entered = np.flatnonzero(~np.isnan(points))
+            entered = entered[np.isin(entered, codes.index)]
+            actual[gw] = pd.DataFrame(
+                {'actual': points[entered],
+                 'appeared': np.nan_to_num(minutes[entered]) > 0},
+                index=pd.Index(codes[entered].to_numpy(), name='code'))
+        return actual
+
+    @staticmethod
+    def _errors(scores):
+        error = scores['projected'] - scores['actual']
+        appearance = scores['appearance'] - scores['appeared']
+        return pd.Series({
+            'players': len(scores),
+            'mae': error.abs().mean(),
+            'rmse': np.sqrt((error ** 2).mean()),
+            'bias': error.mean(),
+            'corr': scores['projected'].corr(scores['actual']),
+            'rank_corr': scores['projected'].rank().corr(
+                scores['actual'].rank()),
+            'brier': (appearance ** 2).mean()})
+
+    def metrics(self):
+        """
+        error metrics of projected against actual points, per gameweek
+        and over all of them: mean absolute and root mean squared
+        error, bias (mean over-projection), correlation and rank
+        correlation, and the Brier score of the appearance probability
+        """
+        per_week = self.scores.groupby('gameweek').apply(self._errors)
+        per_week.loc['all'] = self._errors(self.scores)
+        return per_week.astype({'players': int})
+
+    def calibration(self, field='points', bins=10):
+        """
+        projected against actual, in bins of the projection:
+        'points' in bins of equal size, 'appearance' in bins of equal
+        width of its probability against the share who appeared
+        """
+        if field == 'points':
+            predicted, observed = 'projected', 'actual'
+            groups = pd.qcut(self.scores['projected'], bins, duplicates='drop')
+        elif field == 'appearance':
+            predicted, observed = 'appearance', 'appeared'
+            groups = pd.cut(self.scores['appearance'],
+                            np.linspace(0, 1, bins + 1), include_lowest=True)
+        else:
+            raise ValueError('unknown calibration: {}'.format(field))
+        grouped = self.scores.groupby(groups, observed=True)
+        return pd.DataFrame({'players': grouped.size(),
+                             'predicted': grouped[predicted].mean(),
+                             'observed': grouped[observed].mean()})
+
+    def report(self):
+        """the metrics, calibration and stage times, as text"""
+        times = ', '.join('{} {:.2f}s'.format(name, self.times[name])
+                          for name in STAGES + ['wall'])
+        return '\n\n'.join([self.metrics().round(3).to_string(),
+                            self.calibration().round(2).to_string(),
+                            self.calibration('appearance').round(2)
+                            .to_string(),
+                            'time: ' + times])
+
+
+if __name__ == '__main__':
+    import os
+    import json
+    import tempfile
+    import synthetic
+    from gameweek_store import GameweekStore
+    from snapshot_store import SnapshotStore
+    from league import LeagueProjection
+
+    print('Testing in progress...')
+    played = 8
+    data_dct, overview, fixtures = synthetic.league(finished=0)
+    players, teams = synthetic.build(data_dct, overview, fixtures)
+    season = LeagueProjection(teams, fixtures)
+    ids = {row['code']: key for key, row in data_dct.items()}
+
+    # a season played to the model's start-of-season projections
+    rng = np.random.default_rng(0)
+    playing = season.results['playing']
+    documents = {}
+    for gw in range(1, played + 1):
+        week = playing & (season.inputs.event == gw)[None, :]
+        appear = np.where(week, season.results['probAppearance'], 0).sum(1)
+        points = np.where(week, season.results['finalPoints'], 0).sum(1)
+        appeared = rng.random(len(appear)) < appear
+        scored = rng.poisson(np.where(appeared, np.maximum(
+            points, 0) / np.maximum(appear, 1e-9), 0))
+        goals = rng.poisson(np.where(appeared, 0.1, 0))
+        documents[gw] = {'elements': {
+            str(ids[code]): {'stats': {
+                'minutes': int(appeared[n]) * 90,
+                'goals_scored': int(goals[n]), 'assists': 0,
+                'goals_conceded': int(appeared[n]), 'clean_sheets': 0,
+                'yellow_cards': 0, 'red_cards': 0, 'own_goals': 0,
+                'total_points': int(scored[n])}}
+            for n, code in enumerate(season.inputs.player_ids)}}
+
+    with tempfile.TemporaryDirectory() as directory:
+        def loc_for(gw):
+            return os.path.join(directory, 'gameweek_{:02d}'.format(gw))
+
+        def read(gw):
+            with open(loc_for(gw), encoding='utf-8') as f:
+                return json.load(f)
+
+        for gw, document in documents.items():
+            with open(loc_for(gw), 'w', encoding='utf-8') as f:
+                json.dump(document, f)
+        live = GameweekStore(os.path.join(directory, 'gameweeks.npz'))
+        live.update(range(1, played + 1), loc_for, read)
+
+    # earlier gameweeks' live stats are added, later ones aren't
+    before = as_of(data_dct, live, ids, 4)
+    goals = sum(documents[gw]['elements']['1']['stats']['goals_scored']
+                for gw in range(1, 4))
+    assert before[1]['Goals'] == data_dct[1]['Goals'] + goals
+    assert as_of(data_dct, live, ids, 1) == data_dct
+
+    gameweeks = range(2, played + 1)
+    serial = Backtest(data_dct, overview, fixtures, live, ids, gameweeks)
+    processes = max(2, os.cpu_count() or 1)
+    pooled = Backtest(data_dct, overview, fixtures, live, ids, gameweeks,
+                      processes=processes)
+    pd.testing.assert_frame_equal(serial.scores, pooled.scores)
+    assert len(serial.scores) == len(data_dct) * len(gameweeks)
+    metrics = serial.metrics()
+    assert metrics.loc['all', 'corr'] > 0.3, metrics
+    assert abs(metrics.loc['all', 'bias']) < 0.5, metrics
+
+    # news from the snapshot before a gameweek's deadline: a player
+    # ruled out then is projected to miss it, and no one else is
+    # held back by the start-of-season statuses
+    out = data_dct[1]['code']
+    elements = [{'id': ids[row['code']], 'code': row['code'],
+                 'status': 'a', 'news': '',
+                 'chance_of_playing_next_round': None}
+                for row in data_dct.values()]
+    elements[0].update(status='i', news='Knee injury',
+                       chance_of_playing_next_round=0)
+    first = deadline(fixtures, 2)
+    with tempfile.TemporaryDirectory() as directory:
+        snapshots = SnapshotStore(directory)
+        snapshots.add('bootstrap-static', {'elements': elements},
+                      first - pd.Timedelta(days=1))
+        assert news_at(snapshots, first - pd.Timedelta(days=2)) is None
+        elements[0].update(status='a', news='',
+                           chance_of_playing_next_round=None)
+        snapshots.add('bootstrap-static', {'elements': elements},
+                      deadline(fixtures, 8) - pd.Timedelta(days=1))
+        informed = Backtest(data_dct, overview, fixtures, live, ids,
+                            [2, 3, 8], snapshots=snapshots)
+    assert all(informed.news.values())
+    scores = informed.scores.set_index(['gameweek', 'code'])
+    uninformed = serial.scores.set_index(['gameweek', 'code'])
+    # ruled out until the snapshot before gameweek 8 clears the player
+    assert scores.loc[(2, out), 'appearance'] == 0
+    assert scores.loc[(3, out), 'appearance'] == 0
+    assert scores.loc[(8, out), 'appearance'] == \
+        uninformed.loc[(8, out), 'appearance'] > 0
+    others = scores.index.get_level_values('code') != out
+    assert np.allclose(scores.loc[others, 'appearance'],
+                       uninformed.loc[scores.index[others], 'appearance'])
+
+    print(pooled.report())
+    print('{} gameweeks: serial {:.2f}s, {} processes {:.2f}s'.format(
+        len(gameweeks), serial.times['wall'], processes,
+        pooled.times['wall']))
+    print('Testing Complete')
@@ -0,0 +1,67 @@
+import numpy as np
+
+BONUS = 3  # players given bonus points in each fixture: 3, 2 and 1
+
+
+def rank_top(scores, k=BONUS):
+    """
+    Ranks the top k of each row of scores (fixtures x players, -inf
+    for a player not in the fixture) with one partial sort per batch.
+
+    Ties follow the official bonus rules: a player's rank is one more
+    than the number scoring strictly more, so tied players share a
+    rank and the next rank is skipped (3, 3, 1 bonus for a tie at the
+    top; 3, 2, 2 for a tie for second). Players outside the top k are
+    all given rank k + 1, and players not in the fixture rank 0.
+    """
+    scores = np.asarray(scores, dtype=float)
+    n = scores.shape[-1]
+    k = min(k, n)
+    # the k highest of each row, in no particular order
+    top = np.partition(scores, n - k, axis=-1)[..., n - k:]
+    # one more than those strictly above among the top k is k + 1 less
+    # the top k a score reaches, for the top k and k + 1 for the rest
+    reached = sum((scores >= top[..., [j]]).view(np.int8) for j in range(k))
+    return np.where(scores == -np.inf, 0, k + 1 - reached)
+
+
+def points(ranks, k=BONUS):
+    """bonus points for ranks from rank_top (0 for none)"""
+    return np.where((ranks >= 1) & (ranks <= k), k + 1 - ranks, 0)
+
+
+if __name__ == '__main__':
+    import time
+
+    print('Testing in progress...')
+    assert rank_top([[9, 9, 5, 1]]).tolist() == [[1, 1, 3, 4]]
+    assert rank_top([[9, 5, 5, 1]]).tolist() == [[1, 2, 2, 4]]
+    assert rank_top([[9, 5, 1, 1]]).tolist() == [[1, 2, 3, 3]]
+    assert rank_top([[4, 4, 4, 4]]).tolist() == [[1, 1, 1, 1]]
+    assert rank_top([[2, -np.inf, 7]]).tolist() == [[2, 0, 1]]
+    assert points(rank_top([[2, -np.inf, 7]])).tolist() == [[2, 0, 3]]
+    assert points(rank_top([[9, 9, 5, 1]])).tolist() == [[3, 3, 1, 0]]
+    assert points(rank_top([[9, 5, 5, 1]])).tolist() == [[3, 2, 2, 0]]
+
+    # against ranking by a full sort, fixture by fixture
+    rng = np.random.default_rng(0)
+    scores = rng.integers(0, 30, (2000, 60)).astype(float)
+    scores[rng.random(scores.shape) < 0.3] = -np.inf
+    start = time.perf_counter()
+    ranks = rank_top(scores)
+    batched_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for row, ranked in zip(scores, ranks):
+        ordered = sorted(row, reverse=True)
+        for score, rank in zip(row, ranked):
+            expected = ordered.index(score) + 1
+            if score == -np.inf:
+                expected = 0
+            elif expected > BONUS:
+                expected = BONUS + 1
+            assert rank == expected
+    looped_time = time.perf_counter() - start
+    print('{} fixtures: batched {:.3f}s, sorted one at a time {:.2f}s'.format(
+        len(scores), batched_time, looped_time))
+    print('Testing Complete')
@@ -0,0 +1,303 @@
+import numpy as np
+import pandas as pd
+
+# player fields followed between refreshes, and how each is compared:
+# numbers as floats (NaN where missing, selected_by_percent comes as
+# text), text as strings ('' where missing)
+FIELDS = {'now_cost': 'number',
+          'status': 'text',
+          'news': 'text',
+          'chance_of_playing_next_round': 'number',
+          'selected_by_percent': 'number'}
+
+
+def _typed(df, field, kind):
+    """one column of df as a plain array of its kind, missing if absent"""
+    if field not in df.columns:
+        return np.full(len(df), np.nan if kind == 'number' else '',
+                       dtype=float if kind == 'number' else str)
+    series = df[field]
+    if kind == 'number':
+        return pd.to_numeric(series, errors='coerce') \
+            .to_numpy(dtype=float, na_value=np.nan)
+    values = series.to_numpy(dtype=object)
+    return np.where(pd.isna(series).to_numpy(), '', values).astype(str)
+
+
+def _keys(df, key):
+    return (df.index if key is None else df[key]).to_numpy(dtype=np.int64)
+
+
+class ChangeLog:
+    """
+    What changed in the players table between two refreshes.
+
+    For each field, the keys (player ids, or the key column given to
+    diff) of the rows that changed, with their old and new values as
+    typed arrays, in key order; plus the keys of players added and
+    removed. Only changes are held, so a log of a refresh is a few
+    hundred values at most.
+
+    changes: dict of field: (keys, old, new)
+    added, removed: arrays of keys
+    """
+
+    def __init__(self, changes, added, removed):
+        self.changes = changes
+        self.added = added
+        self.removed = removed
+
+    def __len__(self):
+        return sum(len(keys) for keys, _, _ in self.changes.values())
+
+    def __bool__(self):
+        return bool(len(self) or len(self.added) or len(self.removed))
+
+    def __repr__(self):
+        counts = ', '.join('{} {}'.format(field, len(keys))
+                           for field, (keys, _, _) in self.changes.items()
+                           if len(keys))
+        return '<ChangeLog {} changes ({}), {} added, {} removed>'.format(
+            len(self), counts or 'none', len(self.added), len(self.removed))
+
+    def keys(self, fields=None):
+        """keys of the rows changed in any of fields (default: all)"""
+        fields = self.changes if fields is None else fields
+        parts = [self.changes[field][0] for field in fields
+                 if field in self.changes]
+        return np.unique(np.concatenate(parts)) if parts else \
+            np.array([], dtype=np.int64)
+
+    def rows(self, fields=None):
+        """
+        the new values of the rows changed in any of fields, as a
+        dataframe indexed by key, NaN where a row's field didn't change
+        (as Reprojection.update takes them)
+        """
+        fields = list(self.changes if fields is None else fields)
+        keys = self.keys(fields)
+        rows = pd.DataFrame(index=pd.Index(keys, name='key'))
+        for field in fields:
+            if field not in self.changes:
+                continue
+            changed, _, new = self.changes[field]
+            column = np.full(len(keys), np.nan, dtype=object)
+            column[np.searchsorted(keys, changed)] = new
+            rows[field] = column
+        return rows
+
+    def frame(self):
+        """every change, one per row: key, field, old, new"""
+        parts = [pd.DataFrame({'key': keys, 'field': field,
+                               'old': old.astype(object),
+                               'new': new.astype(object)})
+                 for field, (keys, old, new) in self.changes.items()]
+        if not parts:
+            return pd.DataFrame(columns=['key', 'field', 'old', 'new'])
+        return pd.concat(parts, ignore_index=True)
+
+    def save(self, loc):
+        arrays = {'added': self.added, 'removed': self.removed,
+                  'fields': np.array(list(self.changes), dtype=str)}
+        for field, (keys, old, new) in self.changes.items():
+            arrays.update({field + '.keys': keys, field + '.old': old,
+                           field + '.new': new})
+        with open(loc, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+
+    @classmethod
+    def load(cls, loc):
+        with np.load(loc, allow_pickle=False) as data:
+            changes = {field: (data[field + '.keys'], data[field + '.old'],
+                               data[field + '.new'])
+                       for field in data['fields'].tolist()}
+            return cls(changes, data['added'], data['removed'])
+
+
+def diff(old, new, fields=FIELDS, key=None):
+    """
+    Compares two players tables (as FantasyData gives them, indexed by
+    id), a whole column at a time over the players in both.
+
+    fields: dict of field: 'number' or 'text' (see FIELDS)
+    key: column identifying players (default: the index), e.g. 'code'
+    Returns a ChangeLog.
+    """
+    old_keys, new_keys = _keys(old, key), _keys(new, key)
+    common, at_old, at_new = np.intersect1d(old_keys, new_keys,
+                                            assume_unique=True,
+                                            return_indices=True)
+    changes = {}
+    for field, kind in fields.items():
+        before = _typed(old, field, kind)[at_old]
+        after = _typed(new, field, kind)[at_new]
+        if kind == 'number':
+            changed = (before != after) & ~(np.isnan(before) &
+                                            np.isnan(after))
+        else:
+            changed = before != after
+        changes[field] = (common[changed], before[changed], after[changed])
+    return ChangeLog(changes, np.setdiff1d(new_keys, old_keys),
+                     np.setdiff1d(old_keys, new_keys))
+
+
+def between(snapshots, since=None, until=None, source='bootstrap-static',
+            name='elements', fields=FIELDS, key=None):
+    """
+    The changes to a snapshotted table from time since to time until
+    (default: from the version before the last to the last).
+    snapshots: a SnapshotStore
+    """
+    if since is None:
+        times = snapshots.chain(source).times
+        if len(times) < 2:
+            raise LookupError('fewer than two snapshots of ' + source)
+        since = times[-2]
+    return diff(snapshots.table(source, name, since),
+                snapshots.table(source, name, until), fields, key)
+
+
+if __name__ == '__main__':
+    import os
+    import time
+    import tempfile
+    import synthetic
+    from reproject import Reprojection
+
+    def naive(old, new):
+        """a row at a time, as the merges in the notebook did"""
+        found = {}
+        for player in old.index.intersection(new.index):
+            for field, kind in FIELDS.items():
+                a, b = old.at[player, field], new.at[player, field]
+                if kind == 'number':
+                    a, b = float(a), float(b)
+                    if a == b or (np.isnan(a) and np.isnan(b)):
+                        continue
+                elif (a or '') == (b or ''):
+                    continue
+                found.setdefault(field, []).append(player)
+        return found
+
+    def elements(n, rng):
+        statuses = np.array(['a', 'd', 'i', 's', 'u', 'n'])
+        status = statuses[rng.integers(0, 6, n) * (rng.random(n) < 0.2)]
+        chance = np.where(status == 'a', np.nan,
+                          rng.integers(0, 4, n) * 25.0)
+        return pd.DataFrame({
+            'code': 100000 + np.arange(1, n + 1),
+            'now_cost': rng.integers(40, 131, n),
+            'status': status,
+            'news': np.where(status == 'a', '', 'Knock'),
+            'chance_of_playing_next_round': chance,
+            'selected_by_percent': (rng.random(n) * 40).round(1).astype(str),
+            'form': rng.random(n).round(1)},
+            index=pd.Index(np.arange(1, n + 1), name='id'))
+
+    def refresh(df, rng, k=30):
+        """a refresh's worth of news and price moves"""
+        df = df.copy()
+        moved = rng.choice(df.index, k, replace=False)
+        df.loc[moved[:k // 3], 'now_cost'] += 1
+        df.loc[moved[k // 3:], 'status'] = 'd'
+        df.loc[moved[k // 3:], 'news'] = 'Hamstring'
+        df.loc[moved[k // 3:], 'chance_of_playing_next_round'] = 50.0
+        df['selected_by_percent'] = (
+            df['selected_by_percent'].astype(float) +
+            (rng.random(len(df)) < 0.3) * 0.1).round(1).astype(str)
+        return df
+
+    print('Testing in progress...')
+    rng = np.random.default_rng(0)
+    old = elements(600, rng)
+    new = refresh(old, rng)
+    new = pd.concat([new.drop(index=[5, 6]),
+                     elements(602, rng).loc[[601, 602]]])
+
+    start = time.perf_counter()
+    log = diff(old, new)
+    diff_time = time.perf_counter() - start
+    start = time.perf_counter()
+    expected = naive(old, new)
+    naive_time = time.perf_counter() - start
+    for field in FIELDS:
+        assert log.changes[field][0].tolist() == expected.get(field, [])
+    assert log.added.tolist() == [601, 602] and log.removed.tolist() == [5, 6]
+    assert log.changes['now_cost'][1].dtype == float
+    assert log.changes['status'][2].dtype.kind == 'U'
+    assert not diff(old, old)
+
+    # keyed by code, and read back as saved
+    by_code = diff(old, new, key='code')
+    assert by_code.keys().tolist() == (log.keys() + 100000).tolist()
+    with tempfile.TemporaryDirectory() as directory:
+        loc = os.path.join(directory, 'changes.npz')
+        log.save(loc)
+        loaded = ChangeLog.load(loc)
+        size = os.path.getsize(loc)
+    pd.testing.assert_frame_equal(loaded.frame(), log.frame())
+    print(log)
+    print('diff of {} players: {:.1f}ms (row by row {:.0f}ms), '
+          'log saved in {} bytes'.format(len(new), diff_time * 1000,
+                                         naive_time * 1000, size))
+
+    # a refresh end to end: two snapshots of bootstrap-static, the
+    # change log FantasyData gives for them, and the model re-projected
+    # from that log alone
+    data_dct, overview, fixtures = synthetic.league()
+    today = pd.Timestamp.today().normalize()
+    fixtures['kickoff_time'] = [
+        (today + pd.Timedelta(weeks=event - 3)).strftime('%Y-%m-%dT15:00:00Z')
+        for event in fixtures['event']]
+    players, teams = synthetic.build(data_dct, overview, fixtures)
+    league = Reprojection(players, teams, fixtures)
+    # FPL ids aren't the merged data's ids: players are matched by code
+    fpl_ids = dict(zip(data_dct, rng.permutation(len(data_dct)) + 1))
+
+    def bootstrap_static():
+        return {'elements': [
+            {'id': int(fpl_ids[key]), 'code': row['code'],
+             'web_name': row['web_name'], 'now_cost': row['now_cost'],
+             'status': row['status'],
+             'news': '' if row['status'] == 'a' else 'Knock',
+             'chance_of_playing_next_round': None if row['status'] == 'a'
+             else row['chance_of_playing_next_round'],
+             'selected_by_percent': '1.5'}
+            for key, row in data_dct.items()]}
+
+    injured = rng.choice(list(data_dct), 8, replace=False)
+    here = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            import fantasy
+            import fantasy_2
+            FPL = fantasy_2.FantasyData()
+            FPL.snapshots.add('bootstrap-static', bootstrap_static(),
+                              today - pd.Timedelta(hours=6))
+            for key in injured:
+                data_dct[key].update(status='i',
+                                     chance_of_playing_next_round=0)
+            for key in injured[:3]:
+                data_dct[key]['now_cost'] += 1
+            FPL.snapshots.add('bootstrap-static', bootstrap_static(), today)
+            log = FPL.player_changes()
+            pd.testing.assert_frame_equal(
+                fantasy.FantasyData(lazy=True).player_changes().frame(),
+                log.frame())
+        finally:
+            os.chdir(here)
+    assert sorted(log.keys().tolist()) == \
+        sorted(data_dct[key]['code'] for key in injured)
+
+    start = time.perf_counter()
+    match_ids = league.apply(log)
+    apply_time = time.perf_counter() - start
+    rebuilt, rebuilt_teams = synthetic.build(data_dct, overview, fixtures)
+    synthetic.project(rebuilt, rebuilt_teams, fixtures)
+    assert {p.code: p.matches for p in league.players} == \
+        {p.code: p.matches for p in rebuilt}
+    assert not league.apply(diff(new, new, key='code'))
+    print('{} players changed: {} matches re-projected from the log in '
+          '{:.3f}s'.format(len(injured), len(match_ids), apply_time))
+    print('Testing Complete')
@@ -0,0 +1,49 @@
+import os
+import json
+
+
+class DocumentCache:
+    """
+    Parses each JSON file once and shares the result between callers.
+
+    A document is reparsed only when its file's mtime or size change,
+    or after invalidate(). Documents are handed out as-is, not copied,
+    so callers must treat them as read-only.
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.parses = 0
+
+    @staticmethod
+    def _signature(loc):
+        try:
+            stat = os.stat(loc)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _entry(self, loc, read):
+        """
+        returns the cache entry for loc, parsing it if missing or stale.
+        read: callable returning the file's text (may download it)
+        """
+        entry = self.entries.get(loc)
+        if entry is None or entry['signature'] != self._signature(loc):
+            text = read()
+            entry = {'signature': self._signature(loc),
+                     'document': json.loads(text)}
+            self.entries[loc] = entry
+            self.parses += 1
+        return entry
+
+    def document(self, loc, read):
+        """returns the parsed JSON document stored at loc"""
+        return self._entry(loc, read)['document']
+
+    def invalidate(self, loc=None):
+        """forgets one document, or all documents if loc isn't given"""
+        if loc is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(loc, None)
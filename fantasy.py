@@ -1,39 +1,69 @@
+import os
 import json
-import requests
 import pandas as pd
+from column_store import ColumnStore
+from snapshot_store import SnapshotStore
+import changes
+
+
+class Dataset:
+    """
+    Attributes worked out from one dataframe, which is loaded (and the
+    attributes worked out) only the first time any of them is read.
+
+    load: function returning the dataframe
+    attributes: function of the dataframe, returning a dict of
+                attribute name: value
+    """
+
+    def __init__(self, load, attributes):
+        self._load = load
+        self._attributes = attributes
+        self._values = None
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if self._values is None:
+            self._values = self._attributes(self._load())
+        try:
+            return self._values[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
 
 class FantasyData:
 
-    def __init__(self):
+    def __init__(self, lazy=False):
         self.url = 'https://fantasy.premierleague.com/drf/bootstrap-static'
         self.fixtures_url = 'https://fantasy.premierleague.com/drf/fixtures/'
         self.static = 'DataStore/bootstrap-static.json'
         self.fixtures_loc = 'DataStore/fixtures.json'
         self.dir = 'DataStore/'
-        self.json_fixtures = self._get_data('fixtures')
-        self.json_players = self._get_data('players')
-        self.players(self._get_players())
-        self.fixtures(self._get_fixtures())
+        self.store = ColumnStore(self.dir + 'columns')
+        self.snapshots = SnapshotStore(self.dir + 'snapshots')
+        self.lazy = lazy  # load each dataset on first use, not here
+        self.players = Dataset(self._get_players, self.player_attributes)
+        self.fixtures = Dataset(self._get_fixtures, lambda df: {'all': df})
+        if not lazy:
+            self.players.data
+            self.fixtures.all
     
     @staticmethod
-    def players(df):
+    def player_attributes(df):
         """
-        sets attributes for player data
+        attributes for player data
 
         example: FantasyData().players.full_names
         returns list of full_names for all players
         """
         full_name = df.first_name + ' ' + df.second_name
         news = df[['web_name', 'news']][df.news != '']
-        setattr(FantasyData.players, 'data', df)
-        setattr(FantasyData.players, 'columns', list(df.columns))
-        setattr(FantasyData.players, 'names', df.web_name)
-        setattr(FantasyData.players, 'full_names', full_name)
-        setattr(FantasyData.players, 'news', news)
-
-    @staticmethod
-    def fixtures(df):
-        setattr(FantasyData.fixtures, 'all', df)
+        return {'data': df,
+                'columns': list(df.columns),
+                'names': df.web_name,
+                'full_names': full_name,
+                'news': news}
 
 
     def _save_as_csv(self, name, df):
@@ -41,12 +71,25 @@ class FantasyData:
         df.to_csv(self.dir + name + '.csv') 
 
     def refresh(self, url, store):
-        """load from url and refresh object"""
-        url_text = requests.get(url).text
-        with open(store, 'w+', encoding='utf-8') as f:
-            f.write(url_text)
-        input('write to file')
-        self.__init__()
+        """load from url and refresh object, if the data has changed"""
+        from http_cache import ConditionalCache
+        # every version is kept, as the file is overwritten by the next
+        source = os.path.splitext(os.path.basename(store))[0]
+        if not self.snapshots.chain(source).versions and \
+           os.path.exists(store):
+            self.snapshots.add_file(source, store)  # the copy held now
+        if not ConditionalCache().fetch(url, store):
+            return
+        self.snapshots.add_file(source, store)
+        self.__init__(self.lazy)
+
+    def player_changes(self, since=None, until=None, key='code'):
+        """
+        what changed for players from time since to time until (by
+        default, in the last refresh), as a changes.ChangeLog keyed by
+        FPL code, as reproject.Reprojection is (key=None: FPL id)
+        """
+        return changes.between(self.snapshots, since, until, key=key)
 
     def refresh_fixtures(self):
         self.refresh(self.fixtures_url, self.fixtures_loc)
@@ -54,6 +97,14 @@ class FantasyData:
     def refresh_players(self):
         self.refresh(self.url, self.static)
 
+    @property
+    def json_fixtures(self):
+        return self._get_data('fixtures')
+
+    @property
+    def json_players(self):
+        return self._get_data('players')
+
     def _get_data(self, dtype):
         """returns FPL data as a Dictionary"""
         if dtype == 'fixtures':
@@ -69,17 +120,26 @@ class FantasyData:
                 return json.load(f)
         except FileNotFoundError:
             self.refresh(url, file)
-        
+            with open(file, encoding='utf-8') as f:
+                return json.load(f)
+
     def _get_players(self):
         """returns FPL player dataframe"""
-        df = pd.DataFrame.from_dict(self.json_players['elements'])
-        df.set_index('id', inplace=True)
-        return df
+        def build():
+            df = pd.DataFrame.from_dict(self.json_players['elements'])
+            df.set_index('id', inplace=True)
+            return df
+        # tables are named after their source file, as in fantasy_2
+        name = os.path.basename(self.static) + '.elements'
+        return self.store.load(name, self.static, build)
 
     def _get_fixtures(self)       :
-        df = pd.DataFrame.from_dict(self.json_fixtures)
-        df.set_index('id', inplace=True)
-        return df
+        def build():
+            df = pd.DataFrame.from_dict(self.json_fixtures)
+            df.set_index('id', inplace=True)
+            return df
+        return self.store.load(os.path.basename(self.fixtures_loc),
+                               self.fixtures_loc, build)
 
 
 if __name__ == '__main__':
@@ -1,8 +1,11 @@
 import os
 import json
-import requests
 import pandas as pd
-from functools import lru_cache
+from document_cache import DocumentCache
+from gameweek_store import GameweekStore
+from column_store import ColumnStore
+from snapshot_store import SnapshotStore
+import changes
 
 class FantasyData:
 
@@ -14,10 +17,27 @@ class FantasyData:
         self.target_urls = {'fixtures': ('fixtures', 'fixtures'),
                             'bootstrap-static': ('bootstrap-static', 'bootstrap_static'),
                             'events': ('event/{}/live', 'gameweek_{:02d}')}
+        self.gameweek_loc = self.directory + 'gameweeks.npz'
 
 
         ## run init methods ##
         self._check_dir_exists()
+        self._http = None  # made on the first download
+        self.documents = DocumentCache()
+        self.columns = ColumnStore(self.directory + 'columns')
+        self.snapshots = SnapshotStore(self.directory + 'snapshots')
+        self._gameweeks = None
+
+    @property
+    def http(self):
+        """
+        The conditional-request cache for downloads, imported and made
+        on first use so reading stored data never loads requests.
+        """
+        if self._http is None:
+            from http_cache import ConditionalCache
+            self._http = ConditionalCache()
+        return self._http
 
     def _check_dir_exists(self):
         """
@@ -29,16 +49,23 @@ class FantasyData:
 
     def _download_data(self, url, loc):
         """
-        Downloads data from target url and stores as JSON text file.
+        Downloads data from target url and stores as JSON text file,
+        unless the stored copy is still current.
 
         url: url of target data, as a string
         loc: local relative file location, as a string
         Returns: JSON data as string.
         """
-        json_text = requests.get(url).text
-        with open(loc, 'w+', encoding='utf-8') as f:
-            f.write(json_text)
-        return json_text
+        self._refresh_data(url, loc)
+        with open(loc, encoding='utf-8') as f:
+            return f.read()
+
+    def _refresh_data(self, url, loc):
+        """
+        Sends a conditional request for target url.
+        Returns: True if the stored JSON changed, else False.
+        """
+        return self.http.fetch(url, loc)
 
     def _retrieve_data(self, url, loc):
         """
@@ -67,43 +94,52 @@ class FantasyData:
         loc = self.directory + name.format(*args)
         return url, loc
 
-    @lru_cache(maxsize=None)
+    def _document(self, url, loc):
+        """
+        Returns the parsed JSON stored at loc, shared by all accessors.
+        The file is parsed once, and again only if it changes.
+        """
+        return self.documents.document(
+            loc, lambda: self._retrieve_data(url=url, loc=loc))
+
     def _convert_to_df(self, url, loc, json_path=''):
-        data = self._retrieve_data(url=url, loc=loc)
-        if json_path:
-            json_data = json.loads(data)[json_path]
-        else:
-            json_data = json.loads(data)
-        df = pd.DataFrame.from_dict(json_data)
-        df.set_index('id', inplace=True)
-        return df
+        """
+        Returns the dataframe at json_path of the JSON stored at loc,
+        read from its binary copy in the column store; the JSON is only
+        parsed (or downloaded) when there is no current copy.
+        """
+        def build():
+            document = self._document(url, loc)
+            json_data = document[json_path] if json_path else document
+            df = pd.DataFrame.from_dict(json_data)
+            df.set_index('id', inplace=True)
+            return df
+        name = os.path.basename(loc) + ('.' + json_path if json_path else '')
+        return self.columns.load(name, loc, build)
 
-    @lru_cache(maxsize=32)
     def _extract_value(self, url, loc, json_path):
-        data = self._retrieve_data(url=url, loc=loc)
-        value = json.loads(data)[json_path]
-        return value
+        return self._document(url, loc)[json_path]
 
-    @lru_cache(maxsize=32)
     def _extract_dict(self, url, loc, json_path):
-        data = self._retrieve_data(url=url, loc=loc)
-        dct = json.loads(data)[json_path]
-        return dct
+        return self._document(url, loc)[json_path]
 
-    @lru_cache(maxsize=None)
-    def _extract_elements(self, url, loc):
-        data = self._retrieve_data(url=url, loc=loc)
-        player_nest = json.loads(data)['elements']
-        player_range = range(1, len(player_nest) + 1)
+    def _gameweek_store(self, gameweeks):
+        """
+        Returns the columnar store of all gameweek stats, after adding
+        any of the given gameweeks that are missing or have changed.
+        """
+        if self._gameweeks is None:
+            self._gameweeks = GameweekStore(self.gameweek_loc)
 
-        gw_stats = []
+        def loc_for(gw):
+            return self._create_url_loc('events', gw)[1]
 
-        for pid in player_range:
-            stats = player_nest[str(pid)]['stats']
-            stats['id'] = pid
-            gw_stats.append(stats)
-            
-        return pd.DataFrame.from_records(gw_stats, index=['id'])
+        def read(gw):
+            url, loc = self._create_url_loc('events', gw)
+            return json.loads(self._retrieve_data(url=url, loc=loc))
+
+        self._gameweeks.update(gameweeks, loc_for, read)
+        return self._gameweeks
 
     @property
     def fixtures(self):
@@ -145,21 +181,65 @@ class FantasyData:
             url, loc = self._create_url_loc('bootstrap-static')
             return self._convert_to_df(url, loc, json_path='elements')
         elif 0 < gw <= self.last_gameweek:
-            url, loc = self._create_url_loc('events', gw)
-            return self._extract_elements(url, loc)
+            return self._gameweek_store([gw]).gameweek(gw)
         else:
             raise 'Incorrect Gameweek format'
         
+    def players_as_of(self, at):
+        """
+        Returns player data as it was at time at (anything
+        pd.Timestamp takes, UTC if naive), from the stored snapshots.
+        """
+        return self.snapshots.table('bootstrap-static', 'elements', at)
+
+    def player_history(self, field):
+        """
+        Returns one field (now_cost, form, news, ...) of every player
+        at every stored snapshot, as snapshot time x player id.
+        """
+        return self.snapshots.history('bootstrap-static', 'elements', field)
+
+    def player_changes(self, since=None, until=None, key='code'):
+        """
+        Returns what changed for players (price, status, news, chance
+        of playing, ownership) from time since to time until, as a
+        changes.ChangeLog; by default, in the last refresh.
+        Players are keyed by key, their FPL code by default, as
+        reproject.Reprojection keys them (None for the FPL id).
+        """
+        return changes.between(self.snapshots, since, until, key=key)
+
     def weekly_breakdown(self, player_id):
-        stats_player = []
-        for gw in range(1,self.next_gameweek):
-            url, loc = self._create_url_loc('events', gw)
-            data = self._retrieve_data(url=url, loc=loc)
-            player_nest = json.loads(data)['elements']
-            stats = player_nest[str(player_id)]['stats']
-            stats['gameweek'] = gw
-            stats_player.append(stats)
-        return pd.DataFrame.from_records(stats_player, index=['gameweek'])
+        gameweeks = range(1, self.next_gameweek)
+        return self._gameweek_store(gameweeks).player(player_id, gameweeks)
+
+    def weekly_history(self):
+        """
+        Returns stats of all players for all completed gameweeks,
+        indexed by player id and gameweek.
+        """
+        gameweeks = range(1, self.next_gameweek)
+        return self._gameweek_store(gameweeks).history(gameweeks)
+
+    def backtest(self, data_dct, overview, gameweeks=None, processes=None):
+        """
+        Replays past gameweeks (default: all finished ones) against
+        their live data, rebuilding the model from data_dct (merged
+        data as at the start of the season) as of each one, with the
+        news in the snapshots stored before each deadline.
+        data_dct must not yet count the gameweeks replayed. The
+        current merged data does, so it can't be used here: save
+        allData before gameweek 1 to backtest a season.
+        Returns a backtest.Backtest, with its metrics and timings.
+        """
+        from backtest import Backtest
+        if gameweeks is None:
+            gameweeks = range(1, self.next_gameweek)
+        players = self.players()
+        ids = dict(zip(players['code'].tolist(), players.index.tolist()))
+        return Backtest(data_dct, overview, self.fixtures,
+                        self._gameweek_store(gameweeks), ids, gameweeks,
+                        processes=processes, snapshots=self.snapshots)
 
     @property
     def game_settings(self):
@@ -171,15 +251,24 @@ class FantasyData:
 
     def refresh_all(self):
         """
-        Re-downloads all data. Returns nothing.
+        Re-downloads any data that has changed, keeping every version
+        downloaded in the snapshot store.
+        Returns True if anything changed.
         """
-        self._convert_to_df.cache_clear()  # clears dataframe cache
-
-        url, loc = self._create_url_loc('fixtures')
-        self._download_data(url, loc)
+        changed = False
+        for target in ['fixtures', 'bootstrap-static']:
+            url, loc = self._create_url_loc(target)
+            if not self.snapshots.chain(target).versions and \
+               os.path.exists(loc):
+                self.snapshots.add_file(target, loc)  # the copy held now
+            downloaded = self._refresh_data(url, loc)
+            if downloaded:
+                self.snapshots.add_file(target, loc)
+            changed |= downloaded
 
-        url, loc = self._create_url_loc('bootstrap-static')
-        self._download_data(url, loc)
+        if changed:
+            self.documents.invalidate()  # dataframes follow the files
+        return changed
 
 
 
@@ -187,6 +276,9 @@ if __name__ == '__main__':
     print('Testing in progress...')
     FPL = FantasyData()
     #FPL.refresh_all()
+    FPL.teams, FPL.events(), FPL.player_types, FPL.current_gameweek
+    FPL.next_gameweek, FPL.last_gameweek, FPL.game_settings, FPL.players()
+    assert FPL.documents.parses <= 1  # bootstrap-static parsed only once
     assert FPL.fixtures._typ == 'dataframe'
     assert FPL.events()._typ == 'dataframe'
     assert FPL.player_types._typ == 'dataframe'
@@ -197,6 +289,7 @@ if __name__ == '__main__':
     assert FPL.players()._typ == 'dataframe'
     assert FPL.players(gw=1)._typ == 'dataframe'
     assert FPL.weekly_breakdown(123)._typ == 'dataframe'
+    assert FPL.weekly_history().loc[123].equals(FPL.weekly_breakdown(123))
     assert len(FPL.game_settings) == 2
     print('Testing Complete')
 
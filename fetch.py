@@ -0,0 +1,196 @@
+import time
+import itertools
+import threading
+import requests
+from collections import deque
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+
+
+class RateLimiter:
+    """
+    Spaces out requests so that, across all threads, no more than
+    `rate` requests per second are started.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """blocks until the caller is allowed to send its next request"""
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+class Fetcher:
+    """
+    Downloads many pages through a pool of worker threads.
+
+    concurrency: number of worker threads (and pooled connections)
+    rate: global budget of requests per second, shared by all workers
+    max_in_flight: cap on requests waiting for a response at once
+    timeout: seconds to wait for each response
+
+    concurrency=1 keeps the original sequential behaviour:
+    one request at a time, each preceded by a one second pause.
+    """
+
+    def __init__(self, concurrency=1, rate=1, max_in_flight=None,
+                 timeout=30):
+        self.concurrency = concurrency
+        self.rate = rate
+        self.timeout = timeout
+        self.limiter = RateLimiter(rate)
+        self.in_flight = threading.BoundedSemaphore(
+            max_in_flight or concurrency)
+        self.session = self._create_session()
+
+    def _create_session(self):
+        """shares keep-alive connections between all worker threads"""
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.concurrency,
+                              pool_maxsize=self.concurrency)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def get(self, url):
+        """downloads a single url within the rate and in-flight limits"""
+        if self.concurrency == 1:
+            time.sleep(1)  # Prevent accidently bombarding PL with requests
+        else:
+            self.limiter.acquire()
+        with self.in_flight:
+            response = self.session.get(url, timeout=self.timeout)
+        response.raise_for_status()
+        return response.text
+
+    def stream(self, url, chunk_size=16384):
+        """
+        downloads a single url within the rate and in-flight limits,
+        yielding the page as decoded text chunks as they arrive
+        """
+        if self.concurrency == 1:
+            time.sleep(1)  # Prevent accidently bombarding PL with requests
+        else:
+            self.limiter.acquire()
+        with self.in_flight:
+            with self.session.get(url, timeout=self.timeout,
+                                  stream=True) as response:
+                response.raise_for_status()
+                if response.encoding is None:
+                    response.encoding = 'utf-8'
+                yield from response.iter_content(chunk_size,
+                                                 decode_unicode=True)
+
+    def get_many(self, urls):
+        """downloads a group of urls, returning their pages as a dict"""
+        return {name: self.get(url) for name, url in urls.items()}
+
+    def fetch_all(self, jobs):
+        """
+        Downloads every job and yields (key, pages) in job order.
+
+        jobs: iterable of (key, {name: url}) pairs
+        Yields (key, {name: page}) or (key, exception) if any of
+        the downloads for that key failed.
+
+        Jobs are submitted as results are taken, with at most twice
+        concurrency of them queued or running, so a consumer that
+        stops early (an error, Ctrl-C, closing the generator) only
+        waits for the downloads already running; the rest of the
+        queue is cancelled.
+        """
+        jobs = iter(jobs)
+        if self.concurrency == 1:
+            for key, urls in jobs:
+                yield key, self._try(urls)
+            return
+
+        executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        try:
+            futures = deque((key, executor.submit(self._try, urls))
+                            for key, urls in itertools.islice(
+                                jobs, 2 * self.concurrency))
+            while futures:
+                key, future = futures.popleft()
+                for next_key, urls in itertools.islice(jobs, 1):
+                    futures.append((next_key,
+                                    executor.submit(self._try, urls)))
+                yield key, future.result()
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    def _try(self, urls):
+        try:
+            return self.get_many(urls)
+        except requests.RequestException as error:
+            return error
+
+    def close(self):
+        self.session.close()
+
+
+if __name__ == '__main__':
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    served = []
+
+    class StandIn(BaseHTTPRequestHandler):
+        """local stand-in for the PL site, with a little latency"""
+        def do_GET(self):
+            served.append(self.path)
+            time.sleep(0.05)
+            body = self.path.encode('utf-8')
+            self.send_response(404 if 'missing' in self.path else 200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    print('Testing in progress...')
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = 'http://127.0.0.1:{}/'.format(server.server_port)
+    jobs = [(i, {'stats': base + '{}/stats'.format(i),
+                 'overview': base + '{}/overview'.format(i)})
+            for i in range(40)]
+
+    for rate in [20, 40, 80]:
+        fetcher = Fetcher(concurrency=8, rate=rate)
+        start = time.perf_counter()
+        results = list(fetcher.fetch_all(jobs))
+        elapsed = time.perf_counter() - start
+        fetcher.close()
+        assert [key for key, _ in results] == list(range(40))
+        assert results[3][1]['overview'] == '/3/overview'
+        assert elapsed >= (len(jobs) * 2 - 1) / rate
+        print('{:>3} req/s: {:.2f}s'.format(rate, elapsed))
+
+    fetcher = Fetcher(concurrency=4, rate=100)
+    key, result = next(fetcher.fetch_all([(0, {'stats': base + 'missing'})]))
+    assert isinstance(result, requests.HTTPError)
+
+    # a consumer stopping early doesn't wait for the whole index
+    many = [(i, {'stats': base + '{}/stats'.format(i)}) for i in range(700)]
+    served.clear()
+    pages = fetcher.fetch_all(many)
+    next(pages)
+    start = time.perf_counter()
+    pages.close()
+    closed = time.perf_counter() - start
+    fetcher.close()
+    assert len(served) <= 1 + 2 * 4 + 4, len(served)
+    assert closed < 1, closed
+
+    server.shutdown()
+    print('Testing Complete')
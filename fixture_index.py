@@ -0,0 +1,149 @@
+import weakref
+from collections import defaultdict
+from collections.abc import MutableMapping
+
+
+class MatchView(MutableMapping):
+    """
+    One player's view of a fixture: reads fall through to the shared
+    fixture row, writes (probAppearance, goalRate, ...) stay with the
+    player, so the fixture row itself is never copied.
+    """
+    __slots__ = ('own', 'fixture')
+
+    def __init__(self, fixture):
+        self.own = {}
+        self.fixture = fixture
+
+    def __getitem__(self, key):
+        try:
+            return self.own[key]
+        except KeyError:
+            return self.fixture[key]
+
+    def __setitem__(self, key, value):
+        self.own[key] = value
+
+    def __delitem__(self, key):
+        del self.own[key]
+
+    def __iter__(self):
+        yield from self.fixture
+        yield from (key for key in self.own if key not in self.fixture)
+
+    def __len__(self):
+        return len(self.fixture.keys() | self.own.keys())
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class FixtureIndex:
+    """
+    Fixture rows grouped by team, built once per fixtures dataframe
+    and shared by every player.
+
+    Callers building many players (team.build, Start.ipynb) build the
+    index once and pass it in place of the dataframe. Otherwise of
+    reuses the last index built while the same dataframe, with the
+    same shape and index, keeps being passed in; it holds only a weak
+    reference to the dataframe. Values changed in place aren't
+    noticed: build a new index (or dataframe) for a new snapshot.
+    """
+    _last = None  # (weak reference to the dataframe, shape, index, index)
+
+    def __init__(self, df):
+        self.rows = df.to_dict('index')
+        self.by_team = defaultdict(list)
+        for match_id, row in self.rows.items():
+            self.by_team[row['team_h']].append(match_id)
+            self.by_team[row['team_a']].append(match_id)
+
+    @classmethod
+    def of(cls, fixtures):
+        """
+        returns the index for a fixtures dataframe (or the index itself),
+        reusing the last index built while the same dataframe keeps
+        being passed in
+        """
+        if isinstance(fixtures, cls):
+            return fixtures
+        last = cls._last
+        if last is None or last[0]() is not fixtures or \
+           last[1] != fixtures.shape or last[2] is not fixtures.index:
+            cls._last = (weakref.ref(fixtures), fixtures.shape,
+                         fixtures.index, cls(fixtures))
+        return cls._last[3]
+
+    def matches(self, team):
+        """a team's fixtures, as fresh per-player views keyed by match id"""
+        return {match_id: MatchView(self.rows[match_id])
+                for match_id in self.by_team.get(team, [])}
+
+
+if __name__ == '__main__':
+    import gc
+    import time
+    import tracemalloc
+    import synthetic
+
+    print('Testing in progress...')
+    data_dct, overview, fixtures = synthetic.league()
+    teams = [data['team'] for data in data_dct.values()]
+
+    def scan(df, team):
+        """previous approach: mask the whole frame for every player"""
+        mask = (df['team_h'] == team) | (df['team_a'] == team)
+        return df[mask].to_dict('index')
+
+    def owned():
+        index = FixtureIndex(fixtures)
+        return lambda team: index.matches(team)
+
+    # an index the caller builds once, or the dataframe passed for
+    # every player (as Player takes it) and looked up by of
+    times = {}
+    for name, extract in [('scan', lambda: lambda team: scan(fixtures, team)),
+                          ('of', lambda: lambda team:
+                           FixtureIndex.of(fixtures).matches(team)),
+                          ('index', owned)]:
+        FixtureIndex._last = None
+        tracemalloc.start()
+        start = time.perf_counter()
+        extract = extract()
+        matches = [extract(team) for team in teams]
+        elapsed = times[name] = time.perf_counter() - start
+        size = tracemalloc.get_traced_memory()[0] / 2**20
+        tracemalloc.stop()
+        print('{:>5}: {} players in {:.3f}s, {:.1f} MB'.format(
+            name, len(teams), elapsed, size))
+    # the dataframe path builds the index once, not once per player
+    assert times['of'] < times['scan'] / 5, times
+
+    for team in set(teams):
+        views = FixtureIndex.of(fixtures).matches(team)
+        assert views == scan(fixtures, team)
+        view = next(iter(views.values()))
+        view['goalRate'] = 1
+        assert view['goalRate'] == 1 and 'goalRate' in view
+        assert 'goalRate' not in FixtureIndex.of(fixtures).rows[
+            next(iter(views))]
+
+    # an index given is used as it is, the same dataframe shares the
+    # last index, and another dataframe (or a row added) builds anew
+    index = FixtureIndex.of(fixtures)
+    assert FixtureIndex.of(index) is index
+    assert FixtureIndex.of(fixtures) is index
+    assert FixtureIndex.of(fixtures.copy()) is not index
+    index = FixtureIndex.of(fixtures)
+    fixtures.loc[fixtures.index.max() + 1] = fixtures.iloc[0]
+    assert FixtureIndex.of(fixtures) is not index
+
+    # the cache doesn't keep the dataframe alive
+    frame = fixtures.copy()
+    FixtureIndex.of(frame)
+    ref = weakref.ref(frame)
+    del frame
+    gc.collect()
+    assert ref() is None
+    print('Testing Complete')
@@ -0,0 +1,239 @@
+import os
+import numpy as np
+import pandas as pd
+
+
+class GameweekStore:
+    """
+    Consolidates every event/{gw}/live file into one array of
+    players x gameweeks x stats, persisted next to the JSON files.
+
+    values[player_id, gameweek, stat] holds the stat as a float,
+    NaN where a player has no entry for that gameweek.
+    Row and column 0 are unused so ids and gameweeks index directly.
+    """
+
+    def __init__(self, loc):
+        self.loc = loc
+        self.values = np.full((1, 1, 0), np.nan)
+        self.stats = []
+        self.integer = []      # stats that only ever held whole numbers
+        self.signatures = {}   # gameweek: (mtime, size) of its JSON file
+        self._load()
+
+    def _load(self):
+        """reads a previously saved store, if there is one"""
+        try:
+            with np.load(self.loc) as data:
+                self.values = data['values']
+                self.stats = list(data['stats'])
+                self.integer = list(data['integer'])
+                self.signatures = {int(gw): (int(mtime), int(size))
+                                   for gw, mtime, size
+                                   in data['signatures']}
+        except FileNotFoundError:
+            pass
+
+    def save(self):
+        """
+        writes the store to a .part file first, so an interrupted save
+        leaves the previous store in place
+        """
+        signatures = [(gw, mtime, size) for gw, (mtime, size)
+                      in sorted(self.signatures.items())]
+        part = self.loc + '.part'
+        with open(part, 'wb') as f:
+            np.savez(f, values=self.values,
+                     stats=np.array(self.stats, dtype=str),
+                     integer=np.array(self.integer, dtype=bool),
+                     signatures=np.array(signatures,
+                                         dtype=np.int64).reshape(-1, 3))
+        os.replace(part, self.loc)
+
+    @staticmethod
+    def _signature(loc):
+        try:
+            stat = os.stat(loc)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def update(self, gameweeks, loc_for, read):
+        """
+        Adds any gameweek that is new, or whose file has changed.
+
+        gameweeks: gameweeks that should be in the store
+        loc_for: function of gameweek, returning its JSON file location
+        read: function of gameweek, returning its parsed JSON document
+        Returns: True if the store changed.
+        """
+        changed = False
+        for gw in gameweeks:
+            signature = self._signature(loc_for(gw))
+            if signature is not None and \
+               signature == self.signatures.get(gw):
+                continue
+            elements = read(gw)['elements']
+            self._add(gw, elements)
+            self.signatures[gw] = self._signature(loc_for(gw))
+            changed = True
+        if changed:
+            self.save()
+        return changed
+
+    def _add(self, gw, elements):
+        """writes one gameweek's live elements into the array"""
+        for stats in (element['stats'] for element in elements.values()):
+            for stat, value in stats.items():
+                if stat not in self.stats:
+                    self.stats.append(stat)
+                    self.integer.append(True)
+        players = max(int(pid) for pid in elements) if elements else 0
+        self._resize(players + 1, gw + 1, len(self.stats))
+
+        column = {stat: i for i, stat in enumerate(self.stats)}
+        self.values[:, gw, :] = np.nan
+        for pid, element in elements.items():
+            row = self.values[int(pid), gw]
+            for stat, value in element['stats'].items():
+                i = column[stat]
+                try:
+                    row[i] = float(value)
+                except (TypeError, ValueError):
+                    continue
+                if self.integer[i] and not float(value).is_integer():
+                    self.integer[i] = False
+
+    def _resize(self, players, gameweeks, stats):
+        """grows the array with NaNs to at least the given shape"""
+        shape = tuple(max(old, new) for old, new
+                      in zip(self.values.shape, (players, gameweeks, stats)))
+        if shape == self.values.shape:
+            return
+        values = np.full(shape, np.nan)
+        p, g, s = self.values.shape
+        values[:p, :g, :s] = self.values
+        self.values = values
+
+    def _frame(self, values, index):
+        """labels a 2d slice, restoring whole-number stats to ints"""
+        df = pd.DataFrame(values, index=index, columns=self.stats)
+        whole = [stat for stat, integer in zip(self.stats, self.integer)
+                 if integer and not df[stat].isna().any()]
+        return df.astype({stat: 'int64' for stat in whole})
+
+    def player(self, player_id, gameweeks):
+        """
+        stats of one player for the given gameweeks.
+        Raises KeyError if the player has no entry in one of them,
+        as reading the live files did.
+        """
+        gameweeks = list(gameweeks)
+        if not 0 < player_id < self.values.shape[0]:
+            raise KeyError(player_id)
+        values = self.values[player_id, gameweeks]
+        missing = np.isnan(values).all(axis=1)
+        if missing.any():
+            raise KeyError('{} (no entry for gameweek {})'.format(
+                player_id, np.array(gameweeks)[missing].tolist()))
+        return self._frame(values, pd.Index(gameweeks, name='gameweek'))
+
+    def gameweek(self, gw):
+        """stats of every player with an entry in the given gameweek"""
+        values = self.values[:, gw]
+        ids = np.flatnonzero(~np.isnan(values).all(axis=1))
+        return self._frame(values[ids], pd.Index(ids, name='id'))
+
+    def history(self, gameweeks):
+        """stats of every player for every given gameweek, in long form"""
+        gameweeks = list(gameweeks)
+        values = self.values[:, gameweeks]
+        players, weeks = np.nonzero(~np.isnan(values).all(axis=2))
+        index = pd.MultiIndex.from_arrays(
+            [players, np.array(gameweeks)[weeks]], names=['id', 'gameweek'])
+        return self._frame(values[players, weeks], index)
+
+
+if __name__ == '__main__':
+    import json
+    import tempfile
+
+    def legacy_gameweek(document):
+        """previous FantasyData.players(gw), from the live JSON"""
+        player_nest = document['elements']
+        gw_stats = []
+        for pid in range(1, len(player_nest) + 1):
+            stats = dict(player_nest[str(pid)]['stats'])
+            stats['id'] = pid
+            gw_stats.append(stats)
+        return pd.DataFrame.from_records(gw_stats, index=['id'])
+
+    def legacy_breakdown(documents, player_id, gameweeks):
+        """previous FantasyData.weekly_breakdown, from the live JSON"""
+        stats_player = []
+        for gw in gameweeks:
+            player_nest = documents[gw]['elements']
+            stats = dict(player_nest[str(player_id)]['stats'])
+            stats['gameweek'] = gw
+            stats_player.append(stats)
+        return pd.DataFrame.from_records(stats_player, index=['gameweek'])
+
+    print('Testing in progress...')
+    rng = np.random.default_rng(0)
+    gameweeks = range(1, 6)
+    documents = {}
+    for gw in gameweeks:
+        players = 500 + gw  # players join during the season
+        documents[gw] = {'elements': {
+            str(pid): {'stats': {
+                'minutes': int(rng.integers(0, 91)),
+                'goals_scored': int(rng.poisson(0.1)),
+                'bonus': int(rng.integers(0, 4)),
+                'influence': float(rng.integers(0, 1000)) / 10,
+                'total_points': int(rng.integers(-2, 15))},
+                'explain': []}
+            for pid in range(1, players + 1)}}
+
+    with tempfile.TemporaryDirectory() as directory:
+        def loc_for(gw):
+            return os.path.join(directory, 'gameweek_{:02d}'.format(gw))
+
+        def read(gw):
+            with open(loc_for(gw), encoding='utf-8') as f:
+                return json.load(f)
+
+        for gw, document in documents.items():
+            with open(loc_for(gw), 'w', encoding='utf-8') as f:
+                json.dump(document, f)
+        loc = os.path.join(directory, 'gameweeks.npz')
+        store = GameweekStore(loc)
+        assert store.update(gameweeks, loc_for, read)
+        assert not os.path.exists(loc + '.part')
+
+        # FantasyData.players(gw) and weekly_breakdown, as the JSON gave
+        for gw in gameweeks:
+            pd.testing.assert_frame_equal(store.gameweek(gw),
+                                          legacy_gameweek(documents[gw]))
+        for player_id in [1, 250, 501]:
+            pd.testing.assert_frame_equal(
+                store.player(player_id, gameweeks),
+                legacy_breakdown(documents, player_id, gameweeks))
+        pd.testing.assert_frame_equal(
+            store.player(505, [5]), legacy_breakdown(documents, 505, [5]))
+
+        # players absent from a gameweek raise, as before
+        for player_id, weeks in [(505, gameweeks), (9999, gameweeks),
+                                 (0, [1])]:
+            try:
+                store.player(player_id, weeks)
+            except KeyError:
+                pass
+            else:
+                raise AssertionError('no KeyError for {}'.format(player_id))
+
+        # read back as saved, without parsing any gameweek again
+        reloaded = GameweekStore(loc)
+        assert not reloaded.update(gameweeks, loc_for, read)
+        pd.testing.assert_frame_equal(reloaded.history(gameweeks),
+                                      store.history(gameweeks))
+    print('Testing Complete')
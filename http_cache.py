@@ -0,0 +1,127 @@
+import os
+import json
+import hashlib
+import requests
+
+
+class ConditionalCache:
+    """
+    Downloads urls into local files using conditional requests.
+
+    The validators of each response (ETag / Last-Modified) are kept in
+    a .meta file next to the stored file, and sent back on the next
+    download so an unchanged resource costs a 304 with no body.
+    """
+
+    def __init__(self, session=None):
+        self.session = session or requests.Session()
+        self.bytes_received = 0
+
+    @staticmethod
+    def _meta_loc(loc):
+        return loc + '.meta'
+
+    def _read_meta(self, loc):
+        """returns stored validators, or nothing if file isn't stored"""
+        if not os.path.exists(loc):
+            return {}
+        try:
+            with open(self._meta_loc(loc), encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _write_meta(self, loc, meta):
+        with open(self._meta_loc(loc), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+
+    def fetch(self, url, loc):
+        """
+        Downloads url to loc, unless the stored copy is still current.
+
+        url: url of target data, as a string
+        loc: local relative file location, as a string
+        Returns: True if the content at loc changed, else False.
+        """
+        meta = self._read_meta(loc)
+        headers = {}
+        if 'etag' in meta:
+            headers['If-None-Match'] = meta['etag']
+        if 'last_modified' in meta:
+            headers['If-Modified-Since'] = meta['last_modified']
+
+        response = self.session.get(url, headers=headers)
+        self.bytes_received += len(response.content)
+        if response.status_code == 304:
+            return False
+        response.raise_for_status()
+
+        # servers without validators still send 200s for unchanged data
+        digest = hashlib.sha1(response.content).hexdigest()
+        changed = digest != meta.get('sha1')
+        if changed:
+            with open(loc, 'w+', encoding='utf-8') as f:
+                f.write(response.text)
+
+        meta = {'sha1': digest}
+        if 'ETag' in response.headers:
+            meta['etag'] = response.headers['ETag']
+        if 'Last-Modified' in response.headers:
+            meta['last_modified'] = response.headers['Last-Modified']
+        self._write_meta(loc, meta)
+        return changed
+
+
+if __name__ == '__main__':
+    import tempfile
+    import threading
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    class StandIn(BaseHTTPRequestHandler):
+        """local stand-in for the FPL api, counting bytes it sends"""
+        body = json.dumps({'elements': list(range(5000))}).encode('utf-8')
+        sent = 0
+
+        def do_GET(self):
+            etag = '"{}"'.format(hashlib.md5(StandIn.body).hexdigest())
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            if self.path != '/no-validators':
+                self.send_header('ETag', etag)
+            self.send_header('Content-Length', str(len(StandIn.body)))
+            self.end_headers()
+            self.wfile.write(StandIn.body)
+            StandIn.sent += len(StandIn.body)
+
+        def log_message(self, *args):
+            pass
+
+    print('Testing in progress...')
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = 'http://127.0.0.1:{}/'.format(server.server_port)
+
+    with tempfile.TemporaryDirectory() as directory:
+        loc = os.path.join(directory, 'bootstrap_static')
+        cache = ConditionalCache()
+        assert cache.fetch(base + 'bootstrap-static', loc)
+        first = StandIn.sent
+        assert not cache.fetch(base + 'bootstrap-static', loc)
+        assert StandIn.sent == first  # 304, no body sent
+
+        StandIn.body = json.dumps({'elements': [1]}).encode('utf-8')
+        assert cache.fetch(base + 'bootstrap-static', loc)
+        with open(loc, encoding='utf-8') as f:
+            assert json.load(f) == {'elements': [1]}
+
+        loc = os.path.join(directory, 'fixtures')
+        assert cache.fetch(base + 'no-validators', loc)
+        assert not cache.fetch(base + 'no-validators', loc)
+        print('bytes sent: {}, received: {}'.format(StandIn.sent,
+                                                    cache.bytes_received))
+
+    server.shutdown()
+    print('Testing Complete')
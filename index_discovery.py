@@ -0,0 +1,123 @@
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+import requests
+from fetch import Fetcher
+
+
+class PlayerLinkScanner(HTMLParser):
+    """
+    Picks (href, FPL id) pairs out of PL players pages as they stream
+    in, from the same elements the browser scrape reads: a
+    "playerName" link holding an img with a data-player attribute.
+    """
+
+    def __init__(self, base_url=''):
+        super().__init__(convert_charrefs=True)
+        self.base_url = base_url
+        self.links = []
+        self._href = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            attrs = dict(attrs)
+            classes = (attrs.get('class') or '').split()
+            self._href = attrs.get('href') if 'playerName' in classes else None
+        elif tag == 'img' and self._href is not None:
+            FPL_id = dict(attrs).get('data-player')
+            if FPL_id:
+                self.links.append((urljoin(self.base_url, self._href),
+                                   FPL_id))
+                self._href = None
+
+    def handle_endtag(self, tag):
+        if tag == 'a':
+            self._href = None
+
+
+def discover_players(page_url, fetcher, max_pages=200):
+    """
+    Walks a paginated players listing over plain HTTP, scanning each
+    page as it downloads, until a page turns up no new players.
+
+    page_url: listing url with a {page} placeholder, counting from 0
+    Returns a list of (player href, FPL id) in listing order.
+    """
+    player_lst = []
+    seen = set()
+    for page in range(max_pages):
+        url = page_url.format(page=page)
+        scanner = PlayerLinkScanner(url)
+        try:
+            for chunk in fetcher.stream(url):
+                scanner.feed(chunk)
+        except requests.HTTPError as error:
+            if error.response is not None and \
+               error.response.status_code == 404:
+                break  # walked off the end of the listing
+            raise
+        scanner.close()
+
+        new = [link for link in scanner.links if link not in seen]
+        if not new:
+            break
+        seen.update(new)
+        player_lst.extend(new)
+    return player_lst
+
+
+if __name__ == '__main__':
+    import re
+    import threading
+    import time
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    players = [(4000 + n, 'p{}'.format(200000 + n)) for n in range(95)]
+    page_size = 30
+
+    class StandIn(BaseHTTPRequestHandler):
+        """local stand-in for the PL players listing, sent in pieces"""
+        def do_GET(self):
+            page = int(re.search(r'page=(\d+)', self.path).group(1))
+            batch = players[page * page_size:(page + 1) * page_size]
+            rows = ''.join(
+                '<tr><td><a href="/players/{0}/Player-{0}/overview" '
+                'class="playerName"><img class="img" data-player="{1}" '
+                'src="x.png" alt="">Player {0}</a></td>'
+                '<td><a class="other" href="/clubs/1/"><img '
+                'data-player="p0"></a></td></tr>'.format(*player)
+                for player in batch)
+            body = ('<html><body><table>{}</table></body></html>'
+                    .format(rows)).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            for i in range(0, len(body), 500):
+                self.wfile.write(body[i:i + 500])
+                self.wfile.flush()
+
+        def log_message(self, *args):
+            pass
+
+    print('Testing in progress...')
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = 'http://127.0.0.1:{}/'.format(server.server_port)
+
+    fetcher = Fetcher(concurrency=2, rate=50)
+    start = time.perf_counter()
+    player_lst = discover_players(base + 'players?page={page}', fetcher)
+    elapsed = time.perf_counter() - start
+    fetcher.close()
+    assert player_lst == [
+        (base + 'players/{0}/Player-{0}/overview'.format(player_id), FPL_id)
+        for player_id, FPL_id in players]
+    # ids come out as _convert_index_to_csv expects them
+    pattern = re.compile(r'players/(\d+)/\S+/')
+    assert int(pattern.search(player_lst[0][0]).group(1)) == 4000
+    assert int(player_lst[0][1][1:]) == 200000
+    print('{} players from {} pages in {:.2f}s'.format(
+        len(player_lst), -(-len(players) // page_size) + 1, elapsed))
+
+    server.shutdown()
+    print('Testing Complete')
@@ -0,0 +1,286 @@
+import numpy as np
+import pandas as pd
+import poisson
+from bonus import rank_top, points as bonus_points
+from strength import TeamStrength
+from collections import namedtuple
+
+
+LeagueInputs = namedtuple('LeagueInputs', [
+    # players (one entry each)
+    'player_ids',          # FPL code
+    'player_team',         # index into the team arrays
+    'goals_per_match',
+    'assists_per_match',
+    'app_rate',
+    'start_rate',
+    'sub_rate',
+    'chance',              # chance of playing, while news applies
+    'return_date',         # news applies to kickoffs before this
+    'time_points',         # (plus 60 mins, sub 60 mins) points
+    'assist_points',
+    'card_points',         # expected card points per appearance
+    'own_goal_points',     # expected own goal points per appearance
+    'yellow_prob',         # chance of one card per appearance
+    'red_prob',            # chance of two cards (a red) per appearance
+    'own_goal_prob',       # chance of an own goal per appearance
+    'discipline_points',   # (yellow, red, own goal) points
+    'goal_points',
+    'clean_points',        # 0 where clean sheets don't score
+    'conceded_points',     # 0 where goals conceded don't score
+    'bps_goal_points',
+    'bps_clean_points',
+    # teams
+    'team_ids',
+    'concede_rate',        # NaN where unknown
+    'goal_rate',           # NaN where unknown
+    'home_advantage',
+    'away_disadvantage',
+    # fixtures
+    'match_ids',
+    'team_h',              # index into the team arrays
+    'team_a',
+    'kickoff',             # kickoff date
+    'event',               # gameweek
+])
+
+FIXTURE_FIELDS = ['match_ids', 'team_h', 'team_a', 'kickoff', 'event']
+
+
+def select_fixtures(inputs, index):
+    """returns inputs restricted to the fixtures at index"""
+    return inputs._replace(**{field: getattr(inputs, field)[index]
+                              for field in FIXTURE_FIELDS})
+
+
+def gameweek(inputs, event):
+    """returns inputs restricted to one gameweek's fixtures"""
+    return select_fixtures(inputs, inputs.event == event)
+
+
+def _total(values):
+    """
+    sums over players one at a time, as Match does, so a fixture's
+    total doesn't depend on which other fixtures are projected with it
+    """
+    return np.cumsum(values, axis=0)[-1]
+
+
+def _team_goal_rate(rate, fallback):
+    """swaps low team goal rates for the squad estimate, as Match does"""
+    return np.where(rate < 0.5, fallback, rate)
+
+
+def project(inputs):
+    """
+    Projects every player in every fixture of inputs, following the
+    same steps as Match and Player, as whole-array operations.
+
+    Returns a dict of arrays, players x fixtures unless noted:
+    playing, probAppearance, probStart, probSub, goalRate, assistRate,
+    probConcede, initialPoints, bonusPoints, BPSrank, finalPoints, and
+    team_H_goalRate, team_A_goalRate (one per fixture).
+    Values are 0 where a player's team isn't in the fixture.
+    """
+    i = inputs
+    team = i.player_team[:, None]
+    home = team == i.team_h[None, :]
+    away = team == i.team_a[None, :]
+    playing = home | away
+
+    # Player.probability_of_appearance
+    news = i.kickoff[None, :] < i.return_date[:, None]
+    prob = np.where(news, i.chance[:, None], 1)
+    probAppearance = np.where(playing, prob * i.app_rate[:, None], 0)
+    probSub = np.where(playing, prob * i.sub_rate[:, None], 0)
+    probStart = np.where(playing, prob * i.start_rate[:, None], 0)
+
+    # Match.simulate_player_goals
+    known = ~np.isnan(i.concede_rate)
+    c_Avg = sum(i.concede_rate[known].tolist()) / known.sum()
+    concede = np.where(known, i.concede_rate, i.concede_rate[known].max())
+    c_Home = concede[i.team_h][None, :]
+    c_Away = concede[i.team_a][None, :]
+    h = 1 + i.home_advantage
+    a = 1 - i.away_disadvantage
+    goals = i.goals_per_match[:, None]
+    assists = i.assists_per_match[:, None]
+    goalRate = np.where(home, goals * h * c_Away / c_Avg,
+                        np.where(away, goals * a * c_Home / c_Avg, 0))
+    # away assists are scaled by the away side's concede rate, as in Match
+    assistRate = np.where(home, assists * h * c_Away / c_Avg,
+                          np.where(away, assists * a * c_Away / c_Avg, 0))
+
+    expected = goalRate * probAppearance
+    team_H_goalRate = _team_goal_rate(_total(np.where(home, expected, 0)),
+                                      i.goal_rate[i.team_h])
+    team_A_goalRate = _team_goal_rate(_total(np.where(away, expected, 0)),
+                                      i.goal_rate[i.team_a])
+
+    # Match.simulate_conceded
+    probConcede = np.where(home, team_A_goalRate[None, :],
+                           np.where(away, team_H_goalRate[None, :], 0))
+
+    # Player.resolve
+    table = poisson.pmf_table(probConcede, 1)
+    clean = table[..., 0]
+    twoOrMore = 1 - table.sum(axis=-1)
+    expectedGoals = poisson.expected_count(goalRate, 5)
+
+    def term(points, values):
+        points = points[:, None]
+        return np.where(points != 0, points * values, 0)
+
+    plus60, sub60 = i.time_points
+    initialPoints = probStart * plus60 + probSub * sub60
+    initialPoints = initialPoints + assistRate * i.assist_points
+    initialPoints = initialPoints + i.card_points[:, None]
+    initialPoints = initialPoints + i.own_goal_points[:, None]
+    initialPoints = initialPoints + term(i.goal_points, expectedGoals)
+    initialPoints = initialPoints + term(i.clean_points, clean)
+    initialPoints = initialPoints + term(i.conceded_points, twoOrMore)
+    initialPoints = np.where(playing, initialPoints * probAppearance, 0)
+
+    # Player.calculate_BPS
+    bonusPoints = term(i.bps_goal_points, expectedGoals)
+    bonusPoints = bonusPoints + term(i.bps_clean_points, clean)
+    bonusPoints = np.where(playing, bonusPoints * probAppearance, 0)
+
+    # Match.resolve_BPS: top 3 of each fixture, ties sharing a rank
+    BPSrank = rank_top(np.where(playing, bonusPoints, -np.inf).T).T
+    bps = bonus_points(BPSrank) * probAppearance
+    finalPoints = np.where(playing, initialPoints + bps, 0)
+
+    return {'playing': playing,
+            'probAppearance': probAppearance,
+            'probStart': probStart,
+            'probSub': probSub,
+            'goalRate': goalRate,
+            'assistRate': assistRate,
+            'probConcede': probConcede,
+            'initialPoints': initialPoints,
+            'bonusPoints': bonusPoints,
+            'BPSrank': BPSrank,
+            'finalPoints': finalPoints,
+            'team_H_goalRate': team_H_goalRate,
+            'team_A_goalRate': team_A_goalRate}
+
+
+def build_inputs(teams, fixtures, homeAdvantage=0.05, awayDisadvantage=0.05):
+    """
+    Collects everything project needs from built Squads and Players.
+
+    teams: dict of team id: Squad
+    fixtures: fixtures dataframe; finished fixtures are left out
+    """
+    strength = TeamStrength.of(teams, homeAdvantage, awayDisadvantage)
+    team_ids = strength.team_ids
+    team_index = {team: n for n, team in enumerate(team_ids)}
+    players = [player for squad in teams.values()
+               for player in squad.allPlayers]
+    news = [player.check_news() for player in players]
+
+    def values(attr, default=None):
+        return np.array([getattr(player, attr, default)
+                         for player in players], dtype=float)
+
+    remaining = fixtures[fixtures['finished'] != True]
+    kickoff = [kickoff_time.split('T')[0]
+               for kickoff_time in remaining['kickoff_time']]
+
+    return LeagueInputs(
+        player_ids=np.array([player.code for player in players]),
+        player_team=np.array([team_index[player.team]
+                              for player in players]),
+        goals_per_match=values('goalsPerMatch'),
+        assists_per_match=values('assistsPerMatch'),
+        app_rate=values('appRate'),
+        start_rate=values('startRate'),
+        sub_rate=values('subRate'),
+        chance=np.array([chance for chance, _ in news], dtype=float),
+        return_date=np.array([date for _, date in news],
+                             dtype='datetime64[us]'),
+        time_points=(players[0].plus60Points, players[0].sub60Points),
+        assist_points=players[0].assistPoints,
+        card_points=np.array([player.card_points(None)
+                              for player in players], dtype=float),
+        own_goal_points=np.array([player.own_goal_points(None)
+                                  for player in players], dtype=float),
+        yellow_prob=values('P_yellow'),
+        red_prob=values('P_red'),
+        own_goal_prob=values('P_ownGoal'),
+        discipline_points=(players[0].yellowPoints, players[0].redPoints,
+                           players[0].owngoalPoints),
+        goal_points=values('goalPoints'),
+        clean_points=values('cleanPoints', 0),
+        conceded_points=values('concededPoints', 0),
+        bps_goal_points=values('BPSgoalPoints', 0),
+        bps_clean_points=values('BPScleanPoints', 0),
+        team_ids=np.array(team_ids),
+        concede_rate=strength.concede_rate,
+        goal_rate=strength.goal_rate,
+        home_advantage=homeAdvantage,
+        away_disadvantage=awayDisadvantage,
+        match_ids=np.array(remaining.index),
+        team_h=np.array([team_index[team] for team in remaining['team_h']]),
+        team_a=np.array([team_index[team] for team in remaining['team_a']]),
+        kickoff=np.array(kickoff, dtype='datetime64[us]'),
+        event=np.array(remaining['event']))
+
+
+class LeagueProjection:
+    """
+    Projects all remaining fixtures for the whole league at once,
+    holding players x fixtures as dense arrays instead of filling
+    per-player match dicts one key at a time.
+
+    Produces the same numbers as running Match, Player.resolve,
+    Player.calculate_BPS and Match.resolve_BPS over the same squads.
+    """
+
+    def __init__(self, teams, fixtures, homeAdvantage=0.05,
+                 awayDisadvantage=0.05):
+        self.inputs = build_inputs(teams, fixtures, homeAdvantage,
+                                   awayDisadvantage)
+        self.results = project(self.inputs)
+
+    def frame(self, field):
+        """
+        returns one result as a dataframe of player code x match id,
+        NaN where the player's team isn't in the fixture
+        """
+        values = np.where(self.results['playing'],
+                          self.results[field], np.nan)
+        return pd.DataFrame(values, index=self.inputs.player_ids,
+                            columns=self.inputs.match_ids)
+
+
+if __name__ == '__main__':
+    import time
+    import synthetic
+
+    print('Testing in progress...')
+    data_dct, overview, fixtures = synthetic.league()
+    players, teams = synthetic.build(data_dct, overview, fixtures)
+
+    start = time.perf_counter()
+    synthetic.project(players, teams, fixtures)
+    objects_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    league = LeagueProjection(teams, fixtures)
+    arrays_time = time.perf_counter() - start
+
+    fields = ['probAppearance', 'goalRate', 'assistRate', 'probConcede',
+              'initialPoints', 'bonusPoints', 'BPSrank', 'finalPoints']
+    for field in fields:
+        df = league.frame(field)
+        for player in players:
+            for match_id, match in player.matches.items():
+                if match['finished'] == True:
+                    continue
+                assert np.isclose(df.at[player.code, match_id],
+                                  match[field], rtol=1e-9, atol=1e-12)
+    print('{} fixtures: objects {:.2f}s, arrays {:.3f}s'.format(
+        len(league.inputs.match_ids), objects_time, arrays_time))
+    print('Testing Complete')
@@ -1,3 +1,8 @@
+import numpy as np
+from bonus import rank_top, points as bonus_points
+from strength import TeamStrength
+
+
 
 class Match:
 
@@ -6,10 +11,10 @@ class Match:
         self.team_H = team_H
         self.team_A = team_A
         self.all_teams = all_teams
-        self.all_teams_concedeRate = self._list_all_teams_concede_rates()
-        self.avgConcedeRate = self._average_concede_rate()
-        self.homeAdvantage = 0.05     # arbitary
-        self.awayDisadvantage = 0.05  # arbitary
+        self.strength = TeamStrength.of(all_teams)  # shared by all matches
+        self.avgConcedeRate = self.strength.avg_concede_rate
+        self.homeAdvantage = self.strength.homeAdvantage
+        self.awayDisadvantage = self.strength.awayDisadvantage
         self.team_H_goalRate = 0 
         self.team_A_goalRate = 0
         self.simulate_player_goals()
@@ -17,15 +22,10 @@ class Match:
 
     def simulate_player_goals(self):
         c_Avg = self.avgConcedeRate
-        home = 1 + self.homeAdvantage
-        away = 1 - self.awayDisadvantage
-        c_Away = self.team_A.concedeRate
-        c_Home = self.team_H.concedeRate
-
-        if c_Away == None:
-            c_Away = self._max_concede_rate()
-        if c_Home == None:
-            c_Home = self._max_concede_rate()
+        home = self.strength.home
+        away = self.strength.away
+        c_Away = self.strength.concede(self.team_A)
+        c_Home = self.strength.concede(self.team_H)
 
         prob_lst = []
         for player in self.team_H.allPlayers:
@@ -85,45 +85,37 @@ class Match:
                                   data=self.team_H_goalRate)
 
     def resolve_BPS(self):
-        lst = []
-
-        for player in self.team_H.allPlayers + self.team_A.allPlayers:
-            points = player.get_match_data(self.match_id, 'bonusPoints')
-            lst.append((points, player))
-
-        lst = sorted(lst, key=lambda x: x[0], reverse=True)
-
-        for i, (points, player) in enumerate(lst, 1):
-            player.add_match_data(self.match_id, 'BPSrank', i)
-            player.resolve_BPS(self.match_id)
-        
-    def _list_all_teams_concede_rates(self):
-        return [team.concedeRate
-                for team 
-                in self.all_teams.values()
-                if team.concedeRate != None]
-        
-
-    def _average_concede_rate(self):
-        concede = self.all_teams_concedeRate
-        return sum(concede) / len(concede)
-
-    def _max_concede_rate(self):
-        return max(self.all_teams_concedeRate)
-
-    def _min_goal_rate(self):
-        return min([team.goalRate
-                    for team
-                    in self.all_teams.values()
-                    if team.goalRate != None])
-
-
-
-        
-
-
-
-    
-
-    
-
+        resolve_BPS([self])
+
+
+def resolve_BPS(matches):
+    """
+    Bonus for many matches at once: every match's bonusPoints go into
+    one matches x players array, ranked by rank_top (ties share a rank,
+    as the official rules have it, and players outside the top 3 get
+    rank 4), and BPSrank and finalPoints (initialPoints plus the bonus
+    of the rank, bonus.points, times the chance of appearing) are
+    worked out in bulk before being written back.
+    """
+    squads = [match.team_H.allPlayers + match.team_A.allPlayers
+              for match in matches]
+    if not squads:
+        return
+    shape = (len(matches), max(len(squad) for squad in squads))
+    scores = np.full(shape, -np.inf)
+    initial = np.zeros(shape)
+    prob = np.zeros(shape)
+    for f, (match, squad) in enumerate(zip(matches, squads)):
+        rows = [player.matches[match.match_id] for player in squad]
+        scores[f, :len(rows)] = [row['bonusPoints'] for row in rows]
+        initial[f, :len(rows)] = [row['initialPoints'] for row in rows]
+        prob[f, :len(rows)] = [row['probAppearance'] for row in rows]
+
+    ranks = rank_top(scores)
+    bps = bonus_points(ranks) * prob
+    final = initial + bps
+    for f, (match, squad) in enumerate(zip(matches, squads)):
+        for player, rank, points in zip(squad, ranks[f].tolist(),
+                                        final[f].tolist()):
+            player.add_match_data(match.match_id, 'BPSrank', rank)
+            player.add_match_data(match.match_id, 'finalPoints', points)
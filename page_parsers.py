@@ -0,0 +1,440 @@
+import re
+import html
+import pandas as pd
+
+
+# markup dropped from a page to leave the text BeautifulSoup's get_text
+# returns: comments, declarations, tags, and whole script/style/template
+# elements (attribute values may contain '>')
+_markup = re.compile(r'''
+    <!--.*?(?:-->|\Z)
+  | <(script|style|template)\b(?:[^>"']|"[^"]*"|'[^']*')*>.*?(?:</\1\s*>|\Z)
+  | <[!?][^>]*>
+  | </?[a-zA-Z](?:[^>"']|"[^"]*"|'[^']*')*>
+  ''', flags=re.DOTALL | re.IGNORECASE | re.VERBOSE)
+
+
+# whitespace BeautifulSoup collapses when a string holds nothing else
+_spaces = ' \n\t\f\r'
+
+
+def _text(segment):
+    """a string between markup, as BeautifulSoup keeps it"""
+    text = html.unescape(segment)
+    if text and not text.strip(_spaces):
+        return '\n' if '\n' in text else ' '
+    return text
+
+
+def page_text(page):
+    """returns the text of an html page, in one scan over the markup"""
+    segments = []
+    position = 0
+    for match in _markup.finditer(page):
+        segments.append(_text(page[position:match.start()]))
+        position = match.end()
+    segments.append(_text(page[position:]))
+    return ''.join(segments)
+
+
+class StatsExtractor:
+    """
+    Extracts numeric fields, club and position from a PL stats page
+    in a single scan with precompiled patterns.
+
+    Gives the same result as searching the page text separately for
+    each field: the first "<field> <digits>" wins, case-insensitively.
+    """
+
+    def __init__(self, numeric_fields):
+        self.numeric_fields = list(numeric_fields)
+        names = sorted(self.numeric_fields, key=len, reverse=True)
+        self.fields_pattern = re.compile(
+            r'({})\s+(\d+)'.format('|'.join(re.escape(f) for f in names)),
+            flags=re.IGNORECASE)
+        self.club_pattern = re.compile(r'Club\s{4}(.+?)\s{2}Position\s(.+?)\s')
+        self.lookup = {field.lower(): field for field in self.numeric_fields}
+        # a match of "Own Goals 3" hides the "Goals 3" inside it
+        self.suffixes = {field.lower(): [other for other in self.numeric_fields
+                                         if other != field and
+                                         field.lower().endswith(other.lower())]
+                         for field in self.numeric_fields}
+
+    def extract(self, stats_page, player_id):
+        """extracts required fields from downloaded player stats"""
+        text = page_text(stats_page)
+        text = text.replace('\n', ' ')
+        text = text.replace('\r', ' ')
+
+        found = {}
+        for match in self.fields_pattern.finditer(text):
+            name = match.group(1).lower()
+            value = int(match.group(2))
+            for field in [self.lookup[name]] + self.suffixes[name]:
+                found.setdefault(field, value)
+            if len(found) == len(self.numeric_fields):
+                break
+
+        fields = {'player_id': player_id}
+        for field in self.numeric_fields:
+            # only certain stats come through for different positions
+            fields[field] = found.get(field, 0)
+
+        club_and_position = self.club_pattern.search(text)
+        if club_and_position is None:
+            raise IndexError('no club and position: {}'.format(player_id))
+        fields['Team'] = club_and_position.group(1)
+        fields['Position'] = club_and_position.group(2)
+
+        return fields
+
+
+_attrs = r'''(?:[^>"']|"[^"]*"|'[^']*')*'''
+# content bs4 never finds tables in
+_hidden = re.compile(r'''
+    <!--.*?(?:-->|\Z)
+  | <(script|style|template)\b{}>.*?(?:</\1\s*>|\Z)
+  '''.format(_attrs), flags=re.DOTALL | re.IGNORECASE | re.VERBOSE)
+_table = re.compile(r'<table\b.*?(?:</table\s*>|\Z)',
+                    flags=re.DOTALL | re.IGNORECASE)
+_section = re.compile(r'<(thead|tfoot)\b{}>(.*?)(?:</\1\s*>|\Z)'.format(_attrs),
+                      flags=re.DOTALL | re.IGNORECASE)
+_row = re.compile(r'<tr\b{}>(.*?)(?=<tr\b|</table\s*>|\Z)'.format(_attrs),
+                  flags=re.DOTALL | re.IGNORECASE)
+_cell = re.compile(r'<(t[dh])\b({})>(.*?)(?=<t[dh]\b|</tr\s*>|\Z)'
+                   .format(_attrs), flags=re.DOTALL | re.IGNORECASE)
+_span = re.compile(r'''\b(rowspan|colspan)\s*=\s*["']?\s*(\d+)''',
+                   flags=re.IGNORECASE)
+_whitespace = re.compile(r'[\r\n]+|\s{2,}')
+# cell text pandas reads as missing
+_missing = {'', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN',
+            '-nan', '1.#IND', '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN',
+            'None', 'n/a', 'nan', 'null'}
+
+
+def _table_rows(section):
+    """rows of a table section, each a list of (tag, attrs, text) cells"""
+    return [[(tag.lower(), attrs,
+              _whitespace.sub(' ', page_text(content).strip()))
+             for tag, attrs, content in _cell.findall(row)]
+            for row in _row.findall(section)]
+
+
+def _expand(rows, remainder, overflow):
+    """copies rowspan and colspan cells across, as pd.read_html does"""
+    all_texts = []
+    for cells in rows:
+        texts = []
+        next_remainder = []
+        index = 0
+        for _, attrs, text in cells:
+            while remainder and remainder[0][0] <= index:
+                prev_i, prev_text, prev_rowspan = remainder.pop(0)
+                texts.append(prev_text)
+                if prev_rowspan > 1:
+                    next_remainder.append((prev_i, prev_text, prev_rowspan - 1))
+                index += 1
+            spans = {name.lower(): int(value)
+                     for name, value in _span.findall(attrs)}
+            rowspan = spans.get('rowspan') or 1
+            for _ in range(spans.get('colspan') or 1):
+                texts.append(text)
+                if rowspan > 1:
+                    next_remainder.append((index, text, rowspan - 1))
+                index += 1
+        for prev_i, prev_text, prev_rowspan in remainder:
+            texts.append(prev_text)
+            if prev_rowspan > 1:
+                next_remainder.append((prev_i, prev_text, prev_rowspan - 1))
+        all_texts.append(texts)
+        remainder = next_remainder
+
+    while remainder and not overflow:
+        all_texts.append([text for _, text, _ in remainder])
+        remainder = [(i, text, rowspan - 1) for i, text, rowspan in remainder
+                     if rowspan > 1]
+    return all_texts, remainder
+
+
+def last_table(page):
+    """
+    returns (header, body) text rows of the last table on a page,
+    split into header, body and footer as pd.read_html does
+    (the footer is returned as part of the body)
+    """
+    tables = _table.findall(_hidden.sub('', page))
+    if not tables:
+        raise IndexError('no table found')
+    table = tables[-1]
+
+    sections = {'thead': [], 'tfoot': []}
+    for name, content in _section.findall(table):
+        sections[name.lower()].extend(_table_rows(content))
+    header_rows = sections['thead']
+    footer_rows = sections['tfoot']
+    body_rows = _table_rows(_section.sub('', table))
+    if not header_rows:
+        while body_rows and all(tag == 'th' for tag, _, _ in body_rows[0]):
+            header_rows.append(body_rows.pop(0))
+
+    header, remainder = _expand(header_rows, [], False)
+    body, remainder = _expand(body_rows, remainder, len(footer_rows) > 0)
+    footer, _ = _expand(footer_rows, remainder, False)
+    return header, body + footer
+
+
+class OverviewExtractor:
+    """
+    Reads the career table (the last table) of PL overview pages into
+    a columnar buffer of typed rows: Season, Club, Apps, Goals, Subs.
+
+    Rows match the previous pd.read_html route: the first column is
+    dropped, incomplete rows are skipped, "Apps (Subs)" is split in
+    two and repeated rows are dropped. Apps is kept as an int, where
+    pd.read_html left the text before the bracket.
+    """
+    fields = ['Season', 'Club', 'Apps', 'Goals', 'Subs']
+
+    def __init__(self):
+        self.clear()
+
+    def __len__(self):
+        return len(self.columns['player_id'])
+
+    def clear(self):
+        """empties the buffer"""
+        self.columns = {column: [] for column in ['player_id'] + self.fields}
+
+    def extract(self, overview_page, player_id):
+        """
+        adds a player's career rows to the buffer, returning how many.
+        Raises IndexError or ValueError, leaving the buffer unchanged,
+        if the page has no usable career table
+        """
+        _, body = last_table(overview_page)
+        rows = []
+        for texts in body:
+            if len(texts) > 5:
+                raise ValueError('career table has {} columns: {}'.format(
+                    len(texts), player_id))
+            season, club, apps, goals = (texts[1:] + [''] * 4)[:4]
+            if {season, club, apps, goals} & _missing:
+                continue
+            apps, subs = apps.split('(')  # ValueError unless one bracket
+            row = (season, club, int(apps), int(goals.replace(',', '')),
+                   int(subs.replace(')', '')))
+            if row not in rows:
+                rows.append(row)
+
+        self.columns['player_id'].extend([player_id] * len(rows))
+        for field, values in zip(self.fields, zip(*rows)):
+            self.columns[field].extend(values)
+        return len(rows)
+
+    def rows(self):
+        """buffered rows, as (player_id, Season, Club, Apps, Goals, Subs)"""
+        return zip(*self.columns.values())
+
+    def frame(self):
+        """buffered rows as a dataframe indexed by player id"""
+        return pd.DataFrame({field: self.columns[field]
+                             for field in self.fields},
+                            index=self.columns['player_id'])
+
+
+if __name__ == '__main__':
+    import io
+    import os
+    import sys
+    import time
+    from bs4 import BeautifulSoup
+    from premier import PremierData
+
+    def legacy_stats(stats_page, player_id, numeric_fields):
+        """previous PremierData._extract_fields_from_stats"""
+        soup = BeautifulSoup(stats_page, 'html.parser')
+        page_text = soup.get_text()
+        page_text = page_text.replace('\n', ' ')
+        page_text = page_text.replace('\r', ' ')
+        fields = {'player_id': player_id}
+        pattern_1 = r'{}\s+(\d+)'
+        for field in numeric_fields:
+            values = re.findall(pattern=pattern_1.format(field),
+                                flags=re.IGNORECASE,
+                                string=page_text)
+            fields[field] = 0 if len(values) == 0 else int(values[0])
+        pattern_2 = r'Club\s{4}(.+?)\s{2}Position\s(.+?)\s'
+        club_and_position = re.findall(pattern=pattern_2,
+                                       string=page_text)[0]
+        fields['Team'] = club_and_position[0]
+        fields['Position'] = club_and_position[1]
+        return fields
+
+    def legacy_overview(overview_page, player_id):
+        """previous PremierData._extract_data_from_overview"""
+        soup = BeautifulSoup(overview_page, 'html.parser')
+        tbl = soup.find_all('table')
+        df = pd.read_html(io.StringIO(str(tbl[-1])))[0]
+        del df['Unnamed: 0']
+        df.columns = ['Season', 'Club', 'Apps', 'Goals']
+        df.dropna(axis=0, how='all', inplace=True)
+        df.dropna(axis=0, how='any', inplace=True)
+        df[['Apps', 'Subs']] = df['Apps'].str.split('(', n=2, expand=True)
+        df.Subs = df.Subs.str.replace(')', '').astype(int)
+        df.drop_duplicates(inplace=True)
+        df.index = [player_id] * len(df)
+        return df
+
+    def stats_page(club, position, groups):
+        """
+        a stats page laid out as the PL site's: a sidebar of club and
+        position, then a block of stats per group of (name, value)
+        """
+        blocks = ''.join(
+            '<div class="statsListBlock">\n<div class="headerStat">{}'
+            '</div>\n{}</div>\n'.format(group, ''.join(
+                '<div class="normalStat"><span class="stat">{} '
+                '<span class="allStatContainer stat{}" data-stat="{}">\n'
+                '                    {}\n                </span>'
+                '</span></div>\n'.format(name, name.lower().replace(' ', ''),
+                                         name.lower(), value)
+                for name, value in stats))
+            for group, stats in groups)
+        return ('<!DOCTYPE html>\n<html><head><title>Player Stats</title>\n'
+                '<script type="text/javascript">var stats = {{"Goals": 99}};'
+                '</script>\n</head><body>\n'
+                '<section class="playerSidebar"><div class="info">\n'
+                '<div class="label">Club\n  </div>\n'
+                '<div class="info"><a href="/clubs/1/x/overview">{}</a>\n'
+                '</div>\n<div class="label">Position</div>\n'
+                '<div class="info">{}</div>\n</div></section>\n'
+                '<!-- Goals 42 -->\n<div class="playerStats">{}</div>\n'
+                '</body></html>'.format(club, position, blocks))
+
+    def overview_page(rows, footer=''):
+        """an overview page with a career table of the PL site's shape"""
+        body = ''.join(
+            '<tr class="table{}"><td class="expand"><button '
+            'class="expandable" data-toggle=">"></button></td>{}</tr>\n'
+            .format(' loan' if loan else '', ''.join(
+                '<td>{}</td>'.format(cell) for cell in cells))
+            for loan, cells in rows)
+        return ('<html><body>\n<table class="playerClubHistory">'
+                '<tr><td>Not the career table</td></tr></table>\n'
+                '<!-- <table><tr><td>commented out</td></tr></table> -->\n'
+                '<table>\n<thead><tr><th></th><th>Season</th><th>Club</th>'
+                '<th>Apps (Subs)</th><th>Goals</th></tr></thead>\n'
+                '<tbody>\n{}</tbody>{}\n</table>\n</body></html>'
+                .format(body, footer))
+
+    # pages covering what the site serves: outfield and goalkeeper
+    # stats, stats missing (no appearances), thousands separators,
+    # entities and stats inside scripts and comments
+    STATS_PAGES = [
+        (4101, stats_page('Arsenal', 'Forward', [
+            ('Attack', [('Goals', 61), ('Goals per match', '0.26'),
+                        ('Penalties scored', 4), ('Big chances missed', 33)]),
+            ('Team Play', [('Assists', 29), ('Passes', '4,815'),
+                           ('Big Chances Created', 41)]),
+            ('Discipline', [('Yellow cards', 12), ('Red cards', 1),
+                            ('Own goals', 2)]),
+            ('', [('Appearances', 236), ('Wins', 131), ('Losses', 55)])])),
+        (4102, stats_page('Brighton and Hove Albion', 'Goalkeeper', [
+            ('Goalkeeping', [('Saves', '1,204'), ('Penalties Saved', 5),
+                             ('Punches', 101), ('High Claims', 288)]),
+            ('Defence', [('Clean sheets', 84), ('Goals Conceded', '1,012'),
+                         ('Own goals', 1)]),
+            ('Discipline', [('Yellow cards', 9), ('Red cards', 0)]),
+            ('', [('Appearances', 322), ('Wins', 120), ('Losses', 130)])])),
+        (4103, stats_page('Cardiff City', 'Defender', [
+            ('Defence', [('Clean sheets', 0), ('Goals Conceded', 0)])])),
+        (4104, stats_page('Wolves &amp; Co&#39;s', 'Midfielder', [])),
+    ]
+    OVERVIEW_PAGES = [
+        (4101, overview_page([
+            (False, ['2017/2018', 'Arsenal', '33 (2)', '10']),
+            (False, ['2016/2017', 'Arsenal', '30 (12)', '8']),
+            (True, ['2015/2016', 'Fulham (Loan)', '12 (0)', '3']),
+            (True, ['2015/2016', 'Fulham (Loan)', '12 (0)', '3']),
+            (False, ['', '', '', '']),
+            (False, ['2014/2015', 'Arsenal', '', '1'])],
+            '<tfoot><tr><td colspan="3">Total</td><td>75 (14)</td>'
+            '<td>21</td></tr></tfoot>')),
+        (4102, overview_page([
+            (False, ['2017/2018', 'Brighton and Hove Albion', '38 (0)',
+                     '0']),
+            (False, ['2016/2017', 'Brighton &amp; Hove Albion', '0 (0)',
+                     '0'])])),
+    ]
+
+    def corpus(directory, kind):
+        """saved pages, as written by PremierData._save_player_pages"""
+        if not os.path.isdir(directory):
+            return []
+        suffix = '.{}.html'.format(kind)
+        pages = []
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(suffix):
+                with open(os.path.join(directory, name),
+                          encoding='utf-8') as f:
+                    pages.append((int(name.split('.')[0]), f.read()))
+        return pages
+
+    def benchmark(name, func, pages):
+        start = time.perf_counter()
+        results = [func(page, player_id) for player_id, page in pages]
+        elapsed = time.perf_counter() - start
+        print('{:>8}: {} pages, {:.1f} ms/page'.format(
+            name, len(pages), 1000 * elapsed / max(len(pages), 1)))
+        return results
+
+    def check_stats(pages):
+        extractor = StatsExtractor(fields)
+        for player_id, page in pages:
+            new = extractor.extract(page, player_id)
+            old = legacy_stats(page, player_id, fields)
+            assert list(new) == list(old), player_id
+            for field in old:
+                assert new[field] == old[field], (player_id, field,
+                                                  new[field], old[field])
+
+    def check_overview(pages):
+        for player_id, page in pages:
+            extractor = OverviewExtractor()
+            extractor.extract(page, player_id)
+            old = legacy_overview(page, player_id)
+            # pd.read_html left Apps as the text before the bracket
+            old['Apps'] = old['Apps'].str.strip().astype(int)
+            pd.testing.assert_frame_equal(extractor.frame(), old,
+                                          check_dtype=False)
+
+    print('Testing in progress...')
+    fields = PremierData.numeric_fields
+    check_stats(STATS_PAGES)
+    found = StatsExtractor(fields).extract(STATS_PAGES[1][1], 4102)
+    assert (found['Team'], found['Position']) == \
+           ('Brighton and Hove Albion', 'Goalkeeper')
+    # as before: digits up to the thousands separator, and the first
+    # "goals <digits>" (here in "Own goals 1") taken as Goals
+    assert (found['Goals Conceded'], found['Goals'], found['Assists']) == \
+           (1, 1, 0)
+    check_overview(OVERVIEW_PAGES)
+    extractor = OverviewExtractor()
+    assert extractor.extract(OVERVIEW_PAGES[0][1], 4101) == 4
+    assert len(extractor.frame()) == 4 and extractor.frame()['Apps'].sum() \
+           == 33 + 30 + 12 + 75
+
+    # a saved corpus, if there is one: 'python page_parsers.py [dir]'
+    directory = sys.argv[1] if len(sys.argv) > 1 else 'DataStore/pages'
+    pages = corpus(directory, 'stats')
+    check_stats(pages)
+    if pages:
+        benchmark('single', StatsExtractor(fields).extract, pages)
+        benchmark('legacy', lambda page, player_id:
+                  legacy_stats(page, player_id, fields), pages)
+    pages = corpus(directory, 'overview')
+    check_overview(pages)
+    if pages:
+        benchmark('table', OverviewExtractor().extract, pages)
+        benchmark('legacy', legacy_overview, pages)
+    print('Testing Complete')
@@ -0,0 +1,149 @@
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from league import project, select_fixtures
+
+# results of project with one value per fixture rather than per player
+FIXTURE_RESULTS = ['team_H_goalRate', 'team_A_goalRate']
+
+
+def _frozen(value):
+    if not isinstance(value, np.ndarray):
+        return value
+    value = value.copy()
+    value.flags.writeable = False
+    return value
+
+
+def freeze(inputs):
+    """
+    a copy of inputs with every array read-only, so no stage can change
+    them; the caller's arrays are left as they were
+    """
+    return type(inputs)(*[_frozen(value) for value in inputs])
+
+
+def partitions(inputs, by='event'):
+    """
+    splits inputs into independent groups of fixtures.
+
+    by: 'event' for one partition per gameweek, 'fixture' for one
+        per fixture
+    Returns a list of (fixture positions, inputs for those fixtures).
+    """
+    if by == 'fixture':
+        groups = [[f] for f in range(len(inputs.match_ids))]
+    elif by == 'event':
+        keys = pd.Series(inputs.event).fillna(-1)
+        groups = [list(index) for index in keys.groupby(keys).indices.values()]
+    else:
+        raise ValueError('unknown partition: {}'.format(by))
+    return [(np.array(group), select_fixtures(inputs, np.array(group)))
+            for group in groups]
+
+
+def _project(task):
+    """runs one partition; module level so worker processes can load it"""
+    key, positions, inputs = task
+    return key, positions, project(inputs)
+
+
+def merge(inputs, parts):
+    """
+    puts the results of each partition back into one dict of arrays,
+    in the fixture order of inputs, as project(inputs) returns them
+    """
+    merged = {}
+    for positions, results in parts:
+        for field, values in results.items():
+            if field not in merged:
+                shape = values.shape[:-1] + (len(inputs.match_ids),)
+                merged[field] = np.zeros(shape, dtype=values.dtype)
+            merged[field][..., positions] = values
+    return merged
+
+
+def run(scenarios, by='event', processes=None):
+    """
+    Projects several seasons or scenarios at once, splitting each
+    into independent partitions (see partitions) that run on a
+    process pool, then merging them back per scenario.
+
+    scenarios: dict of name: LeagueInputs
+    processes: worker processes; None or 1 runs in this process
+    Returns dict of name: results, each the same as project(inputs).
+    """
+    tasks = [(name, positions, part)
+             for name, inputs in scenarios.items()
+             for positions, part in partitions(freeze(inputs), by)]
+    if processes and processes > 1:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            done = list(executor.map(_project, tasks,
+                                     chunksize=max(1, len(tasks) //
+                                                   (4 * processes))))
+    else:
+        done = [_project(task) for task in tasks]
+
+    parts = {name: [] for name in scenarios}
+    for name, positions, results in done:
+        parts[name].append((positions, results))
+    return {name: merge(scenarios[name], parts[name]) for name in scenarios}
+
+
+def by_gameweek(inputs, results, field='finalPoints'):
+    """a player result summed per gameweek, as player code x event"""
+    values = np.where(results['playing'], results[field], 0)
+    df = pd.DataFrame(values, index=inputs.player_ids,
+                      columns=inputs.event)
+    return df.T.groupby(level=0).sum().T
+
+
+if __name__ == '__main__':
+    import os
+    import time
+    import synthetic
+    from league import build_inputs
+
+    print('Testing in progress...')
+    scenarios = {}
+    for seed in range(3):
+        data_dct, overview, fixtures = synthetic.league(seed=seed)
+        players, teams = synthetic.build(data_dct, overview, fixtures)
+        for advantage in [0.0, 0.05, 0.1]:
+            scenarios[(seed, advantage)] = build_inputs(
+                teams, fixtures, homeAdvantage=advantage)
+
+    start = time.perf_counter()
+    whole = {name: project(inputs) for name, inputs in scenarios.items()}
+    whole_time = time.perf_counter() - start
+
+    processes = os.cpu_count() or 1
+    for by in ['event', 'fixture']:
+        start = time.perf_counter()
+        serial = run(scenarios, by=by)
+        serial_time = time.perf_counter() - start
+        start = time.perf_counter()
+        pooled = run(scenarios, by=by, processes=max(2, processes))
+        pooled_time = time.perf_counter() - start
+
+        for name in scenarios:
+            for field, values in whole[name].items():
+                assert np.array_equal(serial[name][field], values), field
+                assert np.array_equal(pooled[name][field], values), field
+        print('{:>7}: serial {:.2f}s, {} processes {:.2f}s'.format(
+            by, serial_time, max(2, processes), pooled_time))
+
+    # the scenarios given to run are still the caller's to change
+    assert all(value.flags.writeable for inputs in scenarios.values()
+               for value in inputs if isinstance(value, np.ndarray))
+    frozen = freeze(scenarios[(0, 0.0)])
+    assert not frozen.app_rate.flags.writeable
+    assert scenarios[(0, 0.0)].app_rate.flags.writeable
+
+    name = (0, 0.05)
+    weeks = by_gameweek(scenarios[name], whole[name])
+    assert np.allclose(weeks.sum(axis=1),
+                       whole[name]['finalPoints'].sum(axis=1))
+    print('{} scenarios, whole season each: {:.2f}s in one process'.format(
+        len(scenarios), whole_time))
+    print('Testing Complete')
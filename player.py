@@ -1,10 +1,32 @@
+import numpy as np
 import pandas as pd
+import poisson
+from fixture_index import FixtureIndex
 from math import exp, factorial
 from datetime import datetime, timedelta
 
+
+class SourceRow:
+    """
+    One player's row of a shared merged-data frame, read on demand,
+    so players don't each hold a copy of every column.
+    """
+    __slots__ = ('frame', 'key')
+
+    def __init__(self, frame, key):
+        self.frame = frame
+        self.key = key
+
+    def __getitem__(self, column):
+        value = self.frame.at[self.key, column]
+        # plain python values, so dividing by 0 raises as it does for dicts
+        return value.item() if hasattr(value, 'item') else value
+
+
 class Player:
     latest = 2018
     season_length = 38
+    gameweeks = season_length
     assistPoints = 3
     yellowPoints = -1
     redPoints = -3
@@ -12,9 +34,28 @@ class Player:
     plus60Points = 2
     sub60Points = 1
 
+    # columns of the merged FPL/PL data used by the model, and the
+    # attribute each is kept in; all other columns are read lazily
+    fields = {'code': 'code',
+              'team': 'team',
+              'Team': 'Team',
+              'element_type': 'element_type',
+              'status': 'status',
+              'chance_of_playing_next_round': 'chance_of_playing_next_round',
+              'Goals': 'Goals',
+              'Appearances': 'Appearances',
+              'Assists': 'Assists',
+              'Yellow Cards': 'yellowCards',
+              'Red Cards': 'redCards',
+              'Own Goals': 'ownGoals',
+              'Goals Conceded': 'goalsConceded'}
+
+    __slots__ = tuple(fields.values()) + (
+        'source', 'matches', 'overview', 'games_played', 'goalsPerMatch',
+        'assistsPerMatch', 'Position', 'appRate', 'subRate', 'startRate',
+        'P_red', 'P_yellow', 'P_ownGoal')
+
     def __init__(self, data, overview, fixtures):
-        self.latest = Player.latest
-        self.gameweeks = Player.season_length
         self._convert_data_to_attr(data)
         self.matches = self._extract_matches(fixtures)
         self.overview = self._extract_overview(overview)
@@ -25,17 +66,24 @@ class Player:
         self.probability_of_appearance()
         self.cards()
         self.calc_own_goals()
-        self.assistPoints = Player.assistPoints
-        self.yellowPoints = Player.yellowPoints
-        self.redPoints = Player.redPoints
-        self.owngoalPoints = Player.owngoalPoints
-        self.plus60Points = Player.plus60Points
-        self.sub60Points = Player.sub60Points
 
     def _convert_data_to_attr(self, data):
-        """Converts data (dict) to object attributes"""
-        for k, v in data.items():
-            setattr(self, k, v)
+        """
+        Keeps the fields used by the model as attributes.
+        data (dict or SourceRow) is kept to look up any other column.
+        """
+        self.source = data
+        for column, attr in self.fields.items():
+            setattr(self, attr, data[column])
+
+    def __getattr__(self, name):
+        """reads columns not used by the model from the source data"""
+        if name == 'source':
+            raise AttributeError(name)
+        try:
+            return self.source[name]
+        except KeyError:
+            raise AttributeError(name) from None
 
     def _extract_overview(self, df):
         """extracts apps, subs and goals per season and
@@ -61,10 +109,13 @@ class Player:
         return dct
         
 
-    def _extract_matches(self, df):
-        # df.set_index('id', inplace=True)
-        mask = (df['team_h'] == self.team) | (df['team_a'] == self.team)
-        return df[mask].to_dict('index')
+    def _extract_matches(self, fixtures):
+        """
+        per-player views of the team's fixtures, from an index shared
+        by every player built from the same fixtures (a dataframe, or
+        a FixtureIndex built from one)
+        """
+        return FixtureIndex.of(fixtures).matches(self.team)
 
     def _get_games_played(self):
         count = 0
@@ -117,6 +168,8 @@ class Player:
         self.appRate = app_rate
         sub_rate = subs / total if total != 0 else 0
         start_rate = (apps - subs) / total if total != 0 else 0
+        self.subRate = sub_rate
+        self.startRate = start_rate
         for k,v in self.matches.items(): 
             kickoff_time = self.matches[k]['kickoff_time']
             kickoff_date = kickoff_time.split('T')[0]
@@ -126,6 +179,21 @@ class Player:
             self.matches[k]['probSub'] = prob * sub_rate
             self.matches[k]['probStart'] = prob * start_rate
 
+    def update_news(self, status, chance_of_playing_next_round):
+        """
+        takes a new status and chance of playing, and recomputes the
+        appearance probabilities of each match.
+        Returns the ids of the matches whose probabilities changed
+        """
+        keys = ['probAppearance', 'probSub', 'probStart']
+        before = {k: [v[key] for key in keys]
+                  for k, v in self.matches.items()}
+        self.status = status
+        self.chance_of_playing_next_round = chance_of_playing_next_round
+        self.probability_of_appearance()
+        return [k for k, v in self.matches.items()
+                if [v[key] for key in keys] != before[k]]
+
     def check_news(self):
         today = datetime.today()
         chance = self.chance_of_playing_next_round / 100
@@ -174,22 +242,23 @@ class Player:
         Distribution to determine probability of getting 1 or 2 cards.
         2 cards can be assumed to be the equivilent of a Red card.
         """
-        yellows = getattr(self, 'Yellow Cards')
-        reds = getattr(self, 'Red Cards')
+        yellows = self.yellowCards
+        reds = self.redCards
         total = yellows + reds
 
         try:
             l = total / self.Appearances
         except ZeroDivisionError:
             l = 0
-        self.P_red = self.poisson(l, 2)
-        self.P_yellow = self.poisson(l, 1)
+        pmf = poisson.pmf_table(l, 2)
+        self.P_red = pmf[2]
+        self.P_yellow = pmf[1]
 
     def calc_own_goals(self):
         """
         Determines probability for scoring an own goal
         """
-        own = getattr(self, 'Own Goals')
+        own = self.ownGoals
         try:
             P_ownGoal = own / self.Appearances
         except ZeroDivisionError:
@@ -197,7 +266,6 @@ class Player:
         self.P_ownGoal = P_ownGoal
         
     def actual_goals_per_match(self):
-        delattr(self, 'Goals Per Match')
         try:
             return self.Goals / self.Appearances
         except ZeroDivisionError:
@@ -219,8 +287,8 @@ class Player:
 
     def probability_of_goals(self, match_id, weight, X=3):
         l = self.goalsPerMatch * weight
-        f = self.poisson
-        probGoalScored = [(x, f(l,x)) for x in range(X+1)]
+        pmf = poisson.pmf_table(l, X)
+        probGoalScored = [(x, pmf[x]) for x in range(X+1)]
         return probGoalScored
 
     def add_match_data(self, match_id, key, data):
@@ -229,23 +297,42 @@ class Player:
     def get_match_data(self, match_id, key):
         return self.matches[match_id][key]
 
-    def _resolve(self, *funcs):
-        for match_id, match in self.matches.items():
-            if match['finished'] == True:
-                continue
-            points = sum([f(match) for f in funcs])
-            points *= match['probAppearance']
-            self.matches[match_id]['initialPoints'] = points
+    @staticmethod
+    def _values(matches, key):
+        """array of one match key across a list of matches"""
+        return np.array([match[key] for match in matches], dtype=float)
 
-    def time_played(self, match):
+    def _score(self, key, funcs, match_ids=None):
+        """
+        Sums points from each scoring function for every unfinished match
+        (or just those in match_ids) and saves them under key. Scoring
+        functions take the list of matches and return an array of points
+        (or one value for all).
+        """
+        if match_ids is None:
+            match_ids = self.matches
+        match_ids = [match_id for match_id in match_ids
+                     if self.matches[match_id]['finished'] != True]
+        matches = [self.matches[match_id] for match_id in match_ids]
+        if not matches:
+            return
+        points = sum([f(matches) for f in funcs])
+        points = points * self._values(matches, 'probAppearance')
+        for match_id, value in zip(match_ids, points):
+            self.matches[match_id][key] = float(value)
+
+    def _resolve(self, *funcs, match_ids=None):
+        self._score('initialPoints', funcs, match_ids)
+
+    def time_played(self, matches):
         """estimate over/under 60mins based on whether started match 
         or was a sub"""
-        start = match['probStart'] * self.plus60Points
-        sub = match['probSub'] * self.sub60Points
+        start = self._values(matches, 'probStart') * self.plus60Points
+        sub = self._values(matches, 'probSub') * self.sub60Points
         return start + sub
 
-    def goal_assists(self, match):
-        return match['assistRate'] * self.assistPoints
+    def goal_assists(self, matches):
+        return self._values(matches, 'assistRate') * self.assistPoints
 
     def card_points(self, _):
         reds = self.P_red * self.redPoints
@@ -255,76 +342,65 @@ class Player:
     def own_goal_points(self, _):
         return self.P_ownGoal * self.owngoalPoints
 
-    def goal_points(self, match):
-        P = lambda x: self.poisson(match['goalRate'], x)
-        return self.goalPoints * sum([P(x)*x for x in [1,2,3,4,5]])
+    def goal_points(self, matches):
+        goalRate = self._values(matches, 'goalRate')
+        return self.goalPoints * poisson.expected_count(goalRate, 5)
             
-    def clean_sheet(self, match):
-        return self.poisson(match['probConcede'], 0) * self.cleanPoints
-
-    def conceded(self, match):
-        return self.poisson(match['probConcede'], 2, eq='gte') \
-                                                    * self.concededPoints 
-
-    def resolve_BPS(self, match_id):
-        match = self.matches[match_id]
-        initial = match['initialPoints']
-        rank = match['BPSrank']
-        bps = 0 if rank > 3 else 4 - rank
-        # improved by spreading BPS across players
-        bps *= self.probAppearance(match_id)
-        match['finalPoints'] = initial + bps
-
-    def _calculate_BPS(self, *funcs):
-        for match_id, match in self.matches.items():
-            if match['finished'] == True:
-                continue
-            points = sum([f(match) for f in funcs])
-            points *= match['probAppearance']
-            self.matches[match_id]['bonusPoints'] = points
-
-    def BPS_goal_points(self, match):
-        P = lambda x: self.poisson(match['goalRate'], x)
-        return self.BPSgoalPoints * sum([P(x)*x for x in [1,2,3,4,5]])
-
-    def BPS_clean_sheet(self, match):
-        return self.poisson(match['probConcede'], 0) * self.BPScleanPoints
+    def clean_sheet(self, matches):
+        probConcede = self._values(matches, 'probConcede')
+        return poisson.pmf_table(probConcede, 0)[:, 0] * self.cleanPoints
+
+    def conceded(self, matches):
+        probConcede = self._values(matches, 'probConcede')
+        return poisson.at_least(probConcede, 2) * self.concededPoints 
+
+    def _calculate_BPS(self, *funcs, match_ids=None):
+        self._score('bonusPoints', funcs, match_ids)
+
+    def BPS_goal_points(self, matches):
+        goalRate = self._values(matches, 'goalRate')
+        return self.BPSgoalPoints * poisson.expected_count(goalRate, 5)
+
+    def BPS_clean_sheet(self, matches):
+        probConcede = self._values(matches, 'probConcede')
+        return poisson.pmf_table(probConcede, 0)[:, 0] * self.BPScleanPoints
 
 
 class GoalKeeper(Player):
     goalPoints = 6
     cleanPoints = 4
     concededPoints = -1
+    BPSgoalPoints = 12
+    BPScleanPoints = 12
+
+    __slots__ = ('concededPerMatch',)
     
     def __init__(self, data, overview, fixtures):
         super().__init__(data, overview, fixtures)
         self.concededPerMatch = self._calculate_concede_rate()
-        self.goalPoints = GoalKeeper.goalPoints
-        self.cleanPoints = GoalKeeper.cleanPoints
-        self.concededPoints = GoalKeeper.concededPoints
-        self.BPSgoalPoints = 12
-        self.BPScleanPoints = 12
         
     def _calculate_concede_rate(self):
-        conceded = getattr(self, 'Goals Conceded')
-        appearances = getattr(self, 'Appearances')
+        conceded = self.goalsConceded
+        appearances = self.Appearances
         try:
             return conceded / appearances
         except ZeroDivisionError:
             return 0
     
-    def resolve(self):
+    def resolve(self, match_ids=None):
         self._resolve(self.time_played, 
                       self.goal_assists, 
                       self.card_points,
                       self.own_goal_points,
                       self.goal_points,
                       self.clean_sheet,
-                      self.conceded)
+                      self.conceded,
+                      match_ids=match_ids)
 
-    def calculate_BPS(self):
+    def calculate_BPS(self, match_ids=None):
         self._calculate_BPS(self.BPS_goal_points,
-                            self.BPS_clean_sheet)
+                            self.BPS_clean_sheet,
+                            match_ids=match_ids)
 
     def __eq__(self, compare):
         if compare == 'GoalKeeper':
@@ -334,21 +410,21 @@ class GoalKeeper(Player):
         
 class Forward(Player):
     goalPoints = 4
-    
-    def __init__(self, data, overview, fixtures):
-        super().__init__(data, overview, fixtures)
-        self.goalPoints = Forward.goalPoints
-        self.BPSgoalPoints = 24
+    BPSgoalPoints = 24
+
+    __slots__ = ()
 
-    def resolve(self):
+    def resolve(self, match_ids=None):
         self._resolve(self.time_played, 
                       self.goal_assists, 
                       self.card_points,
                       self.own_goal_points,
-                      self.goal_points)
+                      self.goal_points,
+                      match_ids=match_ids)
 
-    def calculate_BPS(self):
-        self._calculate_BPS(self.BPS_goal_points)
+    def calculate_BPS(self, match_ids=None):
+        self._calculate_BPS(self.BPS_goal_points,
+                            match_ids=match_ids)
 
     def __eq__(self, compare):
         if compare == 'Forward':
@@ -359,23 +435,22 @@ class Forward(Player):
 class Midfielder(Player):
     goalPoints = 5
     cleanPoints = 1
-    
-    def __init__(self, data, overview, fixtures):
-        super().__init__(data, overview, fixtures)
-        self.goalPoints = Midfielder.goalPoints
-        self.cleanPoints = Midfielder.cleanPoints
-        self.BPSgoalPoints = 18
+    BPSgoalPoints = 18
 
-    def resolve(self):
+    __slots__ = ()
+
+    def resolve(self, match_ids=None):
         self._resolve(self.time_played, 
                       self.goal_assists, 
                       self.card_points,
                       self.own_goal_points,
                       self.goal_points,
-                      self.clean_sheet)
+                      self.clean_sheet,
+                      match_ids=match_ids)
     
-    def calculate_BPS(self):
-        self._calculate_BPS(self.BPS_goal_points)
+    def calculate_BPS(self, match_ids=None):
+        self._calculate_BPS(self.BPS_goal_points,
+                            match_ids=match_ids)
 
     def __eq__(self, compare):
         if compare == 'Midfielder':
@@ -388,40 +463,82 @@ class Defender(Player):
     goalPoints = 6
     cleanPoints = 4
     concededPoints = -1
+    BPSgoalPoints = 12
+    BPScleanPoints = 12
+
+    __slots__ = ('concededPerMatch',)
     
     def __init__(self, data, overview, fixtures):
         super().__init__(data, overview, fixtures)
         self.concededPerMatch = self._calculate_concede_rate()
-        self.goalPoints = Defender.goalPoints
-        self.cleanPoints = Defender.cleanPoints
-        self.concededPoints = Defender.concededPoints
-        self.BPSgoalPoints = 12
-        self.BPScleanPoints = 12
 
     def _calculate_concede_rate(self):
-        conceded = getattr(self, 'Goals Conceded')
-        appearances = getattr(self, 'Appearances')
+        conceded = self.goalsConceded
+        appearances = self.Appearances
         try:
             return conceded / appearances
         except ZeroDivisionError:
             return 0
         
 
-    def resolve(self):
+    def resolve(self, match_ids=None):
         self._resolve(self.time_played, 
                       self.goal_assists, 
                       self.card_points,
                       self.own_goal_points,
                       self.goal_points,
                       self.clean_sheet,
-                      self.conceded)
+                      self.conceded,
+                      match_ids=match_ids)
 
-    def calculate_BPS(self):
+    def calculate_BPS(self, match_ids=None):
         self._calculate_BPS(self.BPS_goal_points,
-                            self.BPS_clean_sheet)
+                            self.BPS_clean_sheet,
+                            match_ids=match_ids)
 
     def __eq__(self, compare):
         if compare == 'Defender':
             return True
         else:
-            return False
\ No newline at end of file
+            return False
+
+if __name__ == '__main__':
+    import tracemalloc
+    import synthetic
+
+    class Legacy(Midfielder):
+        """previous layout: every merged column in the instance dict"""
+        def _convert_data_to_attr(self, data):
+            super()._convert_data_to_attr(data)
+            self.__dict__.update(data)
+
+    def footprint(build):
+        tracemalloc.start()
+        players = build()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return players, size / 2**20
+
+    print('Testing in progress...')
+    data_dct, overview, fixtures = synthetic.league()
+    for data in data_dct.values():  # pad out to the 60+ merged columns
+        data.update({'fpl_{}'.format(n): n * 0.5 for n in range(45)})
+    allData = pd.DataFrame.from_dict(data_dct, orient='index')
+    overviews = {player: overview.loc[[player]] for player in data_dct}
+
+    legacy, legacy_size = footprint(lambda: [
+        Legacy(dict(data), overviews[player], fixtures)
+        for player, data in data_dct.items()])
+    compact, compact_size = footprint(lambda: [
+        Midfielder(SourceRow(allData, player), overviews[player], fixtures)
+        for player in data_dct])
+
+    for old, new in zip(legacy, compact):
+        assert old.goalsPerMatch == new.goalsPerMatch
+        assert old.P_red == new.P_red
+        assert old.fpl_44 == new.fpl_44 == 22
+        assert old.matches == new.matches
+    assert not hasattr(compact[0], '__dict__')
+    print('{} players: legacy {:.1f} MB, compact {:.1f} MB'.format(
+        len(compact), legacy_size, compact_size))
+    print('Testing Complete')
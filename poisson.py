@@ -0,0 +1,85 @@
+import numpy as np
+
+
+def pmf_table(rates, kmax):
+    """
+    Poisson probabilities of 0 to kmax events, for any array of rates.
+
+    Input:
+    - rates -- lambda for each distribution (scalar or array)
+    - kmax -- largest number of events to tabulate
+
+    Returns array of shape rates.shape + (kmax + 1,), where
+    table[..., k] is the probability of exactly k events.
+    """
+    rates = np.asarray(rates, dtype=float)
+    k = np.arange(1, kmax + 1)
+    table = np.empty(rates.shape + (kmax + 1,))
+    table[..., 0] = 1
+    # l**k / k! built up as a running product of l / k
+    table[..., 1:] = np.cumprod(rates[..., None] / k, axis=-1)
+    table *= np.exp(-rates)[..., None]
+    return table
+
+
+def cdf_table(rates, kmax):
+    """probabilities of at most 0 to kmax events (cumulative pmf)"""
+    return np.cumsum(pmf_table(rates, kmax), axis=-1)
+
+
+def at_least(rates, k):
+    """probability of k or more events"""
+    if k == 0:
+        return np.ones(np.shape(rates))
+    return 1 - cdf_table(rates, k - 1)[..., k - 1]
+
+
+def expected_count(rates, kmax=5):
+    """expected number of events, counting only outcomes up to kmax"""
+    table = pmf_table(rates, kmax)
+    # added up one k at a time (not with @), so every rate gets the
+    # same rounding however many are passed in
+    count = np.zeros(table.shape[:-1])
+    for k in range(1, kmax + 1):
+        count += table[..., k] * k
+    return count
+
+
+if __name__ == '__main__':
+    import time
+    from player import Player
+
+    print('Testing in progress...')
+    rng = np.random.default_rng(0)
+    rates = np.concatenate([[0, 1e-9, 0.5, 1, 3.5], rng.gamma(2, 0.4, 500)])
+
+    # parity with the scalar Player.poisson
+    f = Player.poisson
+    pmf = pmf_table(rates, 5)
+    for i, l in enumerate(rates):
+        for x in range(6):
+            assert np.isclose(pmf[i, x], f(l, x), rtol=1e-12, atol=0)
+            assert np.isclose(cdf_table(l, x)[x], f(l, x, eq='lte'),
+                              rtol=1e-12, atol=1e-15)
+            assert np.isclose(at_least(l, x), f(l, x, eq='gte'),
+                              rtol=1e-12, atol=1e-15)
+        goals = sum([f(l, x) * x for x in [1, 2, 3, 4, 5]])
+        assert np.isclose(expected_count(l), goals, rtol=1e-12, atol=0)
+
+    # benchmark: goal, clean sheet and conceded terms for a whole league
+    league = rng.gamma(2, 0.4, (600, 38))
+    start = time.perf_counter()
+    scalar = [[(sum([f(l, x) * x for x in [1, 2, 3, 4, 5]]),
+                f(l, 0), f(l, 2, eq='gte')) for l in row] for row in league]
+    scalar_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    table = pmf_table(league, 5)
+    batched = (table @ np.arange(6), table[..., 0],
+               1 - table[..., :2].sum(axis=-1))
+    batched_time = time.perf_counter() - start
+
+    assert np.allclose(np.array(scalar), np.stack(batched, axis=-1))
+    print('600 players x 38 fixtures: scalar {:.3f}s, batched {:.4f}s'
+          .format(scalar_time, batched_time))
+    print('Testing Complete')
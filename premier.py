@@ -1,9 +1,13 @@
+import os
 import time
-import requests
 import re
 import pandas as pd
-import selenium.webdriver as webdriver
-from bs4 import BeautifulSoup
+from stream import ChunkedCSVWriter
+from column_store import ColumnStore
+# requests, selenium and the page parsers are imported where the data
+# is scraped, so reading the DataStore doesn't pay for them
+
+FETCH_ATTEMPTS = 3  # passes over players whose pages failed to download
 
 class PremierData:
     numeric_fields = ['Wins', 
@@ -22,15 +26,60 @@ class PremierData:
                       'Red Cards']
 
     
-    def __init__(self):
+    def __init__(self, concurrency=1, rate=1, index_mode='http', lazy=False):
         self.player_url = 'https://www.premierleague.com/players/'
+        self.index_url = self.player_url + '?page={page}'
         self.indexDir = 'DataStore/players.index.csv' 
         self.statsDir = 'DataStore/players.stats.csv' 
         self.overviewDir = 'DataStore/players.overview.csv'
+        self.failedDir = 'DataStore/players.failed'
+        self.store = ColumnStore('DataStore/columns')  # binary copies
         self.driver = 'chromedriver'
+        self.concurrency = concurrency  # 1 = original sequential scrape
+        self.rate = rate  # requests per second across all workers
+        self.index_mode = index_mode  # 'http', or 'browser' for Selenium
         self.numeric_fields = PremierData.numeric_fields
-        self.df_linkingIndex = self._get_index_data()
-        self._get_all_player_stats()
+        self.pagesDir = 'DataStore/pages'
+        self.lazy = lazy  # read each table on first use, not here
+        self._stats_extractor = None
+        self._overview_extractor = None
+        self._tables = {}
+        if not lazy:  # read everything now, as before
+            self.df_linkingIndex
+            self.df_allStats
+
+    @property
+    def df_linkingIndex(self):
+        """PL player id to FPL code"""
+        if 'index' not in self._tables:
+            self._tables['index'] = self._get_index_data()
+        return self._tables['index']
+
+    @property
+    def df_allStats(self):
+        if 'stats' not in self._tables:
+            self._get_all_player_stats()
+        return self._tables['stats']
+
+    @property
+    def df_allOverview(self):
+        if 'overview' not in self._tables:
+            self._get_all_player_stats()
+        return self._tables['overview']
+
+    @property
+    def stats_extractor(self):
+        if self._stats_extractor is None:
+            from page_parsers import StatsExtractor
+            self._stats_extractor = StatsExtractor(self.numeric_fields)
+        return self._stats_extractor
+
+    @property
+    def overview_extractor(self):
+        if self._overview_extractor is None:
+            from page_parsers import OverviewExtractor
+            self._overview_extractor = OverviewExtractor()
+        return self._overview_extractor
 
     def refresh(self, which='all', limit=False):
         """load from url and refresh object"""
@@ -39,15 +88,15 @@ class PremierData:
             self._convert_index_to_csv(self._player_lst)
         if which =='players' or which =='all':
             self._process_all_player_stats()
-        self.__init__()
+        self.__init__(self.concurrency, self.rate, self.index_mode, self.lazy)
 
     def _get_index_data(self):
         """returns PL data as a Dictionary"""
         try:
-            df = pd.read_csv(self.indexDir, index_col='player_id')
-            return df
+            return self._read_table('players.index', self.indexDir)
         except FileNotFoundError:
             self.refresh(which='index')
+            return self._read_table('players.index', self.indexDir)
 
     def _convert_index_to_csv(self, player_lst):
         """cleans up fetched index data and saves locally as CSV"""
@@ -64,11 +113,35 @@ class PremierData:
         
         
     def _fetch_index_data(self):
+        """
+        returns (player href, FPL id) for all current league players,
+        paging through the players listing over plain HTTP and falling
+        back to the browser scrape if that finds no players
+        """
+        if self.index_mode == 'http':
+            import requests
+            from fetch import Fetcher
+            from index_discovery import discover_players
+            fetcher = Fetcher(concurrency=self.concurrency, rate=self.rate)
+            try:
+                player_lst = discover_players(self.index_url, fetcher)
+            except requests.RequestException as error:
+                print('index over http failed: {}'.format(error))
+                player_lst = []
+            finally:
+                fetcher.close()
+            if player_lst:
+                return player_lst
+            print('no players found over http, using the browser')
+        return self._fetch_index_with_browser()
+
+    def _fetch_index_with_browser(self):
         """
         1. Visits Premier League players page
         2. Scrolls to the bottom to force all current league players to load
         3. Scrapes all player links and FPL IDs for future linking
         """
+        import selenium.webdriver as webdriver
 
         if self.driver == 'chromedriver':
             browser = webdriver.Chrome(executable_path=self.driver)
@@ -107,114 +180,227 @@ class PremierData:
         return player_lst
 
 
+    def _player_urls(self, player_id):
+        """returns stats and overview urls, given url player id"""
+        return {'stats': self.player_url + 
+                         '{}/player/stats'.format(player_id),
+                'overview': self.player_url + 
+                            '{}/player/overview'.format(player_id)}
+
     def _fetch_player_stats(self, player_id):
         """downloads individual player stats from PL, given url player id"""
-
-        stats_url    = self.player_url + \
-                                '{}/player/stats'.format(player_id)
-
-        overview_url = self.player_url + \
-                                '{}/player/overview'.format(player_id)
+        import requests
+        urls = self._player_urls(player_id)
         
         time.sleep(1)  # Prevent accidently bombarding PL with requests
-        stats_request = requests.get(stats_url)
+        stats_request = requests.get(urls['stats'])
         stats_page = stats_request.text
         status_code_stats = stats_request.status_code
 
         time.sleep(1)  # Prevent accidently bombarding PL with requests 
-        overview_request = requests.get(overview_url)  
+        overview_request = requests.get(urls['overview'])  
         overview_page = overview_request.text
-        status_code_overview = overview_requests.status_code
+        status_code_overview = overview_request.status_code
 
-        if stats_request != 200 or overview_request != 200:
+        if status_code_stats != 200 or status_code_overview != 200:
             input('{}: {} (stats) & {} (overview)'.format(player_id, 
-                                                          stats_request, 
-                                                          overview_request) )
+                                                          status_code_stats, 
+                                                          status_code_overview) )
 
 
         return {'stats': stats_page, 'overview': overview_page}
 
+    def _fetch_all_player_stats(self, player_ids):
+        """
+        downloads stats and overview pages for every player id,
+        yielding (player_id, pages) in index order.
+        pages is an exception instead if either download failed
+        """
+        from fetch import Fetcher
+        fetcher = Fetcher(concurrency=self.concurrency, rate=self.rate)
+        try:
+            jobs = ((player_id, self._player_urls(player_id)) 
+                    for player_id in player_ids)
+            yield from fetcher.fetch_all(jobs)
+        finally:
+            fetcher.close()
 
-    def _extract_fields_from_stats(self, stats_page, player_id):
-        """extracts required fields from downloaded player stats"""
 
-        soup = BeautifulSoup(stats_page, 'html.parser')
-        page_text = soup.get_text()
-        page_text = page_text.replace('\n', ' ')
-        page_text = page_text.replace('\r', ' ')
-        
-        fields = {'player_id': player_id}
-
-        pattern_1 = r'{}\s+(\d+)'
-        for field in self.numeric_fields:
-            values = re.findall(pattern=pattern_1.format(field), 
-                                flags=re.IGNORECASE, 
-                                string=page_text)
-            # only certain stats come through for different positions
-            fields[field] = 0 if len(values) == 0 else int(values[0])
-            
-        pattern_2 = r'Club\s{4}(.+?)\s{2}Position\s(.+?)\s'
-        club_and_position = re.findall(pattern=pattern_2, 
-                                       string=page_text)[0]
-        fields['Team'] = club_and_position[0]
-        fields['Position'] = club_and_position[1]
+    def _save_player_pages(self, player_ids, directory=None):
+        """
+        downloads pages for player ids and saves them as they are,
+        for benchmarking and checking the parsers offline
+        """
+        directory = self.pagesDir if directory is None else directory
+        os.makedirs(directory, exist_ok=True)
+        for player_id, pages in self._fetch_all_player_stats(player_ids):
+            if isinstance(pages, Exception):
+                print('error: {} ({})'.format(player_id, pages))
+                continue
+            for kind, page in pages.items():
+                loc = os.path.join(directory, 
+                                   '{}.{}.html'.format(player_id, kind))
+                with open(loc, 'w', encoding='utf-8') as f:
+                    f.write(page)
 
-        return fields
+    def _extract_fields_from_stats(self, stats_page, player_id):
+        """extracts required fields from downloaded player stats"""
+        return self.stats_extractor.extract(stats_page, player_id)
 
     def _extract_data_from_overview(self, overview_page, player_id):
-        """extracts require data from downloaded player overview"""
-
-        soup = BeautifulSoup(overview_page, 'html.parser')
-
-        tbl = soup.find_all('table')
-        df = pd.read_html(str(tbl[-1]))[0]
-        del df['Unnamed: 0']
-        df.columns = ['Season', 'Club', 'Apps', 'Goals']
-        df.dropna(axis=0, how='all', inplace=True)
-        df.dropna(axis=0, how='any', inplace=True)
-
-        df[['Apps', 'Subs']] = df['Apps'].str.split('(', 2, expand=True)
-        df.Subs = df.Subs.str.replace(')', '').astype(int)
-        df.drop_duplicates(inplace=True)
-        df.index = [player_id] * len(df)
-
-        return df
+        """
+        extracts require data from downloaded player overview, with the
+        extractor the scrape uses, emptied again once read
+        """
+        extractor = self.overview_extractor
+        try:
+            extractor.extract(overview_page, player_id)
+            return extractor.frame()
+        finally:
+            extractor.clear()
 
     def _get_all_player_stats(self):
         """returns complete overview and stats dataframes"""
         try:
-            self.df_allStats = pd.read_csv(self.statsDir, 
-                                           index_col='player_id')
-            self.df_allOverview = pd.read_csv(self.overviewDir, 
-                                              index_col='player_id')
+            stats = self._read_table('players.stats', self.statsDir)
+            overview = self._read_table('players.overview', self.overviewDir)
         except FileNotFoundError:
             self.refresh(which='players')
+            stats = self._read_table('players.stats', self.statsDir)
+            overview = self._read_table('players.overview', self.overviewDir)
+        self._tables['stats'] = stats
+        self._tables['overview'] = overview
+
+    def _read_table(self, name, fileDir):
+        """
+        returns a CSV from the DataStore, read from its binary copy
+        unless the CSV has changed since the copy was made
+        """
+        return self.store.load(
+            name, fileDir, lambda: pd.read_csv(fileDir,
+                                               index_col='player_id'))
 
     def _process_all_player_stats(self):
-        """loops through index, extracts all player stats and combines"""
-        first= True
-        for player_id in self.df_linkingIndex.index:
-            try:
+        """
+        loops through index, extracts all player stats and streams them
+        to the DataStore as it goes.
+        Rows are written to .part files until the whole index is done,
+        so a refresh that is interrupted resumes where it stopped.
+        Each player is committed as soon as it is parsed (the writers
+        hold a chunk of one row), so even a run killed outright only
+        fetches again the player it was working on.
+        Players whose pages failed to download are tried again, up to
+        FETCH_ATTEMPTS passes in all; if any still fail, the .part
+        files are left in place, for the next refresh to resume, and
+        ConnectionError is raised rather than saving the stats without
+        them
+        """
+        stats_part = self.statsDir + '.part'
+        overview_part = self.overviewDir + '.part'
+        done = self._read_checkpoint(stats_part, header=True) | \
+               self._read_checkpoint(self.failedDir)
+        remaining = [player_id for player_id in self.df_linkingIndex.index
+                     if player_id not in done]
+        if done:
+            print('resuming: {} players already done'.format(len(done)))
+
+        stats = ChunkedCSVWriter(stats_part, ['player_id', 'player_id'] + 
+                                 self.numeric_fields + ['Team', 'Position'],
+                                 chunk_size=1)
+        overview = ChunkedCSVWriter(overview_part, ['player_id', 'Season', 
+                                    'Club', 'Apps', 'Goals', 'Subs'],
+                                    chunk_size=1)
+        for attempt in range(FETCH_ATTEMPTS):
+            if attempt:
+                print('retrying {} players'.format(len(remaining)))
+            remaining = self._scrape_players(remaining, stats, overview)
+            if not remaining:
+                break
+        else:
+            raise ConnectionError(
+                '{} players could not be downloaded ({}); refresh again '
+                'to retry them'.format(len(remaining), remaining[:10]))
+
+        self._finish_player_stats(stats_part, overview_part)
+
+    def _scrape_players(self, player_ids, stats, overview):
+        """
+        downloads, parses and commits the players in player_ids.
+        Returns the ids of players whose pages failed to download,
+        which aren't checkpointed
+        """
+        failed = []
+        try:
+            all_pages = self._fetch_all_player_stats(player_ids)
+            for player_id, pages in all_pages:
                 print(player_id)
-                pages = self._fetch_player_stats(player_id)
-                player_stats = self._extract_fields_from_stats(
-                    pages['stats'], player_id)
-                player_overview = self._extract_data_from_overview(
-                    pages['overview'], player_id)
-            except (IndexError, ValueError):
-                print('error: {}'.format(player_id))
-                continue
-            if first:
-                stats = {k:[v] for k, v in player_stats.items()}
-                overview = player_overview
-                first = False
-            else:
-                for k, v in player_stats.items():
-                    stats[k].append(v)
-                overview = overview.append(player_overview)
-        stats = pd.DataFrame.from_records(stats, index=stats['player_id'])
+                if isinstance(pages, Exception):
+                    print('error: {} ({})'.format(player_id, pages))
+                    failed.append(player_id)
+                    continue
+                try:
+                    player_stats = self._extract_fields_from_stats(
+                        pages['stats'], player_id)
+                    self.overview_extractor.extract(pages['overview'], 
+                                                    player_id)
+                except (IndexError, ValueError):
+                    print('error: {}'.format(player_id))
+                    self._append_lines(self.failedDir, [str(player_id)])
+                    continue
+                overview.write_many(self.overview_extractor.rows())
+                self.overview_extractor.clear()
+                stats.write([player_id] + [player_stats[column] for column 
+                                           in stats.columns[1:]])
+                self._flush_player_stats(stats, overview)
+        finally:
+            self._flush_player_stats(stats, overview)
+        return failed
+
+    def _flush_player_stats(self, stats, overview):
+        """commits buffered rows; stats go last, marking players as done"""
+        overview.flush()
+        stats.flush()
+
+    def _read_checkpoint(self, fileDir, header=False):
+        """
+        returns the player ids already committed to a part file,
+        dropping any row left half written by an interrupted run
+        """
+        try:
+            with open(fileDir, 'r+', encoding='utf-8') as f:
+                lines = f.readlines()
+                if lines and not lines[-1].endswith('\n'):
+                    lines.pop()
+                    f.seek(0)
+                    f.writelines(lines)
+                    f.truncate()
+        except FileNotFoundError:
+            return set()
+        if header:
+            lines = lines[1:]
+        return {int(line.split(',', 1)[0]) for line in lines}
+
+    def _append_lines(self, fileDir, lines):
+        """appends lines to a file and flushes them to disk"""
+        with open(fileDir, 'a', encoding='utf-8') as f:
+            f.write(''.join(line + '\n' for line in lines))
+
+    def _finish_player_stats(self, stats_part, overview_part):
+        """replaces the stats and overview files with the completed run"""
+        if not os.path.exists(stats_part):
+            print('no player stats were scraped')
+            return
+        done = self._read_checkpoint(stats_part, header=True)
+        overview = pd.read_csv(overview_part, index_col='player_id')
+        # drop rows of players interrupted before their stats were saved
+        overview = overview[overview.index.isin(done)]
+        overview = overview.reset_index().drop_duplicates()
+        overview.set_index('player_id', inplace=True)
         self._convert_to_csv(self.overviewDir, overview, 'player_id')
-        self._convert_to_csv(self.statsDir, stats, 'player_id')
+        os.replace(stats_part, self.statsDir)
+        os.remove(overview_part)
+        if os.path.exists(self.failedDir):
+            os.remove(self.failedDir)
         
     def _convert_to_csv(self, fileDir, df, index_label):
         """converts dataframe to csv"""
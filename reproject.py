@@ -0,0 +1,153 @@
+import pandas as pd
+from match import Match, resolve_BPS
+from player import Player
+
+# columns of the merged data a change to which is re-projected in place;
+# any other model column (see Player.fields) needs a full rebuild
+NEWS_FIELDS = ['status', 'chance_of_playing_next_round']
+
+
+class Reprojection:
+    """
+    The object model (Player, Squad, Match) over every unfinished
+    fixture, as Start.ipynb builds it, kept up to date as player news
+    comes in rather than rebuilt.
+
+    players: list of Player, as built from the merged data
+    teams: dict of team id: Squad
+    key: column of the merged data indexing the changed rows given
+         to update: the FPL code, as FantasyData.player_changes keys
+         them ('player_id.1' for the index of allData)
+    """
+
+    def __init__(self, players, teams, fixtures, key='code'):
+        self.players = players
+        self.teams = teams
+        self.by_key = {getattr(player, key): player for player in players}
+        self.matches = {}
+        for match_id, match in fixtures.to_dict('index').items():
+            if match['finished'] == True:
+                continue
+            self.matches[match_id] = Match(match_id, teams[match['team_h']],
+                                           teams[match['team_a']], teams)
+        for player in players:
+            player.resolve()
+            player.calculate_BPS()
+        resolve_BPS(list(self.matches.values()))
+
+    def update(self, rows):
+        """
+        Re-projects after news for some players, following what
+        depends on it:
+        - the players' appearance probabilities, per match
+        - for each match where those changed, both teams' goal rates,
+          so each side's chance of conceding
+        - the points and BPS of every player in those matches, and
+          their BPS ranks
+
+        rows: dataframe of changed merged-data rows (or dict of key:
+              row), indexed by key, holding NEWS_FIELDS
+        Returns the ids of the matches re-projected.
+        """
+        if isinstance(rows, dict):
+            rows = pd.DataFrame.from_dict(rows, orient='index')
+        rebuild = (set(rows.columns) & set(Player.fields)) - set(NEWS_FIELDS)
+        if rebuild:
+            raise ValueError('changes to {} need a full rebuild'.format(
+                ', '.join(sorted(rebuild))))
+
+        changed = set()
+        for key, row in rows.iterrows():
+            player = self.by_key[key]
+            news = [player.status, player.chance_of_playing_next_round]
+            for i, field in enumerate(NEWS_FIELDS):
+                if field in row and not pd.isna(row[field]):
+                    news[i] = row[field]
+            changed.update(player.update_news(*news))
+        matches = [match for match_id, match in self.matches.items()
+                   if match_id in changed]
+
+        affected = {}
+        for match in matches:
+            match.simulate_player_goals()
+            match.simulate_conceded()
+            for player in match.team_H.allPlayers + match.team_A.allPlayers:
+                affected.setdefault(id(player), (player, []))[1] \
+                    .append(match.match_id)
+        for player, match_ids in affected.values():
+            player.resolve(match_ids)
+            player.calculate_BPS(match_ids)
+        resolve_BPS(matches)
+        return [match.match_id for match in matches]
+
+    def apply(self, log):
+        """
+        Re-projects after a refresh, from its changes.ChangeLog (keyed
+        as this projection is) alone: news changes are updated in
+        place, other changes (prices, ownership) don't reach the model.
+        Players added or removed need a full rebuild.
+        Returns the ids of the matches re-projected.
+        """
+        if len(log.added) or len(log.removed):
+            raise ValueError('players added or removed need a full rebuild')
+        rows = log.rows(NEWS_FIELDS)
+        return self.update(rows) if len(rows) else []
+
+
+if __name__ == '__main__':
+    import time
+    import numpy as np
+    import synthetic
+
+    def snapshot(players):
+        return {player.code: {match_id: dict(match)
+                              for match_id, match in player.matches.items()}
+                for player in players}
+
+    print('Testing in progress...')
+    data_dct, overview, fixtures = synthetic.league()
+    # a season under way, so news reaches the next few gameweeks
+    today = pd.Timestamp.today().normalize()
+    fixtures['kickoff_time'] = [
+        (today + pd.Timedelta(weeks=event - 3)).strftime('%Y-%m-%dT15:00:00Z')
+        for event in fixtures['event']]
+    players, teams = synthetic.build(data_dct, overview, fixtures)
+    league = Reprojection(players, teams, fixtures, key='player_id.1')
+
+    rng = np.random.default_rng(0)
+    statuses = ['a', 'd', 'i', 's', 'u', 'n']
+    for trial in range(5):
+        keys = rng.choice(list(data_dct), size=trial + 1, replace=False)
+        rows = {}
+        for key in keys:
+            status = statuses[int(rng.integers(len(statuses)))]
+            chance = 100 if status == 'a' else int(rng.integers(0, 4)) * 25
+            rows[key] = {'status': status,
+                         'chance_of_playing_next_round': chance,
+                         'now_cost': 55}  # not a model column: ignored
+            data_dct[key].update(status=status,
+                                 chance_of_playing_next_round=chance)
+
+        start = time.perf_counter()
+        match_ids = league.update(pd.DataFrame.from_dict(rows,
+                                                         orient='index'))
+        update_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        rebuilt_players, rebuilt_teams = synthetic.build(data_dct, overview,
+                                                         fixtures)
+        synthetic.project(rebuilt_players, rebuilt_teams, fixtures)
+        full_time = time.perf_counter() - start
+        assert snapshot(league.players) == snapshot(rebuilt_players)
+        print('{} players changed: {} of {} matches re-projected in {:.3f}s '
+              '(full rebuild {:.2f}s)'.format(
+                  len(keys), len(match_ids), len(league.matches),
+                  update_time, full_time))
+
+    try:
+        league.update({keys[0]: {'Goals': 3}})
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('model columns other than news must rebuild')
+    print('Testing Complete')
@@ -0,0 +1,328 @@
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from league import project
+from bonus import rank_top, points as bonus_points
+
+MIN_POINTS = -10  # points are clipped to MIN_POINTS..MAX_POINTS
+MAX_POINTS = 60
+CHUNK = 10000     # simulations drawn at once, bounding memory per fixture
+
+
+def _share(rng, counts, weights):
+    """
+    shares counts (one per sim) between players, each unit going to
+    a player with probability in proportion to weights (sims x players).
+    Counts are dropped for sims where every weight is 0.
+    """
+    n, players = weights.shape
+    cum = np.cumsum(weights, axis=1)
+    total = cum[:, -1]
+    sims = np.repeat(np.arange(n), np.where(total > 0, counts, 0))
+    u = rng.random(len(sims)) * total[sims]
+    chosen = np.minimum((cum[sims] <= u[:, None]).sum(axis=1), players - 1)
+    return np.bincount(sims * players + chosen,
+                       minlength=n * players).reshape(n, players)
+
+
+def _simulate_side(rng, n, side, goals_for, goals_against, points):
+    """
+    samples one team's players over n sims of a scoreline.
+    Returns (points, bps) as sims x players arrays, bps -1 where
+    the player didn't appear
+    """
+    u = rng.random((n, len(side['prob_start'])), dtype=np.float32)
+    started = u < side['prob_start']
+    appeared = u < side['prob_appear']
+
+    goals = _share(rng, goals_for, side['goal_rate'] * appeared)
+    assisted = rng.binomial(goals.sum(axis=1), side['assist_share'])
+    assists = _share(rng, assisted, side['assist_rate'] * appeared)
+
+    # 0: clean sheet, 1: one goal conceded, 2: two or more
+    conceded = np.minimum(goals_against, 2)
+    # cards and own goals are rare enough to treat as exclusive:
+    # red below the first threshold, then yellow, then own goal
+    u = rng.random(u.shape, dtype=np.float32)
+    discipline = sum((u < threshold) * step for threshold, step
+                     in zip(side['discipline'], points['discipline']))
+
+    plus60, sub60 = points['time']
+    total = started * (plus60 - sub60) + sub60 + discipline + \
+            side['conceded_points'][conceded]
+    total = np.where(appeared, total, 0) + goals * side['goal_points'] + \
+            assists * points['assist']
+
+    bps = goals * side['bps_goal_points'] + side['bps_clean_points'][conceded]
+    bps = np.where(appeared, bps, -1)
+    return total, bps
+
+
+def _simulate_fixture(task):
+    """
+    simulates one fixture n times from its own seeded stream.
+    Returns (player index, histogram of points per player, bonus
+    points per player summed over the sims)
+    """
+    n = task['n']
+    rng = np.random.default_rng(np.random.SeedSequence(task['seed']))
+    home, away = task['home'], task['away']
+    players = len(home['prob_start']) + len(away['prob_start'])
+    bins = MAX_POINTS - MIN_POINTS + 1
+    histogram = np.zeros((players, bins), dtype=np.int64)
+    bonus_total = np.zeros(players)
+
+    for size in [CHUNK] * (n // CHUNK) + [n % CHUNK]:
+        if size == 0:
+            continue
+        goals_h = rng.poisson(task['rate_h'], size)
+        goals_a = rng.poisson(task['rate_a'], size)
+        points_h, bps_h = _simulate_side(rng, size, home, goals_h, goals_a,
+                                         task['points'])
+        points_a, bps_a = _simulate_side(rng, size, away, goals_a, goals_h,
+                                         task['points'])
+        points = np.hstack([points_h, points_a])
+        bps = np.hstack([bps_h, bps_a])
+
+        # bonus for the top 3, ties sharing a rank as the official
+        # rules have it (and as league.project ranks them); players who
+        # didn't appear aren't ranked. The sampled BPS only counts
+        # goals and clean sheets, so a fixture often hands out more
+        # than 3, 2 and 1
+        bonus = _bonus(bps)
+        bonus_total += bonus.sum(axis=0)
+        points += bonus
+
+        points = np.clip(np.rint(points), MIN_POINTS, MAX_POINTS)
+        flat = (points.astype(np.int64) - MIN_POINTS) + \
+               np.arange(players)[None, :] * bins
+        histogram += np.bincount(flat.ravel(), minlength=players * bins) \
+                       .reshape(players, bins)
+
+    return task['players'], histogram, bonus_total
+
+
+def _bonus(bps):
+    """bonus points for sampled bps (sims x players, -1 if absent)"""
+    return bonus_points(rank_top(np.where(bps >= 0, bps, -np.inf)))
+
+
+def _side_arrays(inputs, rates, members, f, team_rate):
+    """one team's inputs for fixture f, as small arrays for a worker"""
+    i = inputs
+    prob = rates['probAppearance'][members, f]
+    assist_rate = rates['assistRate'][members, f]
+    expected_assists = (assist_rate * prob).sum()
+    zero = np.zeros(len(members))
+    red = i.red_prob[members]
+    yellow = red + i.yellow_prob[members]
+    own_goal = yellow + np.clip(i.own_goal_prob[members], 0, 1)
+    return {'prob_start': rates['probStart'][members, f],
+            'prob_appear': rates['probStart'][members, f] +
+                           rates['probSub'][members, f],
+            'goal_rate': rates['goalRate'][members, f],
+            'assist_rate': assist_rate,
+            'assist_share': min(1, expected_assists / team_rate)
+                            if team_rate > 0 else 0,
+            'discipline': np.stack([red, yellow, own_goal]),
+            'goal_points': i.goal_points[members],
+            'conceded_points': np.stack([i.clean_points[members], zero,
+                                         i.conceded_points[members]]),
+            'bps_goal_points': i.bps_goal_points[members],
+            'bps_clean_points': np.stack([i.bps_clean_points[members],
+                                          zero, zero])}
+
+
+def _tasks(inputs, n, seed):
+    """one task per fixture, holding only what that fixture needs"""
+    i = inputs
+    rates = project(inputs)
+    yellow, red, own_goal = i.discipline_points
+    points = {'time': i.time_points, 'assist': i.assist_points,
+              'discipline': [red - yellow, yellow - own_goal, own_goal]}
+    active = rates['probStart'] + rates['probSub'] > 0
+    for f, match_id in enumerate(i.match_ids):
+        # players who can't appear always score 0, so are left out
+        home = np.flatnonzero(active[:, f] & (i.player_team == i.team_h[f]))
+        away = np.flatnonzero(active[:, f] & (i.player_team == i.team_a[f]))
+        rate_h = rates['team_H_goalRate'][f]
+        rate_a = rates['team_A_goalRate'][f]
+        yield {'n': n,
+               'seed': [seed, int(match_id)],
+               'players': np.concatenate([home, away]),
+               'rate_h': rate_h,
+               'rate_a': rate_a,
+               'home': _side_arrays(inputs, rates, home, f, rate_h),
+               'away': _side_arrays(inputs, rates, away, f, rate_a),
+               'points': points}
+
+
+class Simulation:
+    """
+    Monte Carlo points distributions for the fixtures in inputs
+    (LeagueInputs, usually one gameweek from league.gameweek).
+
+    Each fixture samples n joint scorelines from the projected team
+    goal rates. Goals and assists are shared between the players who
+    appear, in proportion to their rates, and clean sheets, goals
+    conceded, cards, own goals and bonus follow from each sample,
+    scored as Player scores expected points.
+
+    Every fixture draws from its own stream, seeded by (seed, match
+    id), so results are the same whether or not fixtures are split
+    across a process pool (processes > 1).
+
+    distribution: players x points probabilities, summed over each
+    player's fixtures (a double gameweek adds both)
+    bonus: mean bonus points per player, over their fixtures
+    """
+
+    def __init__(self, inputs, n=100000, seed=0, processes=None):
+        self.inputs = inputs
+        self.n = n
+        self.points = np.arange(MIN_POINTS, MAX_POINTS + 1)
+        tasks = list(_tasks(inputs, n, seed))
+        if processes and processes > 1:
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                results = list(executor.map(_simulate_fixture, tasks))
+        else:
+            results = [_simulate_fixture(task) for task in tasks]
+
+        team = inputs.player_team[:, None]
+        self.fixtures = ((team == inputs.team_h[None, :]) |
+                         (team == inputs.team_a[None, :])).sum(axis=1)
+        self.distribution = np.zeros((len(team), len(self.points)))
+        self.distribution[:, -MIN_POINTS] = 1  # not playing scores 0
+        self.bonus = np.zeros(len(team))
+        for members, histogram, bonus in results:
+            np.add.at(self.bonus, members, bonus / n)
+            for player, counts in zip(members, histogram / n):
+                self.distribution[player] = self._add(
+                    self.distribution[player], counts)
+
+    @staticmethod
+    def _add(a, b):
+        """distribution of the sum of two independent point totals"""
+        total = np.convolve(a, b)
+        # both start at MIN_POINTS, so total[k] is 2 * MIN_POINTS + k
+        clipped = total[-MIN_POINTS:len(a) - MIN_POINTS].copy()
+        clipped[0] += total[:-MIN_POINTS].sum()
+        clipped[-1] += total[len(a) - MIN_POINTS:].sum()
+        return clipped
+
+    def mean(self):
+        """expected points per player"""
+        return self.distribution @ self.points
+
+    def quantile(self, q):
+        """smallest points total reached with probability at least q"""
+        cdf = np.cumsum(self.distribution, axis=1)
+        return self.points[(cdf < q - 1e-12).sum(axis=1)]
+
+    def at_least(self, points):
+        """probability of scoring points or more, per player"""
+        return self.distribution[:, self.points >= points].sum(axis=1)
+
+    def summary(self, quantiles=(0.1, 0.5, 0.9), haul=10):
+        """
+        mean, quantiles and P(haul) (points >= haul) per player code,
+        for players with a fixture
+        """
+        df = pd.DataFrame({'fixtures': self.fixtures, 'mean': self.mean()},
+                          index=self.inputs.player_ids)
+        for q in quantiles:
+            df['q{:g}'.format(100 * q)] = self.quantile(q)
+        df['P_haul'] = self.at_least(haul)
+        return df[self.fixtures > 0]
+
+
+if __name__ == '__main__':
+    import os
+    import time
+    import synthetic
+    from league import LeagueProjection, gameweek, select_fixtures
+
+    print('Testing in progress...')
+    data_dct, overview, fixtures = synthetic.league()
+    players, teams = synthetic.build(data_dct, overview, fixtures)
+    inputs = LeagueProjection(teams, fixtures).inputs
+    week = gameweek(inputs, 3)
+
+    start = time.perf_counter()
+    serial = Simulation(week, n=100000, seed=1)
+    serial_time = time.perf_counter() - start
+    processes = min(4, os.cpu_count() or 1)
+    start = time.perf_counter()
+    pooled = Simulation(week, n=100000, seed=1, processes=processes)
+    pooled_time = time.perf_counter() - start
+
+    # one stream per fixture: same draws however the work is split
+    assert np.array_equal(serial.distribution, pooled.distribution)
+    assert np.allclose(serial.distribution.sum(axis=1), 1)
+    assert (serial.fixtures == 1).sum() == len(inputs.player_ids)
+
+    # two gameweeks at once add each player's two fixtures
+    # (up to the few totals clipped at MAX_POINTS)
+    double = Simulation(select_fixtures(inputs, np.isin(inputs.event, [3, 4])),
+                        n=20000, seed=1)
+    single = [Simulation(gameweek(inputs, event), n=20000, seed=1)
+              for event in [3, 4]]
+    assert (double.fixtures == 2).all()
+    assert np.allclose(double.mean(), single[0].mean() + single[1].mean(),
+                       atol=1e-2)
+
+    # against the analytic projection of the same gameweek
+    analytic = project(week)
+    playing = analytic['playing']
+
+    def per_player(values):
+        return np.where(playing, values, 0).sum(axis=1)
+
+    # bonus: tied players share a rank, as rank_top has it, so both
+    # take the same bonus
+    task = next(_tasks(week, 2000, 1))
+    rng = np.random.default_rng(0)
+    goals_h = rng.poisson(task['rate_h'], 2000)
+    goals_a = rng.poisson(task['rate_a'], 2000)
+    bps = np.hstack([
+        _simulate_side(rng, 2000, task['home'], goals_h, goals_a,
+                       task['points'])[1],
+        _simulate_side(rng, 2000, task['away'], goals_a, goals_h,
+                       task['points'])[1]])
+    bonus = _bonus(bps)
+    ties = 0
+    for row, given in zip(bps, bonus):
+        for value in np.unique(row[row >= 0]):
+            shared = given[row == value]
+            assert (shared == shared[0]).all(), (row, given)
+            ties += len(shared) > 1 and shared[0] > 0
+    assert ties > 0
+    assert (bonus >= 0).all() and (bonus[bps < 0] == 0).all()
+
+    # project gives each of its top 3 their bonus times their chance of
+    # appearing, without the ties a sample has, so at most as much
+    by_fixture = (playing * serial.bonus[:, None]).sum(axis=0)
+    assert (by_fixture >= 6 - 0.1).all()
+    expected_bonus = per_player(bonus_points(analytic['BPSrank']) *
+                                analytic['probAppearance'])
+    assert expected_bonus.sum() <= by_fixture.sum() + 1e-9
+    assert np.corrcoef(serial.bonus, expected_bonus)[0, 1] > 0.6
+    # points besides bonus: Player.resolve scales minutes points by
+    # the chance of appearing a second time, where a sample counts
+    # them once; with that undone the means agree
+    plus60, sub60 = week.time_points
+    minutes = analytic['probStart'] * plus60 + analytic['probSub'] * sub60
+    expected = per_player(analytic['initialPoints'] + minutes *
+                          (1 - analytic['probAppearance']))
+    sampled = serial.mean() - serial.bonus
+    assert np.abs(sampled - expected).mean() < 0.05
+    assert abs(sampled.sum() / expected.sum() - 1) < 0.01
+
+    rates = serial.summary()
+    assert (rates['q10'] <= rates['q50']).all()
+    assert (rates['q50'] <= rates['q90']).all()
+    assert ((rates['P_haul'] >= 0) & (rates['P_haul'] <= 1)).all()
+    print(rates.sort_values('mean', ascending=False).head())
+    print('{} fixtures x 100000 sims: serial {:.2f}s, {} processes {:.2f}s'
+          .format(len(week.match_ids), serial_time, processes, pooled_time))
+    print('Testing Complete')
@@ -0,0 +1,524 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+
+MISSING = ''  # a row without the key; never valid JSON, so unambiguous
+SCALARS = '_scalars'  # table of a document's top-level non-table keys
+
+
+def _split(source, document):
+    """
+    Splits a JSON document into tables of rows keyed by 'id'.
+
+    A list of dicts with ids is a table (named after source if it's
+    the whole document); any other top-level value goes in the one-row
+    SCALARS table. Returns (layout, tables), where layout records the
+    document's shape for _join and tables is a dict of
+    name: (ids, columns, {column: array of JSON text per row}).
+    """
+    def is_table(value):
+        return isinstance(value, list) and value and \
+            all(isinstance(row, dict) and 'id' in row for row in value)
+
+    def table(rows):
+        columns = list(dict.fromkeys(key for row in rows for key in row))
+        cells = {column: np.array([json.dumps(row[column])
+                                   if column in row else MISSING
+                                   for row in rows], dtype=object)
+                 for column in columns}
+        return np.array([row['id'] for row in rows]), columns, cells
+
+    if isinstance(document, list):
+        return ['list'], {source: table(document)}
+    layout = []
+    tables = {}
+    scalars = {}
+    for key, value in document.items():
+        if is_table(value):
+            layout.append([key, 'table'])
+            tables[key] = table(value)
+        else:
+            layout.append([key, 'scalar'])
+            scalars[key] = value
+    if scalars:
+        tables[SCALARS] = table([dict(scalars, id=0)])
+    return layout, tables
+
+
+def _rows(ids, columns, cells):
+    """the table's rows, as the dicts it was split from"""
+    absent = object()
+    decoded = {}
+    for column in columns:
+        texts = cells[column]
+        present = texts != MISSING
+        values = np.full(len(texts), absent, dtype=object)
+        # one parse per column rather than one per cell
+        values[present] = json.loads('[' + ','.join(texts[present]) + ']')
+        decoded[column] = values.tolist()
+    return [{column: decoded[column][n] for column in columns
+             if decoded[column][n] is not absent}
+            for n in range(len(ids))]
+
+
+def _join(source, layout, tables):
+    """puts the document split by _split back together"""
+    if layout == ['list']:
+        return _rows(*tables[source])
+    scalars = _rows(*tables[SCALARS])[0] if SCALARS in tables else {}
+    return {key: _rows(*tables[key]) if kind == 'table' else scalars[key]
+            for key, kind in layout}
+
+
+class SnapshotChain:
+    """
+    Every version of one JSON source (bootstrap-static, fixtures),
+    stored as column-level deltas.
+
+    Each version is an .npz file holding, for each table, the cells that
+    changed: which column, which row (by id) and the new value as JSON
+    text, plus the table's row ids or column order when those change.
+    Storage grows with the cells that change, not with the size of the
+    document.
+
+    To bound how much is replayed for a read, a version is stored whole
+    (a keyframe) once the cells changed since the last keyframe add up
+    to the size of the document, which at most doubles what is stored.
+    manifest.json lists the versions and their times, and is rewritten
+    last, so a version is only seen once it has been stored whole.
+    It is read again before each version is added, so chains open on
+    the same directory (fantasy and fantasy_2 share bootstrap-static)
+    add to each other's versions rather than overwriting them.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.manifest_loc = os.path.join(directory, 'manifest.json')
+        self.versions = self._manifest()
+        self._latest = None  # (layout, tables) of the last version
+        self._cursor = None  # (n, tables) of the last version replayed
+
+    def _manifest(self):
+        try:
+            with open(self.manifest_loc, encoding='utf-8') as f:
+                return json.load(f)['versions']
+        except FileNotFoundError:
+            return []
+
+    def reload(self):
+        """picks up versions added since by another chain on the directory"""
+        versions = self._manifest()
+        if versions != self.versions:
+            self.versions = versions
+            self._latest = None
+            self._cursor = None
+
+    @property
+    def times(self):
+        """time of each version, as a datetime index"""
+        return pd.DatetimeIndex([pd.Timestamp(version['time'], tz='UTC')
+                                 for version in self.versions])
+
+    def version_at(self, at=None):
+        """the number of the version current at time at (default: now)"""
+        if not self.versions:
+            raise LookupError('no snapshots stored')
+        if at is None:
+            return len(self.versions) - 1
+        at = _time(at)
+        times = [version['time'] for version in self.versions]
+        n = int(np.searchsorted(times, at, side='right')) - 1
+        if n < 0:
+            raise LookupError('no snapshot as early as {}'.format(
+                pd.Timestamp(at, tz='UTC')))
+        return n
+
+    def _arrays(self, n):
+        return np.load(os.path.join(self.directory,
+                                    self.versions[n]['file']),
+                       allow_pickle=False)
+
+    def _replay(self, n):
+        """(layout, tables) as of version n"""
+        if n == len(self.versions) - 1 and self._latest is not None:
+            return self._latest
+        start = max(k for k in range(n + 1)
+                    if self.versions[k]['keyframe'])
+        tables = {}
+        if self._cursor is not None and start <= self._cursor[0] <= n:
+            # carry on from the last read rather than the keyframe
+            start = self._cursor[0] + 1
+            tables = dict(self._cursor[1])
+        for k in range(start, n + 1):
+            _apply(tables, self.versions[k], self._arrays(k))
+        self._cursor = (n, dict(tables))
+        state = (self.versions[n]['layout'], tables)
+        if n == len(self.versions) - 1:
+            self._latest = state
+        return state
+
+    def add(self, source, document, time=None):
+        """
+        stores document as the next version, if it differs from the last.
+        time: when it was fetched (default: now)
+        Returns the new version's number, or None if nothing changed.
+        """
+        time = _time(pd.Timestamp.now(tz='UTC') if time is None else time)
+        self.reload()
+        if self.versions and time < self.versions[-1]['time']:
+            raise ValueError('snapshots must be added in time order')
+        layout, tables = _split(source, document)
+        if self.versions:
+            old_layout, old_tables = self._replay(len(self.versions) - 1)
+        else:
+            old_layout, old_tables = None, {}
+
+        arrays = {}
+        entry = {'time': time, 'layout': layout, 'keyframe': False,
+                 'tables': {}}
+        changed = 0
+        for n, (name, (ids, columns, cells)) in enumerate(tables.items()):
+            old = old_tables.get(name)
+            table = {'key': str(n), 'ids': False}
+            if old is None or not np.array_equal(old[0], ids):
+                table['ids'] = True
+                arrays[table['key'] + '.ids'] = ids
+            if old is None or old[1] != columns:
+                table['columns'] = columns
+            position = None if old is None else \
+                pd.Index(old[0]).get_indexer(ids)
+            changes = []
+            for column in columns:
+                before = _aligned(old, position, column, len(ids))
+                rows = np.flatnonzero(before != cells[column])
+                if len(rows):
+                    changes.append((column, ids[rows], cells[column][rows]))
+                    changed += len(rows)
+            _pack(arrays, table, changes)
+            entry['tables'][name] = table
+
+        if self.versions and not changed and layout == old_layout and \
+           set(tables) == set(old_tables) and \
+           not any(table['ids'] or 'columns' in table
+                   for table in entry['tables'].values()):
+            return None
+
+        size = sum(len(ids) * len(columns)
+                   for ids, columns, _ in tables.values())
+        since = sum(version['changed'] for version in
+                    self.versions[self._last_keyframe() + 1:]) + changed
+        if not self.versions or since >= size:
+            entry, arrays = _keyframe(time, layout, tables)
+        entry['changed'] = changed
+
+        n = len(self.versions)
+        entry['file'] = '{:06d}.npz'.format(n)
+        loc = os.path.join(self.directory, entry['file'])
+        with open(loc + '.part', 'wb') as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(loc + '.part', loc)
+        self.versions.append(entry)
+        part = self.manifest_loc + '.part'
+        with open(part, 'w', encoding='utf-8') as f:
+            json.dump({'versions': self.versions}, f)
+        os.replace(part, self.manifest_loc)
+        self._latest = (layout, tables)
+        return n
+
+    def _last_keyframe(self):
+        return max((k for k, version in enumerate(self.versions)
+                    if version['keyframe']), default=0)
+
+    def document(self, source, at=None):
+        """the document as it was at time at (default: the latest)"""
+        layout, tables = self._replay(self.version_at(at))
+        return _join(source, layout, tables)
+
+    def table(self, name, at=None):
+        """one table as it was at time at, as a dataframe indexed by id"""
+        _, tables = self._replay(self.version_at(at))
+        ids, columns, cells = tables[name]
+        rows = _rows(ids, columns, cells)
+        return pd.DataFrame.from_dict(rows).set_index('id')
+
+    def history(self, name, column):
+        """
+        one column of a table over every version, reading only that
+        column's deltas: a dataframe of version time x row id, NaN
+        where the row wasn't in the table (or the column wasn't there)
+        """
+        current = {}   # id: JSON text
+        ids = None
+        rows = []
+        decoded = {MISSING: np.nan}
+        for n, version in enumerate(self.versions):
+            table = version['tables'].get(name)
+            if table is None:
+                current, ids = {}, None
+                rows.append({})
+                continue
+            arrays = self._arrays(n)
+            key = table['key']
+            if table['ids']:
+                ids = arrays[key + '.ids'].tolist()
+                current = {row: current.get(row, MISSING) for row in ids}
+            if 'columns' in table and column not in table['columns']:
+                current = dict.fromkeys(ids, MISSING)
+            if column in table['changed']:
+                mine = arrays[key + '.column'] == \
+                    table['changed'].index(column)
+                current.update(zip(arrays[key + '.row'][mine].tolist(),
+                                   arrays[key + '.value'][mine].tolist()))
+            for text in set(current.values()) - decoded.keys():
+                decoded[text] = json.loads(text)
+            rows.append({row: decoded[text] for row, text in current.items()})
+        return pd.DataFrame(rows, index=self.times)
+
+
+def _time(at):
+    """a time as UTC nanoseconds since the epoch"""
+    at = pd.Timestamp(at)
+    if at.tzinfo is None:
+        at = at.tz_localize('UTC')
+    return at.value
+
+
+def _aligned(old, position, column, rows):
+    """
+    the old table's cells of column on the new table's rows, given
+    each new row's position in the old table (-1 for a new row)
+    """
+    before = np.full(rows, MISSING, dtype=object)
+    if old is None or column not in old[2]:
+        return before
+    found = position >= 0
+    before[found] = old[2][column][position[found]]
+    return before
+
+
+def _pack(arrays, table, changes):
+    """
+    stores one table's changed cells as three arrays (which column,
+    which row, new value) so a version is a few reads, not one per
+    column. changes: list of (column, row ids, JSON texts)
+    """
+    key = table['key']
+    table['changed'] = [column for column, _, _ in changes]
+    counts = [len(rows) for _, rows, _ in changes]
+    arrays[key + '.column'] = np.repeat(np.arange(len(changes)), counts) \
+        .astype(np.int32)
+    arrays[key + '.row'] = np.concatenate(
+        [rows for _, rows, _ in changes] or [np.array([], dtype=np.int64)])
+    arrays[key + '.value'] = np.concatenate(
+        [values for _, _, values in changes] or [np.array([], dtype=object)]) \
+        .astype(str)
+
+
+def _keyframe(time, layout, tables):
+    """a version storing every table whole"""
+    arrays = {}
+    entry = {'time': time, 'layout': layout, 'keyframe': True, 'tables': {}}
+    for n, (name, (ids, columns, cells)) in enumerate(tables.items()):
+        table = {'key': str(n), 'ids': True, 'columns': columns}
+        arrays[table['key'] + '.ids'] = ids
+        _pack(arrays, table, [(column, ids, cells[column])
+                              for column in columns])
+        entry['tables'][name] = table
+    return entry, arrays
+
+
+def _apply(tables, version, arrays):
+    """updates tables (as from _split) in place by one stored version"""
+    if version['keyframe']:
+        tables.clear()
+    for name in set(tables) - set(version['tables']):
+        del tables[name]
+    for name, table in version['tables'].items():
+        key = table['key']
+        ids, columns, cells = tables.get(name, (np.array([]), [], {}))
+        if table['ids']:
+            new_ids = arrays[key + '.ids']
+            position = pd.Index(ids).get_indexer(new_ids)
+            found = position >= 0
+            moved = {}
+            for column, old in cells.items():
+                values = np.full(len(new_ids), MISSING, dtype=object)
+                values[found] = old[position[found]]
+                moved[column] = values
+            ids, cells = new_ids, moved
+        if 'columns' in table:
+            columns = table['columns']
+            cells = {column: cells.get(column, np.full(len(ids), MISSING,
+                                                       dtype=object))
+                     for column in columns}
+        else:
+            cells = dict(cells)
+        if table['changed']:
+            which = arrays[key + '.column']
+            rows = pd.Index(ids).get_indexer(arrays[key + '.row'])
+            texts = arrays[key + '.value'].astype(object)
+            for n, column in enumerate(table['changed']):
+                mine = which == n
+                values = cells[column].copy()
+                values[rows[mine]] = texts[mine]
+                cells[column] = values
+        tables[name] = (ids, columns, cells)
+
+
+class SnapshotStore:
+    """
+    Every fetched version of the FPL JSON sources, one SnapshotChain per
+    source, kept under DataStore/snapshots/<source>/.
+    """
+
+    def __init__(self, directory='DataStore/snapshots'):
+        self.directory = directory
+        self.chains = {}
+
+    def chain(self, source):
+        if source not in self.chains:
+            self.chains[source] = SnapshotChain(
+                os.path.join(self.directory, source))
+        return self.chains[source]
+
+    def add(self, source, document, time=None):
+        """stores a fetched document; see SnapshotChain.add"""
+        return self.chain(source).add(source, document, time)
+
+    def add_file(self, source, loc, time=None):
+        """
+        stores the JSON file at loc, as fetched at time (default: when
+        the file was last written). A file older than the last version
+        stored is skipped (returns None), as a copy held locally may be
+        when another FantasyData has already added newer versions of
+        the source.
+        """
+        if time is None:
+            time = pd.Timestamp(os.stat(loc).st_mtime_ns, tz='UTC')
+        chain = self.chain(source)
+        chain.reload()
+        if chain.versions and _time(time) < chain.versions[-1]['time']:
+            return None
+        with open(loc, encoding='utf-8') as f:
+            return self.add(source, json.load(f), time)
+
+    def document(self, source, at=None):
+        return self.chain(source).document(source, at)
+
+    def table(self, source, name, at=None):
+        return self.chain(source).table(name, at)
+
+    def history(self, source, name, column):
+        return self.chain(source).history(name, column)
+
+
+if __name__ == '__main__':
+    import copy
+    import time
+    import tempfile
+
+    print('Testing in progress...')
+    rng = np.random.default_rng(0)
+    elements = [dict({'id': i, 'web_name': 'P{}'.format(i), 'now_cost': 50,
+                      'selected_by_percent': '1.0', 'form': '0.0',
+                      'news': '', 'chance_of_playing_next_round': None},
+                     **{'stat_{}'.format(k): 0 for k in range(40)})
+                for i in range(1, 601)]
+    document = {'elements': elements,
+                'teams': [{'id': t, 'name': 'T{}'.format(t)}
+                          for t in range(1, 21)],
+                'current-event': 1, 'next-event': 2,
+                'game-settings': {'game': {'squad_squadsize': 15}}}
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = SnapshotStore(directory)
+        fetched = pd.Timestamp('2030-08-01', tz='UTC')
+        saved = []
+        for day in range(120):
+            document = copy.deepcopy(document)
+            for row in rng.choice(document['elements'], 15, replace=False):
+                row['now_cost'] += int(rng.choice([-1, 1]))
+                row['selected_by_percent'] = str(round(rng.random() * 50, 1))
+                row['form'] = str(round(rng.random() * 8, 1))
+            hurt = document['elements'][int(rng.integers(600))]
+            hurt.update(news='Knock', chance_of_playing_next_round=75)
+            if day % 7 == 6:
+                document['current-event'] += 1
+                document['next-event'] += 1
+                for row in document['elements']:
+                    row['stat_0'] += int(rng.integers(0, 3))
+            if day == 40:  # a signing, a departure and a new field
+                document['elements'].append(dict(document['elements'][0],
+                                                 id=601, web_name='New'))
+                del document['elements'][10]
+                for row in document['elements']:
+                    row['ep_next'] = '2.0'
+            if day == 80:
+                for row in document['elements']:
+                    del row['stat_39']
+            time_ = fetched + pd.Timedelta(hours=6 * day)
+            assert store.add('bootstrap-static', document, time_) == day
+            saved.append((time_, document))
+        assert store.add('bootstrap-static', document,
+                         time_ + pd.Timedelta(hours=1)) is None
+
+        # every version reads back exactly, from a fresh store
+        store = SnapshotStore(directory)
+        start = time.perf_counter()
+        for time_, expected in saved:
+            assert store.document('bootstrap-static', time_) == expected
+            assert store.document('bootstrap-static', time_ +
+                                  pd.Timedelta(hours=5)) == expected
+        read_time = (time.perf_counter() - start) / (2 * len(saved))
+        time_, expected = saved[50]
+        players = store.table('bootstrap-static', 'elements',
+                              time_ + pd.Timedelta(minutes=1))
+        pd.testing.assert_frame_equal(
+            players, pd.DataFrame.from_dict(expected['elements'])
+                       .set_index('id'))
+
+        start = time.perf_counter()
+        cost = store.history('bootstrap-static', 'elements', 'now_cost')
+        history_time = time.perf_counter() - start
+        for n, (_, expected) in enumerate(saved):
+            row = cost.iloc[n].dropna()
+            assert row.to_dict() == {r['id']: r['now_cost']
+                                     for r in expected['elements']}
+        dropped = store.history('bootstrap-static', 'elements', 'stat_39')
+        assert dropped.iloc[80:].isna().all().all()
+
+        # two stores on one directory, as fantasy and fantasy_2 are:
+        # an older copy seeded by the second is skipped, and neither
+        # overwrites the other's versions
+        shared = os.path.join(directory, 'shared')
+        first, second = SnapshotStore(shared), SnapshotStore(shared)
+        second.chain('bootstrap-static')
+        seed = os.path.join(directory, 'bootstrap-static.json')
+        with open(seed, 'w', encoding='utf-8') as f:
+            json.dump(saved[0][1], f)
+        os.utime(seed, ns=(_time(fetched),) * 2)
+        assert first.add('bootstrap-static', saved[1][1],
+                         fetched + pd.Timedelta(days=1)) == 0
+        assert second.add_file('bootstrap-static', seed) is None
+        assert second.add('bootstrap-static', saved[2][1],
+                          fetched + pd.Timedelta(days=2)) == 1
+        assert first.add('bootstrap-static', saved[3][1],
+                         fetched + pd.Timedelta(days=3)) == 2
+        assert SnapshotStore(shared).document('bootstrap-static') == \
+            saved[3][1]
+        assert SnapshotStore(shared).document(
+            'bootstrap-static', fetched + pd.Timedelta(days=2)) == \
+            saved[2][1]
+
+        chain = store.chain('bootstrap-static')
+        stored = sum(os.path.getsize(os.path.join(chain.directory, v['file']))
+                     for v in chain.versions)
+        full = sum(len(json.dumps(d).encode()) for _, d in saved)
+        keyframes = sum(v['keyframe'] for v in chain.versions)
+    print('{} snapshots: {:.0f} KB as deltas ({} keyframes), {:.0f} KB as '
+          'copies; read as of T {:.1f}ms, history of now_cost {:.0f}ms'
+          .format(len(saved), stored / 1e3, keyframes, full / 1e3,
+                  read_time * 1e3, history_time * 1e3))
+    print('Testing Complete')
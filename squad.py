@@ -0,0 +1,483 @@
+import heapq
+import numpy as np
+import pandas as pd
+from collections import namedtuple
+
+QUOTAS = {1: 2, 2: 5, 3: 5, 4: 3}  # element_type: squad places
+MAX_PER_CLUB = 3
+# starters per element_type (GK, DEF, MID, FWD) of each valid formation
+FORMATIONS = [(1, d, m, 10 - d - m)
+              for d in range(3, 6) for m in range(2, 6)
+              if 1 <= 10 - d - m <= 3]
+
+Selection = namedtuple('Selection', [
+    'squad',      # positions (into the input arrays) of the 15 players
+    'starters',   # positions of the starting XI
+    'formation',  # starters per element_type, GK first
+    'value',      # XI points + bench_weight * bench points
+    'nodes',      # branch and bound nodes explored
+    'pruned',     # players dropped as dominated before the search
+])
+
+
+def lineup(points, position, squad, bench_weight=0.1):
+    """
+    picks the best starting XI from a squad.
+    Returns (value, starters, formation)
+    """
+    squad = np.asarray(squad)
+    best = (-np.inf, None, None)
+    for formation in FORMATIONS:
+        value = 0
+        starters = []
+        for element_type, s in zip(QUOTAS, formation):
+            members = squad[position[squad] == element_type]
+            members = members[np.argsort(-points[members], kind='stable')]
+            value += points[members[:s]].sum() + \
+                     bench_weight * points[members[s:]].sum()
+            starters.extend(members[:s])
+        if value > best[0]:
+            best = (value, sorted(starters), formation)
+    return best
+
+
+def undominated(points, cost, position, club):
+    """
+    Returns the players that can't be left out of every optimal squad.
+
+    A player is dropped when, whatever squad they are in, one of the
+    players costing no more and scoring no less is free to take their
+    place. One will be if more of them share the player's club than
+    the squad could already hold there, or if they spread across
+    enough other clubs that they can't all be in the squad or in full
+    clubs (at most 4 other clubs can hold 3 of the other 14 players).
+    """
+    keep = []
+    index = np.arange(len(points))
+    for element_type, q in QUOTAS.items():
+        members = index[position == element_type]
+        for x in members:
+            # ties go to the earlier player, so only one of a pair goes
+            better = (cost[members] <= cost[x]) & \
+                     (points[members] >= points[x]) & \
+                     ((cost[members] < cost[x]) |
+                      (points[members] > points[x]) | (members < x))
+            clubs = club[members[better]]
+            same = (clubs == club[x]).sum()
+            others = len(set(clubs.tolist()) - {club[x]})
+            if same > min(q - 1, MAX_PER_CLUB - 1) or others >= q + 4:
+                continue
+            keep.append(x)
+    return np.array(sorted(keep), dtype=int)
+
+
+def _block(values, cost, members, forced, q, starts, bench_weight, budget):
+    """
+    Best q players from one position (members, best points first)
+    for every exact total cost, once for each number of starters in
+    starts (the first s chosen start). values are (points, penalty)
+    per player; forced players must be taken. Returns (best, take)
+    where best[i, c] is the most for starts[i] at total cost c and
+    take[j, i, k, c] marks player j taken there as pick k + 1.
+    """
+    points, penalty = values
+    starts = np.asarray(starts)
+    best = np.full((len(starts), q + 1, budget + 1), -np.inf)
+    best[:, 0, 0] = 0
+    take = np.zeros((len(members), len(starts), q, budget + 1), dtype=bool)
+    # pick k + 1 counts in full when it starts, bench_weight when not
+    weight = np.where(np.arange(q)[None, :] < starts[:, None], 1,
+                      bench_weight)
+    for j, x in enumerate(members):
+        c = cost[x]
+        if c > budget:
+            if x in forced:
+                best[:] = -np.inf
+            continue
+        candidate = best[:, :-1, :budget + 1 - c] + \
+                    (weight * points[x] - penalty[x])[:, :, None]
+        if x in forced:
+            best[:, 1:, c:] = candidate
+            best[:, 1:, :c] = -np.inf
+            best[:, 0] = -np.inf
+            take[j, :, :, c:] = True
+            continue
+        current = best[:, 1:, c:]
+        np.greater(candidate, current, out=take[j, :, :, c:])
+        np.maximum(current, candidate, out=current)
+    return best[:, q], take
+
+
+def _picks(members, cost, take, q, total):
+    """players chosen by _block for an exact total cost"""
+    picks = []
+    k = q
+    for j in range(len(members) - 1, -1, -1):
+        if k == 0:
+            break
+        if take[j, k - 1, total]:
+            picks.append(members[j])
+            total -= cost[members[j]]
+            k -= 1
+    return picks
+
+
+def _frontier(costs, values):
+    """
+    the (cost, value) pairs no cheaper pair beats, cheapest first.
+    Returns (costs, values, index into the pairs given)
+    """
+    order = np.lexsort((-values, costs))
+    costs = costs[order]
+    values = values[order]
+    before = np.maximum.accumulate(np.concatenate([[-np.inf], values[:-1]]))
+    keep = values > before
+    return costs[keep], values[keep], order[keep]
+
+
+def _merge(a, b, budget):
+    """
+    frontier of every pair from two frontiers within budget.
+    Returns (costs, values, index into a, index into b)
+    """
+    costs = a[0][:, None] + b[0][None, :]
+    values = a[1][:, None] + b[1][None, :]
+    ia, ib = np.nonzero(costs <= budget)
+    costs, values, index = _frontier(costs[ia, ib], values[ia, ib])
+    return costs, values, ia[index], ib[index]
+
+
+class _Search:
+    """
+    Exact best squads, ignoring the club limit, for the nodes of the
+    branch and bound in select_squad: some players left out, some
+    forced in, and a penalty taken off each chosen player's points.
+    """
+
+    def __init__(self, points, cost, position, budget, bench_weight):
+        self.points = points
+        self.cost = cost
+        self.budget = budget
+        self.bench_weight = bench_weight
+        self.members = {}
+        cheapest = {}
+        for element_type, q in QUOTAS.items():
+            members = np.flatnonzero(position == element_type)
+            self.members[element_type] = members[
+                np.argsort(-points[members], kind='stable')]
+            cheapest[element_type] = np.sort(cost[members])[:q].sum()
+        # no position can spend what the others need at the least
+        self.caps = {element_type: max(0, budget - sum(cheapest.values()) +
+                                       cheapest[element_type])
+                     for element_type in QUOTAS}
+        self.starts = {element_type: sorted({formation[i]
+                                             for formation in FORMATIONS})
+                       for i, element_type in enumerate(QUOTAS)}
+        self.blocks = {}
+        self.merges = {}
+
+    def block(self, element_type, s, excluded, included, penalty):
+        """frontier of one position, cached by what it depends on"""
+        members = self.members[element_type]
+        key = (element_type, excluded & set(members),
+               included & set(members), penalty[members].tobytes())
+        if key not in self.blocks:
+            members = np.array([x for x in members if x not in excluded],
+                               dtype=int)
+            starts = self.starts[element_type]
+            best, take = _block((self.points, penalty), self.cost, members,
+                                included, QUOTAS[element_type], starts,
+                                self.bench_weight, self.caps[element_type])
+            frontiers = {}
+            for i, starters in enumerate(starts):
+                costs = np.flatnonzero(best[i] > -np.inf)
+                frontiers[starters] = (i, _frontier(costs, best[i][costs]))
+            self.blocks[key] = (members, take, frontiers)
+        members, take, frontiers = self.blocks[key]
+        i, frontier = frontiers[s]
+        return members, take[:, i], frontier
+
+    def merge(self, a, b):
+        """_merge of two block frontiers, cached (blocks are never freed)"""
+        key = (id(a), id(b))
+        if key not in self.merges:
+            self.merges[key] = _merge(a, b, self.budget)
+        return self.merges[key]
+
+    def solve(self, excluded, included, penalty):
+        """
+        returns (value, squad, formation) for the best squad by points
+        less penalties, value -inf if none fits
+        """
+        best = (-np.inf, None, None)
+        for formation in FORMATIONS:
+            blocks = [self.block(element_type, s, excluded, included,
+                                 penalty)
+                      for element_type, s in zip(QUOTAS, formation)]
+            frontiers = [frontier for _, _, frontier in blocks]
+            back = self.merge(frontiers[0], frontiers[1])
+            front = self.merge(frontiers[2], frontiers[3])
+            if len(back[0]) == 0 or len(front[0]) == 0:
+                continue
+            # best front within what each back leaves of the budget
+            i = np.searchsorted(front[0], self.budget - back[0],
+                                side='right') - 1
+            totals = np.where(i >= 0, back[1] + front[1][i], -np.inf)
+            k = int(np.argmax(totals))
+            if totals[k] <= best[0]:
+                continue
+            ends = [back[2][k], back[3][k], front[2][i[k]], front[3][i[k]]]
+            squad = []
+            for (members, take, frontier), element_type, end in zip(
+                    blocks, QUOTAS, ends):
+                total = int(frontier[0][end])
+                squad.extend(_picks(members, self.cost, take,
+                                    QUOTAS[element_type], total))
+            best = (totals[k], sorted(squad), formation)
+        return best
+
+
+def _value(points, position, squad, bench_weight):
+    return lineup(points, position, squad, bench_weight)[0]
+
+
+def select_squad(points, cost, position, club, budget=1000,
+                 bench_weight=0.1, iterations=30):
+    """
+    Finds the squad with the most projected points, proven optimal.
+
+    Input (one entry per player):
+    - points -- projected points
+    - cost -- now_cost (tenths of a million, as FPL gives it)
+    - position -- element_type (1 GK, 2 DEF, 3 MID, 4 FWD)
+    - club -- team
+    - budget -- in the same units as cost
+    - bench_weight -- how much bench points count against the XI's
+    - iterations -- subgradient steps tuning the club penalties
+
+    The squad has 2/5/5/3 players by position, at most 3 per club,
+    and is scored by its best starting XI in a valid formation.
+
+    Dominated players are dropped first. Without the club limit each
+    formation is solved exactly, by a knapsack over each position and
+    a merge of the (cost, points) frontiers. The club limit is moved
+    into the objective as a penalty per chosen player of each club
+    (Lagrangian relaxation), which bounds the best squad from above.
+    A best-first branch and bound then closes the remaining gap,
+    splitting a crowded club's chosen players into "leave out the
+    first, or keep it and leave out the second, ..." children.
+    """
+    points = np.asarray(points, dtype=float)
+    cost = np.asarray(cost, dtype=int)
+    position = np.asarray(position)
+    club = np.asarray(club)
+
+    keep = undominated(points, cost, position, club)
+    p, c, pos = points[keep], cost[keep], position[keep]
+    clubs, club = np.unique(club[keep], return_inverse=True)
+    search = _Search(p, c, pos, budget, bench_weight)
+    eps = 1e-9
+
+    incumbent = (-np.inf, None)
+
+    def offer(squad):
+        """keeps the best squad found within the club limit"""
+        nonlocal incumbent
+        if squad is not None and \
+           np.bincount(club[squad]).max() <= MAX_PER_CLUB:
+            value = _value(p, pos, squad, bench_weight)
+            if value > incumbent[0]:
+                incumbent = (value, squad)
+
+    def repair(squad):
+        """
+        the best squad without the players a crowded club has over
+        the limit (its lowest scoring), which fits the club limit
+        unless the replacements crowd another club
+        """
+        excluded = set()
+        for crowded in np.flatnonzero(np.bincount(club[squad]) >
+                                      MAX_PER_CLUB):
+            members = sorted((x for x in squad if club[x] == crowded),
+                             key=lambda x: -p[x])
+            excluded.update(members[MAX_PER_CLUB:])
+        _, squad, _ = search.solve(frozenset(excluded), frozenset(),
+                                   np.zeros(len(p)))
+        return squad
+
+    def bound(excluded, included, lambdas):
+        """upper bound and squad for a node, given club penalties"""
+        open_ = np.bincount(club[[x for x in range(len(p))
+                                  if x not in excluded]],
+                            minlength=len(clubs)) > MAX_PER_CLUB
+        lambdas = np.where(open_, lambdas, 0)  # limits that can't bind
+        value, squad, formation = search.solve(excluded, included,
+                                               lambdas[club])
+        return value + MAX_PER_CLUB * lambdas.sum(), squad, formation, \
+               lambdas
+
+    # tune the club penalties at the root
+    lambdas = np.zeros(len(clubs))
+    best_bound = (np.inf, lambdas)
+    step = np.median(p[p > 0]) if (p > 0).any() else 1
+    for _ in range(iterations):
+        value, squad, _, lambdas = bound(frozenset(), frozenset(), lambdas)
+        if squad is None:
+            raise ValueError('no squad fits the budget')
+        offer(squad)
+        if value < best_bound[0]:
+            best_bound = (value, lambdas)
+        over = np.bincount(club[squad], minlength=len(clubs)) - MAX_PER_CLUB
+        if over.max() > 0:
+            offer(repair(squad))
+        gradient = np.where((lambdas > 0) | (over > 0), over, 0)
+        if value - incumbent[0] <= eps or not gradient.any():
+            break
+        lambdas = np.maximum(0, lambdas + step * gradient)
+        step *= 0.8
+    lambdas = best_bound[1]
+
+    heap = [(-best_bound[0], 0, frozenset(), frozenset())]
+    nodes = 0
+    while heap:
+        _, _, excluded, included = heapq.heappop(heap)
+        value, squad, formation, node_lambdas = bound(excluded, included,
+                                                      lambdas)
+        nodes += 1
+        if squad is None or value <= incumbent[0] + eps:
+            continue
+        offer(squad)
+        if value <= incumbent[0] + eps:
+            continue
+
+        counts = np.bincount(club[squad], minlength=len(clubs))
+        children = []
+        if counts.max() > MAX_PER_CLUB:
+            crowded = np.argmax(counts - MAX_PER_CLUB)
+            free = [x for x in squad if club[x] == crowded and
+                    x not in included]
+            room = MAX_PER_CLUB - sum(club[x] == crowded for x in included)
+            for i in range(min(len(free), room + 1)):
+                children.append((excluded | {free[i]},
+                                 included | set(free[:i])))
+        else:
+            # within the club limit but short of the bound: a penalised
+            # club isn't full, so decide its best player left out
+            slack = node_lambdas * (MAX_PER_CLUB - counts)
+            crowded = np.argmax(slack)
+            y = max((x for x in range(len(p)) if club[x] == crowded and
+                     x not in excluded and x not in squad),
+                    key=lambda x: p[x])
+            children = [(excluded | {y}, included),
+                        (excluded, included | {y})]
+
+        for child_excluded, child_included in children:
+            # a club with 3 forced in has no room for anyone else
+            for full in {club[x] for x in child_included}:
+                if sum(club[x] == full for x in child_included) == \
+                   MAX_PER_CLUB:
+                    child_excluded = child_excluded | {
+                        x for x in range(len(p)) if club[x] == full and
+                        x not in child_included}
+            heapq.heappush(heap, (-value, nodes * 10 + len(heap),
+                                  frozenset(child_excluded),
+                                  frozenset(child_included)))
+
+    if incumbent[1] is None:
+        raise ValueError('no squad fits the budget and club limit')
+    value, squad = incumbent
+    _, starters, formation = lineup(p, pos, squad, bench_weight)
+    return Selection(squad=keep[squad].tolist(),
+                     starters=keep[starters].tolist(),
+                     formation=formation, value=value,
+                     nodes=nodes, pruned=len(points) - len(keep))
+
+
+def pick(df, points='points', budget=1000, bench_weight=0.1):
+    """
+    select_squad for a dataframe with now_cost, element_type and team
+    columns. Returns the squad rows, with a starter column
+    """
+    selection = select_squad(df[points], df['now_cost'], df['element_type'],
+                             df['team'], budget, bench_weight)
+    squad = df.iloc[selection.squad].copy()
+    squad['starter'] = [x in selection.starters for x in selection.squad]
+    return squad.sort_values(['element_type', points],
+                             ascending=[True, False])
+
+
+if __name__ == '__main__':
+    import itertools
+    import time
+    import synthetic
+    from league import LeagueProjection
+
+    def brute_force(points, cost, position, club, budget, bench_weight):
+        """best squad by trying every combination"""
+        index = np.arange(len(points))
+        groups = [itertools.combinations(index[position == element_type], q)
+                  for element_type, q in QUOTAS.items()]
+        best = -np.inf
+        for combo in itertools.product(*map(list, groups)):
+            squad = [x for group in combo for x in group]
+            if cost[squad].sum() > budget:
+                continue
+            if np.bincount(club[squad]).max() > MAX_PER_CLUB:
+                continue
+            best = max(best, lineup(points, position, squad,
+                                    bench_weight)[0])
+        return best
+
+    print('Testing in progress...')
+    rng = np.random.default_rng(0)
+    checked = 0
+    for trial in range(40):
+        sizes = {1: 3, 2: 6, 3: 7, 4: 4}
+        position = np.repeat(list(sizes), list(sizes.values()))
+        n = len(position)
+        points = np.round(rng.gamma(2, 2, n), 1)
+        cost = rng.integers(40, 90, n)
+        club = rng.integers(0, 7, n)
+        budget = int(rng.integers(850, 1050))
+        expected = brute_force(points, cost, position, club, budget, 0.1)
+        try:
+            selection = select_squad(points, cost, position, club, budget)
+        except ValueError:
+            assert expected == -np.inf
+            continue
+        squad = selection.squad
+        assert cost[squad].sum() <= budget
+        assert np.bincount(club[squad]).max() <= MAX_PER_CLUB
+        assert np.isclose(selection.value, expected)
+        assert np.isclose(lineup(points, position, squad)[0], expected)
+        checked += 1
+    print('{} small pools match brute force'.format(checked))
+
+    data_dct, overview, fixtures = synthetic.league()
+    players, teams = synthetic.build(data_dct, overview, fixtures)
+    league = LeagueProjection(teams, fixtures)
+    projected = league.frame('finalPoints').sum(axis=1)
+    df = pd.DataFrame([{'code': player.code, 'web_name': player.web_name,
+                        'now_cost': player.now_cost,
+                        'element_type': player.element_type,
+                        'team': player.team} for player in players]) \
+           .set_index('code')
+    df['points'] = projected
+    # a handful of clubs with standout players, so the club limit binds
+    df.loc[df['team'] <= 2, 'points'] *= 3
+
+    start = time.perf_counter()
+    selection = select_squad(df['points'], df['now_cost'],
+                             df['element_type'], df['team'], budget=1000)
+    elapsed = time.perf_counter() - start
+    squad = df.iloc[selection.squad]
+    assert squad['now_cost'].sum() <= 1000
+    assert squad['team'].value_counts().max() <= MAX_PER_CLUB
+    assert list(squad['element_type'].value_counts().sort_index()) == \
+           [2, 5, 5, 3]
+    print('{} players ({} dominated): {:.1f} points, {}, {} nodes, {:.2f}s'
+          .format(len(df), selection.pruned, selection.value,
+                  '-'.join(map(str, selection.formation[1:])),
+                  selection.nodes, elapsed))
+    print(pick(df, budget=1000))
+    print('Testing Complete')
@@ -0,0 +1,147 @@
+import os
+import sys
+import json
+import subprocess
+
+# modules only the refresh (scrape / download) path should load
+SCRAPING_MODULES = ['requests', 'selenium', 'bs4', 'fetch', 'page_parsers',
+                    'index_discovery', 'http_cache']
+
+SCRIPT = """
+import sys, json, time
+start = time.perf_counter()
+import {module}
+imported = time.perf_counter()
+data = {module}.{cls}({args})
+constructed = time.perf_counter()
+{access}
+accessed = time.perf_counter()
+print(json.dumps({{
+    'import': imported - start,
+    'construct': constructed - imported,
+    'access': accessed - constructed,
+    'loaded': [name for name in {scraping}
+               if name in sys.modules]}}))
+"""
+
+CASES = [('premier', 'PremierData', 'data.df_allStats'),
+         ('fantasy', 'FantasyData', 'data.players.data'),
+         ('fantasy_2', 'FantasyData', 'data.players()')]
+
+
+def measure(module, cls, access, args='', cwd='.'):
+    """
+    times importing module, constructing cls(args) and then access, in
+    a fresh interpreter run in cwd (with a DataStore/ directory).
+    Returns a dict of seconds for each step, and the scraping modules
+    that were loaded.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ,
+               PYTHONPATH=os.pathsep.join([here] + sys.path[1:]))
+    script = SCRIPT.format(module=module, cls=cls, args=args, access=access,
+                           scraping=SCRAPING_MODULES)
+    result = subprocess.run([sys.executable, '-c', script], cwd=cwd, env=env,
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def write_datastore(directory, players=700, seed=0):
+    """
+    writes a DataStore of season-sized made-up data into directory:
+    the PL index, stats and overview CSVs and the FPL JSON files
+    """
+    import numpy as np
+    import pandas as pd
+    from premier import PremierData
+
+    rng = np.random.default_rng(seed)
+    store = os.path.join(directory, 'DataStore')
+    os.makedirs(store, exist_ok=True)
+    ids = np.arange(1, players + 1)
+
+    pd.DataFrame({'player_id': ids + 1000, 'code': ids}) \
+        .to_csv(os.path.join(store, 'players.index.csv'), index=False)
+    stats = pd.DataFrame({field: rng.integers(0, 40, players)
+                          for field in PremierData.numeric_fields})
+    stats.insert(0, 'player_id.1', ids + 1000)
+    stats['Team'] = rng.choice(['Arsenal', 'Fulham', 'Everton'], players)
+    stats['Position'] = rng.choice(['Defender', 'Forward'], players)
+    stats.index = pd.Index(ids + 1000, name='player_id')
+    stats.to_csv(os.path.join(store, 'players.stats.csv'))
+    seasons = 6
+    pd.DataFrame({'player_id': np.repeat(ids + 1000, seasons),
+                  'Season': np.tile(['{}/{}'.format(y, y + 1)
+                                     for y in range(2012, 2018)], players),
+                  'Club': rng.choice(['Arsenal', 'Fulham'], players * seasons),
+                  'Apps': rng.integers(0, 38, players * seasons),
+                  'Goals': rng.integers(0, 20, players * seasons),
+                  'Subs': rng.integers(0, 10, players * seasons)}) \
+        .to_csv(os.path.join(store, 'players.overview.csv'), index=False)
+
+    elements = [dict({'id': int(i), 'web_name': 'P{}'.format(i),
+                      'first_name': 'A', 'second_name': 'B{}'.format(i),
+                      'news': '' if i % 7 else 'Knock',
+                      'team': int(rng.integers(1, 21)),
+                      'element_type': int(rng.integers(1, 5)),
+                      'now_cost': int(rng.integers(40, 130))},
+                     **{'stat_{}'.format(k): float(rng.random())
+                        for k in range(50)})
+                for i in ids]
+    static = {'elements': elements,
+              'events': [{'id': gw, 'finished': gw < 10}
+                         for gw in range(1, 39)],
+              'element_types': [{'id': t} for t in range(1, 5)],
+              'teams': [{'id': t, 'name': 'T{}'.format(t)}
+                        for t in range(1, 21)],
+              'current-event': 9, 'next-event': 10, 'last-entry-event': 38,
+              'game-settings': {'game': {}, 'element_type': {}}}
+    fixtures = [{'id': f, 'event': (f - 1) // 10 + 1, 'team_h': 1,
+                 'team_a': 2, 'finished': f <= 90,
+                 'stats': [{'identifier': 'goals_scored',
+                            'h': [{'value': 1, 'element': 3}]}]
+                 if f <= 90 else []}
+                for f in range(1, 381)]
+    for name, document in [('bootstrap-static.json', static),
+                           ('fixtures.json', fixtures),
+                           ('bootstrap_static', static),
+                           ('fixtures', fixtures)]:
+        with open(os.path.join(store, name), 'w', encoding='utf-8') as f:
+            json.dump(document, f)
+
+
+if __name__ == '__main__':
+    import tempfile
+
+    print('Testing in progress...')
+    with tempfile.TemporaryDirectory() as directory:
+        write_datastore(directory)
+        # the first run makes the binary column copies
+        for module, cls, access in CASES:
+            measure(module, cls, access, cwd=directory)
+
+        print('{:<28}{:>9}{:>11}{:>12}'.format('', 'import', 'construct',
+                                               'first use'))
+        for module, cls, access in CASES:
+            modes = [('eager', ''), ('lazy', 'lazy=True')]
+            if module == 'fantasy_2':
+                modes = [('lazy', '')]  # accessors always were
+            for mode, args in modes:
+                times = [measure(module, cls, access, args, directory)
+                         for _ in range(3)]
+                best = {step: min(t[step] for t in times)
+                        for step in ['import', 'construct', 'access']}
+                assert not any(t['loaded'] for t in times), times
+                if mode == 'lazy':
+                    assert best['construct'] < 0.01, best
+                print('{:<28}{:>8.3f}s{:>10.3f}s{:>11.3f}s'.format(
+                    '{}.{} ({})'.format(module, cls, mode), best['import'],
+                    best['construct'], best['access']))
+
+        # what every start used to pay before reading any data
+        deferred = measure('pandas', 'DataFrame', 'import fetch, '
+                           'index_discovery, http_cache, page_parsers, '
+                           'selenium.webdriver', cwd=directory)
+        print('scraping imports, now only on refresh: {:.3f}s'.format(
+            deferred['access']))
+    print('Testing Complete')
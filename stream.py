@@ -0,0 +1,108 @@
+import os
+import csv
+
+
+class ChunkedCSVWriter:
+    """
+    Collects parsed rows in memory and appends them to a CSV file
+    a chunk at a time, so the output never has to be held in full.
+
+    fileDir: CSV file to append to (header is written if new)
+    columns: header row, as a list
+    chunk_size: number of rows to hold before the buffer counts as full
+    """
+
+    def __init__(self, fileDir, columns, chunk_size=50):
+        self.fileDir = fileDir
+        self.columns = columns
+        self.chunk_size = chunk_size
+        self.rows = []
+
+    def write(self, row):
+        """adds one row (a sequence of values in column order)"""
+        self.rows.append(row)
+
+    def write_many(self, rows):
+        self.rows.extend(rows)
+
+    @property
+    def full(self):
+        return len(self.rows) >= self.chunk_size
+
+    def flush(self):
+        """appends buffered rows to the file and empties the buffer"""
+        if not self.rows:
+            return
+        header = not os.path.exists(self.fileDir) or \
+                 os.path.getsize(self.fileDir) == 0
+        with open(self.fileDir, 'a', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f, lineterminator='\n')
+            if header:
+                writer.writerow(self.columns)
+            writer.writerows(self.rows)
+        self.rows = []
+
+
+if __name__ == '__main__':
+    import time
+    import random
+    import tempfile
+    import tracemalloc
+    import pandas as pd
+
+    stats_columns = ['player_id', 'Goals', 'Assists', 'Appearances',
+                     'Team', 'Position']
+    overview_columns = ['player_id', 'Season', 'Club', 'Apps',
+                        'Goals', 'Subs']
+
+    def corpus(n, seed=0):
+        """synthetic parsed players: (stats row, overview rows)"""
+        rng = random.Random(seed)
+        for player_id in range(n):
+            stats = [player_id, rng.randint(0, 30), rng.randint(0, 20),
+                     rng.randint(0, 38), 'Club {}'.format(player_id % 20),
+                     'Midfielder']
+            overview = [[player_id, '{}/{}'.format(y, y + 1),
+                         'Club {}'.format(rng.randint(0, 19)),
+                         rng.randint(0, 38), rng.randint(0, 20),
+                         rng.randint(0, 10)]
+                        for y in range(2018 - rng.randint(1, 8), 2019)]
+            yield stats, overview
+
+    def streamed(n, directory):
+        stats = ChunkedCSVWriter(os.path.join(directory, 's.csv'),
+                                 stats_columns)
+        overview = ChunkedCSVWriter(os.path.join(directory, 'o.csv'),
+                                    overview_columns)
+        for stats_row, overview_rows in corpus(n):
+            overview.write_many(overview_rows)
+            stats.write(stats_row)
+            if stats.full:
+                overview.flush()
+                stats.flush()
+        overview.flush()
+        stats.flush()
+
+    def appended(n, directory):
+        """original approach: grow a DataFrame one player at a time"""
+        overview = None
+        for _, overview_rows in corpus(n):
+            df = pd.DataFrame(overview_rows, columns=overview_columns)
+            overview = df if overview is None else pd.concat([overview, df])
+        overview.to_csv(os.path.join(directory, 'o.csv'), index=False)
+
+    print('Benchmark: players, seconds, peak MB (synthetic corpus)')
+    for name, func in [('streamed', streamed), ('appended', appended)]:
+        for n in [1250, 2500, 5000]:
+            with tempfile.TemporaryDirectory() as directory:
+                tracemalloc.start()
+                start = time.perf_counter()
+                func(n, directory)
+                elapsed = time.perf_counter() - start
+                peak = tracemalloc.get_traced_memory()[1] / 2**20
+                tracemalloc.stop()
+                if name == 'streamed':
+                    df = pd.read_csv(os.path.join(directory, 's.csv'))
+                    assert len(df) == n
+            print('{:>9} {:>5} {:>7.2f} {:>7.1f}'.format(name, n,
+                                                       elapsed, peak))
@@ -0,0 +1,188 @@
+import numpy as np
+
+# promoted clubs, with no top-flight history to go on:
+# team name: (goals conceded per match, goals scored per match)
+PROMOTED = {'Wolverhampton Wanderers': (1.85, 1.03),
+            'Fulham': (1.41, 1.15),
+            'Cardiff City': (1.95, 0.84)}
+
+
+def squad_rates(squads, promoted=PROMOTED):
+    """
+    Goals conceded and scored per match for each squad, worked out
+    for all squads at once from their players:
+    - conceded: the defenders' and goalkeepers' concede rates weighted
+      by appearance rate (their plain average of non-zero rates if
+      no one appears, or if the weighted rate falls outside them)
+    - scored: the sum of goals per match weighted by appearance rate
+    and taken from promoted for a club named there.
+
+    Returns (concede_rate, goal_rate) arrays, NaN where unknown.
+    """
+    def gather(attr, members):
+        team = [n for n, squad in enumerate(squads)
+                for _ in members(squad)]
+        values = [getattr(player, attr) for squad in squads
+                  for player in members(squad)]
+        return np.array(team, dtype=int), np.array(values, dtype=float)
+
+    def total(team, values):
+        return np.bincount(team, weights=values, minlength=len(squads))
+
+    def defence(squad):
+        return squad.defenders + squad.goalkeepers
+
+    team, conceded = gather('concededPerMatch', defence)
+    _, apps = gather('appRate', defence)
+    weight = total(team, apps)
+    given = total(team, conceded)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        average = given / total(team, (conceded > 0).astype(float))
+        estimate = total(team, conceded * apps / weight[team])
+    low = np.full(len(squads), np.inf)
+    high = np.full(len(squads), -np.inf)
+    np.minimum.at(low, team, conceded)
+    np.maximum.at(high, team, conceded)
+    estimate = np.where((estimate < low) | (estimate > high) | (weight == 0),
+                        average, estimate)
+    concede_rate = np.where(given == 0, np.nan, estimate)
+
+    team, goals = gather('goalsPerMatch', lambda squad: squad.allPlayers)
+    _, apps = gather('appRate', lambda squad: squad.allPlayers)
+    scored = total(team, goals * apps)
+    goal_rate = np.where(scored == 0, np.nan, scored)
+
+    for n, squad in enumerate(squads):
+        if squad.team_name in promoted:
+            concede_rate[n], goal_rate[n] = promoted[squad.team_name]
+    return concede_rate, goal_rate
+
+
+class TeamStrength:
+    """
+    League-wide team strengths, built once per snapshot of the squads
+    and shared by every Match: each team's concede and goal rates, the
+    league average and extremes, and the home and away factors.
+
+    Lookups are by squad (or team id) into lists held here. The table
+    is tied to the squads it was built from and the rates they had
+    then, so it is rebuilt once a squad is replaced or re-rated
+    (Squad.refresh), whatever other squads are built meanwhile.
+    """
+    _last = None
+
+    def __init__(self, teams, homeAdvantage=0.05, awayDisadvantage=0.05):
+        self.teams = teams
+        self.key = _key(teams)
+        self.team_ids = list(teams)
+        self.index = {team: n for n, team in enumerate(self.team_ids)}
+        self.homeAdvantage = homeAdvantage
+        self.awayDisadvantage = awayDisadvantage
+        self.home = 1 + homeAdvantage
+        self.away = 1 - awayDisadvantage
+
+        squads = list(teams.values())
+        self.concede_rate = np.array([_rate(squad.concedeRate)
+                                      for squad in squads], dtype=float)
+        self.goal_rate = np.array([_rate(squad.goalRate)
+                                   for squad in squads], dtype=float)
+        known = self.concede_rate[~np.isnan(self.concede_rate)].tolist()
+        # summed in team order, as league.project does
+        self.avg_concede_rate = sum(known) / len(known)
+        self.max_concede_rate = max(known)
+        self.min_goal_rate = np.nanmin(self.goal_rate).item()
+        # teams with no concede rate are taken to be the league's worst
+        self.match_concede_rate = np.where(np.isnan(self.concede_rate),
+                                           self.max_concede_rate,
+                                           self.concede_rate).tolist()
+
+    @classmethod
+    def of(cls, teams, homeAdvantage=0.05, awayDisadvantage=0.05):
+        """
+        returns the table for a teams dict, reusing the last table built
+        while the same squads, with the same rates, and factors keep
+        being passed in
+        """
+        last = cls._last
+        if last is None or not _same(last.key, _key(teams)) or \
+           (last.homeAdvantage, last.awayDisadvantage) != \
+           (homeAdvantage, awayDisadvantage):
+            cls._last = cls(teams, homeAdvantage, awayDisadvantage)
+        return cls._last
+
+    def _find(self, team):
+        return self.index[getattr(team, 'name', team)]
+
+    def concede(self, team):
+        """goals a team concedes per match, the league's worst if unknown"""
+        return self.match_concede_rate[self._find(team)]
+
+
+def _rate(value):
+    return np.nan if value is None else value
+
+
+def _key(teams):
+    """what a table depends on: each team id, its squad and their rates"""
+    return [(team, squad, squad.concedeRate, squad.goalRate)
+            for team, squad in teams.items()]
+
+
+def _same(a, b):
+    """keys match: the same squads (by identity) with the same rates"""
+    return len(a) == len(b) and all(
+        x[0] == y[0] and x[1] is y[1] and x[2:] == y[2:]
+        for x, y in zip(a, b))
+
+
+if __name__ == '__main__':
+    import time
+    import synthetic
+    from match import Match
+    # the class Match shares, not this script's copy of it
+    from strength import TeamStrength
+
+    print('Testing in progress...')
+    data_dct, overview, fixtures = synthetic.league()
+    players, teams = synthetic.build(data_dct, overview, fixtures)
+
+    # all squads at once rate each squad as it rates itself
+    concede_rate, goal_rate = squad_rates(list(teams.values()))
+    for n, squad in enumerate(teams.values()):
+        assert concede_rate[n] == squad.concedeRate
+        assert goal_rate[n] == squad.goalRate
+
+    remaining = fixtures[fixtures['finished'] != True]
+    start = time.perf_counter()
+    matches = [Match(match_id, teams[row['team_h']], teams[row['team_a']],
+                     teams)
+               for match_id, row in remaining.to_dict('index').items()]
+    match_time = time.perf_counter() - start
+    table = matches[0].strength
+    assert all(match.strength is table for match in matches)
+    assert TeamStrength.of(teams) is table
+
+    # only a change to squad inputs rebuilds the table
+    squad = teams[1]
+    squad.goalkeepers[0].concededPerMatch += 1
+    squad.refresh()
+    rebuilt = TeamStrength.of(teams)
+    assert rebuilt is not table
+    assert rebuilt.concede(squad) == squad.concedeRate != table.concede(squad)
+    assert TeamStrength.of(teams) is rebuilt
+
+    # building other squads leaves the table alone
+    synthetic.build(data_dct, overview, fixtures)
+    assert TeamStrength.of(teams) is rebuilt
+    # as does changing a player without re-rating the squad, which
+    # keeps the rates the table was built from
+    squad.goalkeepers[0].concededPerMatch += 1
+    assert TeamStrength.of(teams) is rebuilt
+    assert rebuilt.concede(squad) == squad.concedeRate
+    # a squad replaced by another is a different table
+    replaced = dict(teams)
+    replaced[1] = type(squad)(squad.name, squad.allPlayers)
+    assert TeamStrength.of(replaced) is not rebuilt
+    print('{} matches built on one table in {:.2f}s'.format(len(matches),
+                                                           match_time))
+    print('Testing Complete')
@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+from team import build  # players and squads, as Start.ipynb builds them
+
+
+def league(n_teams=20, squad_size=30, finished=2, seed=0):
+    """
+    Builds a made-up season shaped like the merged FPL/PL data,
+    for self-checks and benchmarks that can't rely on the DataStore.
+
+    Returns (data_dct, overview, fixtures):
+    - data_dct -- player id: merged stats row (as allData.to_dict)
+    - overview -- seasons per player, indexed by player id
+    - fixtures -- double round robin, indexed by fixture id, with the
+                  first `finished` gameweeks already played
+    """
+    rng = np.random.default_rng(seed)
+    positions = (['GoalKeeper'] * 3 + ['Defender'] * 10 +
+                 ['Midfielder'] * 10 + ['Forward'] * 7)
+    element_types = {'GoalKeeper': 1, 'Defender': 2,
+                     'Midfielder': 3, 'Forward': 4}
+    statuses = ['a'] * 20 + ['d', 'i', 's', 'u', 'n']
+
+    data_dct = {}
+    overview = []
+    player_id = 0
+    for team in range(1, n_teams + 1):
+        for i in range(squad_size):
+            player_id += 1
+            position = positions[i % len(positions)]
+            attacking = element_types[position] / 4
+            apps = int(rng.integers(0, 39))
+            status = statuses[int(rng.integers(len(statuses)))]
+            data_dct[player_id] = {
+                'player_id.1': player_id,
+                'code': 100000 + player_id,
+                'web_name': 'Player {}'.format(player_id),
+                'team': team,
+                'Team': 'Club {}'.format(team),
+                'Position': position,
+                'element_type': element_types[position],
+                'now_cost': int(rng.integers(40, 131)),
+                'status': status,
+                'chance_of_playing_next_round': 100 if status == 'a'
+                                                else int(rng.integers(0, 4)) * 25,
+                'Appearances': apps,
+                'Goals': int(rng.poisson(apps * 0.3 * attacking)),
+                'Goals Per Match': 0,
+                'Assists': int(rng.poisson(apps * 0.2 * attacking)),
+                'Goals Conceded': int(rng.poisson(apps * 1.3)),
+                'Clean Sheets': int(rng.poisson(apps * 0.25)),
+                'Yellow Cards': int(rng.poisson(apps * 0.1)),
+                'Red Cards': int(rng.poisson(apps * 0.01)),
+                'Own Goals': int(rng.poisson(apps * 0.01))}
+            for year in range(2018 - int(rng.integers(0, 4)), 2019):
+                season_apps = int(rng.integers(0, 39))
+                overview.append({'player_id': player_id,
+                                 'Season': '{}/{}'.format(year, year + 1),
+                                 'Club': 'Club {}'.format(team),
+                                 'Apps': season_apps,
+                                 'Subs': int(rng.integers(0, season_apps + 1)),
+                                 'Goals': int(rng.poisson(season_apps * 0.1))})
+    overview = pd.DataFrame(overview).set_index('player_id')
+
+    fixtures = []
+    teams = list(range(1, n_teams + 1))
+    rounds = []
+    for _ in range(n_teams - 1):
+        rounds.append([(teams[i], teams[-1 - i]) for i in range(n_teams // 2)])
+        teams = [teams[0]] + [teams[-1]] + teams[1:-1]
+    rounds += [[(a, h) for h, a in games] for games in rounds]
+    for event, games in enumerate(rounds, 1):
+        kickoff = pd.Timestamp('2030-08-10') + pd.Timedelta(weeks=event)
+        for team_h, team_a in games:
+            fixtures.append({'id': len(fixtures) + 1,
+                             'event': event,
+                             'team_h': team_h,
+                             'team_a': team_a,
+                             'finished': event <= finished,
+                             'kickoff_time': kickoff.strftime(
+                                 '%Y-%m-%dT15:00:00Z')})
+    fixtures = pd.DataFrame(fixtures).set_index('id')
+    return data_dct, overview, fixtures
+
+
+def project(players, teams, fixtures):
+    """
+    Runs the object model over every unfinished fixture, as Start.ipynb
+    does. Returns the list of Match objects.
+    """
+    from match import Match, resolve_BPS
+
+    matches = []
+    for match_id, match in fixtures.to_dict('index').items():
+        if match['finished'] == True:
+            continue
+        team_A = teams[match['team_a']]
+        team_H = teams[match['team_h']]
+        matches.append(Match(match_id, team_H, team_A, teams))
+    for player in players:
+        player.resolve()
+        player.calculate_BPS()
+    resolve_BPS(matches)
+    return matches
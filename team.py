@@ -1,3 +1,8 @@
+import numpy as np
+from collections import defaultdict
+from strength import squad_rates
+from fixture_index import FixtureIndex
+
 
 class Squad:
 
@@ -9,8 +14,7 @@ class Squad:
         self.midfielders = self._extract_players('Midfielder')
         self.goalkeepers = self._extract_players('GoalKeeper')
         self.team_name = self._get_team_name()
-        self.concedeRate = self._calculate_concedeRate()
-        self.goalRate = self._calculate_goalRate()
+        self.concedeRate, self.goalRate = self._calculate_rates()
         
     
     def _get_team_name(self):
@@ -25,77 +29,35 @@ class Squad:
                 in self.allPlayers
                 if player == position]
 
-    
-    def _calculate_concedeRate(self):
-        # quick and dirty
-        if self.team_name == 'Wolverhampton Wanderers':
-            return 1.85
-        elif self.team_name == 'Fulham':
-            return 1.41
-        elif self.team_name == 'Cardiff City':
-            return 1.95
-
-        conceded = [d.concededPerMatch 
-                    for d 
-                    in self.defenders + self.goalkeepers]
-                    
-        apps =     [a.appRate
-                    for a 
-                    in self.defenders + self.goalkeepers]
-
-        total = sum(apps) 
-        avg = lambda: sum(conceded) / len([c for c in conceded if c > 0])
-
-        if sum(conceded) == 0:
-            return
-        elif total == 0:
-            return avg()
-
-        f = lambda a,r: r * a / total
-        estimate = sum([f(a,r) for a,r in zip(apps, conceded)])
-
-        if estimate < min(conceded) or estimate > max(conceded):
-            estimate = avg()
-
-        return estimate
-
-    def _calculate_goalRate(self):
-        lst = []
-        for player in self.allPlayers:
-            goalRate = player.goalsPerMatch
-            appRate = player.appRate
-            lst.append(goalRate * appRate)
-
-        # quick and dirty
-        if self.team_name == 'Wolverhampton Wanderers':
-            return 1.03
-        elif self.team_name == 'Fulham':
-            return 1.15
-        elif self.team_name == 'Cardiff City':
-            return 0.84
-
-        if sum(lst) == 0:
-            return
-        else:
-            return sum(lst)
-
-
-        
-        
-            
-            
-
-
-
-    
-
-    
-
-
-
-
-
-    
-
 
-    
\ No newline at end of file
+    def _calculate_rates(self):
+        concedeRate, goalRate = squad_rates([self])
+        return (None if np.isnan(concedeRate[0]) else concedeRate[0].item(),
+                None if np.isnan(goalRate[0]) else goalRate[0].item())
+
+    def refresh(self):
+        """re-rates the squad after its players' inputs have changed"""
+        self.concedeRate, self.goalRate = self._calculate_rates()
+
+
+def build(data_dct, overview, fixtures):
+    """
+    Builds players and squads from merged data, as Start.ipynb does.
+    Returns (players, teams), with teams as a dict of team id: Squad.
+    """
+    from player import Defender, Forward, Midfielder, GoalKeeper
+
+    classes = {'Defender': Defender, 'Midfielder': Midfielder,
+               'Forward': Forward, 'GoalKeeper': GoalKeeper}
+    players = []
+    index = FixtureIndex(fixtures)  # one index shared by every player
+    for player, data in data_dct.items():
+        obj = classes[data['Position']]
+        players.append(obj(data, overview.loc[[player]], index))
+
+    team_lst = defaultdict(list)
+    for player in players:
+        team_lst[player.team].append(player)
+    teams = {team: Squad(team, player_lst)
+             for team, player_lst in team_lst.items()}
+    return players, teams
@@ -0,0 +1,569 @@
+import itertools
+import time
+import numpy as np
+import pandas as pd
+from collections import namedtuple
+from squad import QUOTAS, MAX_PER_CLUB, FORMATIONS, lineup
+
+HIT = 4       # points taken for each transfer beyond the free ones
+MAX_FREE = 2  # free transfers that can be banked
+
+Plan = namedtuple('Plan', [
+    'transfers',  # per gameweek, a list of (out, in) player positions
+    'squads',     # per gameweek, the squad fielded (sorted positions)
+    'value',      # squad points over the horizon, less hits
+    'hits',       # points taken for extra transfers
+    'nodes',      # states expanded
+    'pruned',     # states dropped as dominated or bounded out
+    'complete',   # False if the time limit stopped the search early
+])
+
+
+def gameweek_points(players, field='finalPoints'):
+    """
+    projected points per gameweek from each player's matches, as a
+    dataframe of player code x event (a double gameweek sums both)
+    """
+    rows = {}
+    for player in players:
+        weeks = rows.setdefault(player.code, {})
+        for match in player.matches.values():
+            if match['finished'] == True or field not in match:
+                continue
+            weeks[match['event']] = weeks.get(match['event'], 0) + \
+                match[field]
+    return pd.DataFrame.from_dict(rows, orient='index').sort_index(axis=1) \
+             .fillna(0)
+
+
+def _ceiling(points, position, bench_weight):
+    """most any squad of these players could score, ignoring the budget"""
+    best = -np.inf
+    ranked = {element_type: np.sort(points[position == element_type])[::-1]
+              for element_type in QUOTAS}
+    for formation in FORMATIONS:
+        value = 0
+        for (element_type, q), s in zip(QUOTAS.items(), formation):
+            top = ranked[element_type][:q]
+            value += top[:s].sum() + bench_weight * top[s:].sum()
+        best = max(best, value)
+    return best
+
+
+def _candidates(total, cost, position, squad, bank, swaps, candidates):
+    """
+    players outside the squad worth considering, up to `candidates`
+    per position: first the best by points at each price the squad
+    could pay for one of the position (the bank plus a squad player's
+    cost), then the best of the rest that any plan could afford. A
+    player is affordable if their cost is within the bank plus the
+    dearest squad player of their position, plus the most that
+    selling other squad players for the cheapest of their positions
+    could raise over `swaps` transfers.
+    """
+    squad = np.asarray(squad)
+    outside = np.setdiff1d(np.arange(len(total)), squad)
+    cheapest = {element_type: cost[outside][position[outside] ==
+                                            element_type].min(initial=0)
+                for element_type in QUOTAS}
+    raised = np.maximum(0, cost[squad] - np.array(
+        [cheapest[element_type] for element_type in position[squad]]))
+    raised = -np.sort(-raised)
+    chosen = []
+    for element_type in QUOTAS:
+        prices = bank + cost[squad][position[squad] == element_type]
+        limit = prices.max(initial=bank) + raised[:max(0, swaps - 1)].sum()
+        others = outside[(position[outside] == element_type) &
+                         (cost[outside] <= limit)]
+        # best first, so the first within a price is the best at it
+        others = others[np.argsort(-total[others], kind='stable')]
+        firsts = np.concatenate([others[cost[others] <= price][:1]
+                                 for price in prices] + [[]]).astype(int)
+        firsts = firsts[np.argsort(-total[firsts], kind='stable')]
+        ordered = dict.fromkeys(firsts.tolist() + others.tolist())
+        chosen.extend(list(ordered)[:candidates])
+    return chosen
+
+
+class _Planner:
+    """
+    The search's view of the candidate pool. Squads are boolean masks
+    over the pool, worked on many at a time: a squad's children all
+    come out of expand together, and evaluate scores a batch of
+    squads in each gameweek at once.
+    """
+
+    def __init__(self, points, cost, position, club, max_transfers,
+                 bench_weight):
+        self.weekly = np.ascontiguousarray(points.T)
+        self.cost = cost
+        self.max_transfers = max_transfers
+        self.bench_weight = bench_weight
+        self.groups = {element_type: np.flatnonzero(position == element_type)
+                       for element_type in QUOTAS}
+        self.starts = {element_type: sorted({formation[i]
+                                             for formation in FORMATIONS})
+                       for i, element_type in enumerate(QUOTAS)}
+        self.clubs = (club[:, None] == np.unique(club)[None, :]).astype(int)
+        self.ceilings = np.array([_ceiling(points[:, w], position,
+                                           bench_weight)
+                                  for w in range(points.shape[1])])
+        self.slots = self._slots()
+        self.children = {}
+        self.scores = {}
+
+    def _slots(self):
+        """
+        every set of up to max_transfers swaps, the same for any squad
+        when players are numbered by slot: a squad's players in order
+        of position and pool, and likewise the players outside it.
+        Returns (out slots, in slots), one row per set, -1 padded.
+        """
+        singles = []
+        inside = outside = 0
+        for element_type, members in self.groups.items():
+            q = QUOTAS[element_type]
+            singles.extend((inside + a, outside + b) for a in range(q)
+                           for b in range(len(members) - q))
+            inside += q
+            outside += len(members) - q
+        m = self.max_transfers
+        rows = [[(-1, -1)] * m]
+        for n in range(1, m + 1):
+            for swaps in itertools.combinations(singles, n):
+                if len({a for a, _ in swaps}) == n and \
+                   len({b for _, b in swaps}) == n:
+                    rows.append(list(swaps) + [(-1, -1)] * (m - n))
+        rows = np.array(rows, dtype=int).reshape(-1, m, 2)
+        return rows[..., 0], rows[..., 1]
+
+    def evaluate(self, masks):
+        """
+        Returns (values, gains) for each squad: points of its best XI
+        per gameweek (squads x gameweeks), and the most that k swaps
+        could add (squads x gameweeks x k). Swapping a for b adds at
+        most b's points less a's, so each position's best players
+        outside are paired with its worst inside and the largest gains
+        added up.
+        """
+        parts = {}
+        gains = []
+        for element_type, members in self.groups.items():
+            q = QUOTAS[element_type]
+            inside = masks[:, members]
+            # every squad holds exactly q of the position, so the players
+            # inside (and outside) line up into whole rows
+            ins = members[np.nonzero(inside)[1].reshape(len(masks), q)]
+            outs = members[np.nonzero(~inside)[1].reshape(len(masks), -1)]
+            # points, best first, as gameweeks x squads x players
+            ins = -np.sort(-self.weekly[:, ins], axis=2)
+            outs = -np.sort(-self.weekly[:, outs], axis=2)
+            top = np.cumsum(ins, axis=2)
+            for s in self.starts[element_type]:
+                parts[element_type, s] = top[..., s - 1] + \
+                    self.bench_weight * (top[..., -1] - top[..., s - 1])
+            k = min(ins.shape[2], outs.shape[2])
+            gains.append(np.maximum(0, outs[..., :k] - ins[..., ::-1][..., :k]))
+        values = np.max([sum(parts[element_type, s] for element_type, s
+                             in zip(QUOTAS, formation))
+                         for formation in FORMATIONS], axis=0)
+        gains = -np.sort(-np.concatenate(gains, axis=2), axis=2)
+        gains = np.concatenate([np.zeros(gains.shape[:2] + (1,)),
+                                np.cumsum(gains, axis=2)], axis=2)
+        return values.T, gains.transpose(1, 0, 2)
+
+    def expand(self, key, mask):
+        """
+        every set of up to max_transfers swaps from a squad that keeps
+        the club limit, the first being no transfer at all.
+        Returns a dict of arrays, one row per child: outs and ins
+        (positions swapped, -1 padded), n (swaps), delta (cost of the
+        players brought in less those sold) and masks.
+        """
+        if key in self.children:
+            return self.children[key]
+        inside = np.concatenate([members[mask[members]]
+                                 for members in self.groups.values()])
+        outside = np.concatenate([members[~mask[members]]
+                                  for members in self.groups.values()])
+        outs = np.where(self.slots[0] >= 0, inside[self.slots[0]], -1)
+        ins = np.where(self.slots[1] >= 0, outside[self.slots[1]], -1)
+
+        swapped = outs >= 0
+        rows = np.nonzero(swapped)[0]
+        masks = np.repeat(mask[None, :], len(outs), axis=0)
+        masks[rows, outs[swapped]] = False
+        masks[rows, ins[swapped]] = True
+        keep = (masks @ self.clubs).max(axis=1) <= MAX_PER_CLUB
+        masks, outs, ins, swapped = (masks[keep], outs[keep], ins[keep],
+                                     swapped[keep])
+        delta = np.where(swapped, self.cost[ins] - self.cost[outs], 0) \
+                  .sum(axis=1)
+        self.children[key] = {'outs': outs, 'ins': ins,
+                              'n': swapped.sum(axis=1), 'delta': delta,
+                              'masks': masks}
+        return self.children[key]
+
+    def lookup(self, masks):
+        """evaluate for squads, memoised by squad; returns (values, gains)"""
+        keys = [mask.tobytes() for mask in masks]
+        missing = [i for i, key in enumerate(keys) if key not in self.scores]
+        if missing:
+            values, gains = self.evaluate(masks[missing])
+            for j, i in enumerate(missing):
+                self.scores[keys[i]] = (values[j], gains[j])
+        return (np.array([self.scores[key][0] for key in keys]),
+                np.array([self.scores[key][1] for key in keys]))
+
+    def forget(self, live):
+        """drops what's memoised for squads no longer in the search"""
+        for memo in [self.children, self.scores]:
+            for key in list(memo):
+                if key not in live:
+                    del memo[key]
+
+    def reach(self, values, gains, w):
+        """
+        most any child of one squad (values and gains as evaluate
+        gives them for that squad) could score from gameweek w on,
+        before hits in gameweek w, by the swaps n it makes in w and
+        the free transfers it carries into the next: a table indexed
+        [n, free]. Every squad within k swaps of a child is within
+        n + k of its parent, so the parent's gains bound them all.
+        """
+        most = gains.shape[1] - 1
+        table = np.full((self.max_transfers + 1, MAX_FREE + 1), -np.inf)
+        for n in range(self.max_transfers + 1):
+            now = min(self.ceilings[w], values[w] + gains[w, min(n, most)])
+            for free in range(1, MAX_FREE + 1):
+                table[n, free] = now + self._later(
+                    lambda later, swaps: values[later] +
+                    gains[later, np.minimum(n + swaps, most)], w, free)
+        return table
+
+    def _later(self, score, w, free):
+        """
+        most a squad could score after gameweek w, starting the next
+        with `free` free transfers, given score(gameweek, swaps) bounds
+        a gameweek's points within that many swaps: with T swaps in
+        all, at most min(T, max_transfers a week) have been made by
+        any later gameweek, and all but the free ones cost a hit
+        """
+        remaining = len(self.ceilings) - w - 1
+        if remaining == 0:
+            return 0
+        T = np.arange(remaining * self.max_transfers + 1)
+        total = -HIT * np.maximum(0, T - (free + remaining - 1))
+        for j in range(1, remaining + 1):
+            total = total + np.minimum(
+                self.ceilings[w + j],
+                score(w + j, np.minimum(T, j * self.max_transfers)))
+        return total.max(axis=-1)
+
+    def bound(self, values, gains, w, free):
+        """most each squad could still score after gameweek w"""
+        most = gains.shape[2] - 1
+        return self._later(lambda later, swaps:
+                           values[:, later, None] +
+                           gains[:, later, np.minimum(swaps, most)], w, free)
+
+
+def plan_transfers(points, cost, position, club, squad, bank=0,
+                   free_transfers=1, max_transfers=2, candidates=4,
+                   bench_weight=0.1, time_limit=10.0):
+    """
+    Finds the transfers over the next few gameweeks that score the
+    most projected points, less hits, among a pool of candidates: the
+    current squad and, per position, a few players outside it that
+    could be afforded (see _candidates). The plan is the best over
+    that pool, not over every player.
+
+    Input (one entry or row per player):
+    - points -- projected points, players x gameweeks (3 to 6 columns
+                suit the search)
+    - cost, position, club -- now_cost, element_type and team
+    - squad -- positions of the current 15 players
+    - bank -- money in hand, in the same units as cost
+    - free_transfers -- free transfers for the first gameweek
+    - max_transfers -- most transfers to consider in one gameweek
+    - candidates -- players outside the squad considered per position,
+                    the best by points over the horizon at prices
+                    from the cheapest to the dearest affordable
+    - time_limit -- seconds before the search stops with the best
+                    plan found so far
+
+    Each gameweek brings one free transfer, and up to MAX_FREE unused
+    ones are banked. Transfers beyond those cost HIT points. Players
+    are sold for their cost. A squad scores its best starting XI plus
+    bench_weight times its bench, as in squad.lineup.
+
+    The search runs forward a gameweek at a time over states (squad,
+    bank, free transfers). A state is dropped when another with the
+    same squad has at least its points, bank and free transfers, or
+    when its bound (the most it could still score) can't beat the
+    best plan found, each state offering one by keeping its squad to
+    the end. Children are first bounded from their parent's figures,
+    and only the hopeful ones evaluated. Each squad's children and
+    figures are memoised while the squad is in the search.
+    """
+    points = np.asarray(points, dtype=float)
+    cost = np.asarray(cost, dtype=int)
+    position = np.asarray(position)
+    club = np.asarray(club)
+    horizon = points.shape[1]
+    start = time.perf_counter()
+    eps = 1e-9
+
+    # the candidate pool: the current squad and what it could afford
+    pool = set(squad)
+    pool.update(_candidates(points.sum(axis=1), cost, position, squad, bank,
+                            max_transfers * horizon, candidates))
+    pool = np.array(sorted(pool))
+    planner = _Planner(points[pool], cost[pool], position[pool],
+                       club[pool], max_transfers, bench_weight)
+
+    mask = np.isin(pool, squad)
+    # states by squad: (mask, [(value, bank, free transfers, hits,
+    # history of swaps per gameweek, bound)])
+    states = {mask.tobytes(): (mask, [(0.0, bank, free_transfers, 0, (),
+                                       np.inf)])}
+    incumbent = (planner.lookup(mask[None, :])[0].sum(), 0, ())
+    nodes = pruned = 0
+    complete = True
+
+    for w in range(horizon):
+        layer = {}
+        for key, (mask, entries) in states.items():
+            if time.perf_counter() - start > time_limit:
+                complete = False
+                break
+            children = planner.expand(key, mask)
+            n = children['n']
+            reach = planner.reach(*planner.scores[key], w)
+            for value, money, free, hits, history, _ in entries:
+                nodes += 1
+                hit = HIT * np.maximum(0, n - free)
+                new_free = np.where(n <= free,
+                                    np.minimum(MAX_FREE, free - n + 1), 1)
+                affordable = children['delta'] <= money
+                # children the parent's gains already bound out aren't
+                # worth evaluating
+                hopeful = affordable & (value - hit + reach[n, new_free] >
+                                        incumbent[0] + eps)
+                pruned += int(affordable.sum() - hopeful.sum())
+                hopeful = np.flatnonzero(hopeful)
+                if len(hopeful) == 0:
+                    continue
+                values, gains = planner.lookup(children['masks'][hopeful])
+
+                # keeping each child's squad to the end is a whole plan
+                plans = value - hit[hopeful] + values[:, w:].sum(axis=1)
+                best = int(np.argmax(plans))
+                if plans[best] > incumbent[0] + eps:
+                    c = hopeful[best]
+                    incumbent = (plans[best], hits + int(hit[c]),
+                                 history + (_swaps(children, c),))
+                new_value = value - hit[hopeful] + values[:, w]
+                bounds = [planner.bound(values, gains, w, f)
+                          for f in range(1, MAX_FREE + 1)]
+                bound = new_value + np.choose(new_free[hopeful] - 1, bounds)
+                alive = bound > incumbent[0] + eps
+                pruned += int(len(alive) - alive.sum())
+
+                for i in np.flatnonzero(alive):
+                    c = hopeful[i]
+                    entry = (new_value[i], money - int(children['delta'][c]),
+                             int(new_free[c]), hits + int(hit[c]),
+                             history + (_swaps(children, c),), bound[i])
+                    child = children['masks'][c]
+                    kept = layer.setdefault(child.tobytes(), (child, []))[1]
+                    if any(other[0] >= entry[0] and other[1] >= entry[1] and
+                           other[2] >= entry[2] for other in kept):
+                        pruned += 1
+                        continue
+                    before = len(kept)
+                    kept[:] = [other for other in kept
+                               if not (entry[0] >= other[0] and
+                                       entry[1] >= other[1] and
+                                       entry[2] >= other[2])]
+                    pruned += before - len(kept)
+                    kept.append(entry)
+        if not complete:
+            break
+        # drop states the improved incumbent now bounds out
+        states = {}
+        for key, (mask, entries) in layer.items():
+            kept = [entry for entry in entries
+                    if entry[5] > incumbent[0] + eps]
+            pruned += len(entries) - len(kept)
+            if kept:
+                states[key] = (mask, kept)
+        planner.forget(states)
+
+    value, hits, history = incumbent
+    transfers = [[(int(pool[out]), int(pool[new])) for out, new in swaps]
+                 for swaps in history]
+    transfers += [[] for _ in range(horizon - len(transfers))]
+    squads = []
+    current = set(squad)
+    for swaps in transfers:
+        current = (current - {out for out, _ in swaps}) | \
+                  {new for _, new in swaps}
+        squads.append(sorted(current))
+    return Plan(transfers=transfers, squads=squads, value=value, hits=hits,
+                nodes=nodes, pruned=pruned, complete=complete)
+
+
+def _swaps(children, c):
+    """the (out, in) pairs of one child"""
+    return tuple((int(out), int(new))
+                 for out, new in zip(children['outs'][c], children['ins'][c])
+                 if out >= 0)
+
+
+def plan(df, squad, points, bank=0, free_transfers=1, **kwargs):
+    """
+    plan_transfers for dataframes: df has now_cost, element_type and
+    team columns, points is player x gameweek (as gameweek_points
+    returns) and squad a list of index labels of df.
+    Returns (Plan, dataframe of transfers by gameweek)
+    """
+    points = points.reindex(df.index).fillna(0)
+    index = {label: i for i, label in enumerate(df.index)}
+    result = plan_transfers(points.values, df['now_cost'],
+                            df['element_type'], df['team'],
+                            [index[label] for label in squad], bank,
+                            free_transfers, **kwargs)
+    rows = [{'event': event, 'out': df.index[out], 'in': df.index[new]}
+            for event, swaps in zip(points.columns, result.transfers)
+            for out, new in swaps]
+    return result, pd.DataFrame(rows, columns=['event', 'out', 'in'])
+
+
+if __name__ == '__main__':
+    import synthetic
+    from squad import pick
+
+    def exhaustive(points, cost, position, club, squad, bank, free,
+                   max_transfers, bench_weight=0.1):
+        """best plan value by trying every sequence of transfers"""
+        players = range(len(points))
+        memo = {}
+
+        def moves(squad):
+            singles = [(out, new) for out in squad for new in players
+                       if new not in squad and position[new] == position[out]]
+            yield (), squad, 0
+            for n in range(1, max_transfers + 1):
+                for swaps in itertools.combinations(singles, n):
+                    outs = {out for out, _ in swaps}
+                    ins = {new for _, new in swaps}
+                    if len(outs) < n or len(ins) < n:
+                        continue
+                    new_squad = tuple(sorted((set(squad) - outs) | ins))
+                    if np.bincount(club[list(new_squad)]).max() > \
+                       MAX_PER_CLUB:
+                        continue
+                    yield swaps, new_squad, cost[list(ins)].sum() - \
+                        cost[list(outs)].sum()
+
+        def best(w, squad, money, free):
+            if w == points.shape[1]:
+                return 0
+            if (w, squad, money, free) not in memo:
+                result = -np.inf
+                for swaps, new_squad, delta in moves(squad):
+                    if delta > money:
+                        continue
+                    n = len(swaps)
+                    result = max(result,
+                                 lineup(points[:, w], position, new_squad,
+                                        bench_weight)[0] -
+                                 HIT * max(0, n - free) +
+                                 best(w + 1, new_squad, money - delta,
+                                      min(MAX_FREE, free - n + 1)
+                                      if n <= free else 1))
+                memo[w, squad, money, free] = result
+            return memo[w, squad, money, free]
+        return best(0, tuple(sorted(squad)), bank, free)
+
+    print('Testing in progress...')
+    rng = np.random.default_rng(0)
+    checked = 0
+    for trial in range(12):
+        # a squad plus one or two players outside it per position
+        sizes = {1: 2, 2: 6, 3: 6, 4: 4}
+        position = np.repeat(list(sizes), list(sizes.values()))
+        n = len(position)
+        points = np.round(rng.gamma(2, 2, (n, 3)), 1)
+        cost = rng.integers(40, 90, n)
+        squad = np.concatenate([np.flatnonzero(position == element_type)[:q]
+                                for element_type, q in QUOTAS.items()])
+        club = rng.integers(0, 7, n)
+        while np.bincount(club[squad]).max() > MAX_PER_CLUB:
+            club = rng.integers(0, 7, n)
+        bank = int(rng.integers(0, 30))
+        free = int(rng.integers(1, 3))
+        result = plan_transfers(points, cost, position, club, squad, bank,
+                                free, max_transfers=2, candidates=2)
+        expected = exhaustive(points, cost, position, club, squad, bank,
+                              free, 2)
+        assert result.complete
+        assert np.isclose(result.value, expected), (trial, result, expected)
+        value = -result.hits
+        for w, squad_w in enumerate(result.squads):
+            assert np.bincount(club[squad_w]).max() <= MAX_PER_CLUB
+            value += lineup(points[:, w], position, squad_w)[0]
+        assert np.isclose(value, result.value)
+        checked += 1
+    print('{} small plans match exhaustive search'.format(checked))
+
+    # the best players outside the squad cost more than it could ever
+    # raise, but a cheaper one still improves it
+    sizes = {1: 2, 2: 5 + 6, 3: 5, 4: 3}
+    position = np.repeat(list(sizes), list(sizes.values()))
+    squad = np.concatenate([np.flatnonzero(position == element_type)[:q]
+                            for element_type, q in QUOTAS.items()])
+    points = np.ones((len(position), 3))
+    cost = np.full(len(position), 45)
+    dear = np.flatnonzero(position == 2)[5:10]
+    cheap = np.flatnonzero(position == 2)[10]
+    points[dear], cost[dear] = 5, 200
+    points[cheap], cost[cheap] = 3, 45
+    club = np.arange(len(position)) % 8
+    result = plan_transfers(points, cost, position, club, squad, bank=0,
+                            free_transfers=1, max_transfers=1, candidates=4)
+    assert any(new == cheap for new in
+               (new for swaps in result.transfers for _, new in swaps)), \
+        result
+    assert _candidates(points.sum(axis=1), cost, position, squad, 0, 3,
+                       4).count(cheap) == 1
+
+    data_dct, overview, fixtures = synthetic.league()
+    players, teams = synthetic.build(data_dct, overview, fixtures)
+    synthetic.project(players, teams, fixtures)
+    weeks = gameweek_points(players)
+    df = pd.DataFrame([{'code': player.code, 'now_cost': player.now_cost,
+                        'element_type': player.element_type,
+                        'team': player.team} for player in players]) \
+           .set_index('code')
+    df['points'] = weeks.iloc[:, 0]
+    current = pick(df, budget=1000).index
+
+    for horizon in [3, 4, 5, 6]:
+        start = time.perf_counter()
+        result, moves = plan(df, current, weeks.iloc[:, :horizon],
+                             bank=5, free_transfers=1)
+        elapsed = time.perf_counter() - start
+        hold = sum(lineup(weeks.iloc[:, w].reindex(df.index).values,
+                          df['element_type'].values,
+                          [df.index.get_loc(code) for code in current])[0]
+                   for w in range(horizon))
+        assert result.value >= hold - 1e-9
+        print('{} gameweeks: {:.1f} points (hold {:.1f}), {} transfers, '
+              '{} hits, {} nodes, {} pruned, {:.2f}s{}'.format(
+                  horizon, result.value, hold, len(moves), result.hits,
+                  result.nodes, result.pruned, elapsed,
+                  '' if result.complete else ' (time limit)'))
+    print(moves)
+    print('Testing Complete')